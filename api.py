@@ -0,0 +1,272 @@
+"""Async JSON API for logging trips and reading stats outside the Streamlit pages.
+
+Mobile clients and kiosks call it directly instead of rerunning a page
+script per interaction:
+
+    python api.py [--host 0.0.0.0] [--port 8080] [--workers 4]
+
+    POST /api/users                            {"username"}
+    GET  /api/users/{user_id}
+    POST /api/users/{user_id}/activities       {"activity_type", "details"}
+    GET  /api/users/{user_id}/summary
+    GET  /api/users/{user_id}/bus-rides
+    POST /api/users/{user_id}/bus-rides        {"route_name"}
+    GET  /api/bus-routes
+    GET  /api/leaderboard?limit=10
+
+Requests run on an asyncio event loop against an async engine over the
+same DATABASE_URL and tables as the app (asyncpg for PostgreSQL,
+aiosqlite for SQLite), with a connection pool sized like the app's. Each
+request is one unit of work: its services call runs through
+AsyncSession.run_sync and commits once, so scoring, points, rollups and
+achievements behave exactly as on the pages. Errors come back as
+{"error": message} with a 400 or 404 status.
+"""
+import argparse
+import json
+import multiprocessing
+from datetime import date, datetime
+from functools import partial
+
+from aiohttp import web
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+import leaderboard
+import services
+from map_data import get_bus_routes
+from models import (
+    DATABASE_URL,
+    MAX_OVERFLOW,
+    POOL_RECYCLE,
+    POOL_SIZE,
+    POOL_TIMEOUT,
+    User,
+    bootstrap_schema,
+    configure_sqlite,
+    sqlite_connect_args
+)
+from telemetry import TimeSeriesStore, start_grid_telemetry
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+MAX_LEADERBOARD_LIMIT = 100
+
+ENGINE = web.AppKey('engine', AsyncEngine)
+SESSIONS = web.AppKey('sessions', async_sessionmaker)
+ROUTES = web.AppKey('routes', dict)
+TELEMETRY = web.AppKey('telemetry', TimeSeriesStore)
+
+def _json_default(value):
+    # Dates and datetimes go out as ISO 8601 strings
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+_dumps = partial(json.dumps, default=_json_default)
+
+def async_database_url(database_url: str):
+    """The same database addressed through its asyncio driver."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend!r} databases")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    # asyncpg takes ssl= where libpq takes sslmode=
+    if 'sslmode' in url.query:
+        url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': url.query['sslmode']})
+    return url
+
+def create_engine_for(database_url: str) -> AsyncEngine:
+    url = async_database_url(database_url)
+    if url.database in (None, '', ':memory:'):
+        # An in-memory SQLite database exists per connection, so it cannot be pooled
+        return create_async_engine(url)
+    is_sqlite = url.get_backend_name() == 'sqlite'
+    engine = create_async_engine(
+        url,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_pre_ping=not is_sqlite,
+        pool_recycle=POOL_RECYCLE,
+        connect_args=sqlite_connect_args() if is_sqlite else {}
+    )
+    # The same WAL journaling and pragmas as the app's engine
+    configure_sqlite(engine.sync_engine)
+    return engine
+
+async def run(request: web.Request, work):
+    """Run work(db) on a pooled session and commit; a failure rolls everything back."""
+    async with request.app[SESSIONS]() as session:
+        result = await session.run_sync(work)
+        await session.commit()
+    return result
+
+def respond(data, status: int = 200) -> web.Response:
+    return web.json_response(data, status=status, dumps=_dumps)
+
+async def read_body(request: web.Request, *fields) -> dict:
+    body = await request.json()  # malformed JSON raises a ValueError, answered with a 400
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    missing = [field for field in fields if field not in body]
+    if missing:
+        raise ValueError(f"Missing field(s): {', '.join(missing)}")
+    return body
+
+def require_user(db, user_id: int):
+    # A primary-key probe rather than loading the whole User row
+    if db.execute(select(User.id).where(User.id == user_id)).first() is None:
+        raise web.HTTPNotFound(reason=f"No user with id {user_id}")
+
+@web.middleware
+async def json_errors(request: web.Request, handler):
+    try:
+        return await handler(request)
+    except web.HTTPException as e:
+        if e.status < 400:
+            raise
+        return respond({'error': e.reason}, e.status)
+    except ValueError as e:
+        return respond({'error': str(e)}, 400)
+
+async def create_user(request: web.Request):
+    body = await read_body(request, 'username')
+    username = str(body['username']).strip()
+    if not username:
+        raise ValueError("username must not be empty")
+
+    def work(db):
+        user = services.get_or_create_user(db, username)
+        return {'id': user.id, 'username': user.username, 'points': user.points or 0}
+    return respond(await run(request, work))
+
+async def get_user(request: web.Request):
+    user_id = int(request.match_info['user_id'])
+
+    def work(db):
+        require_user(db, user_id)
+        return dict(services.fetch_user_profile(db, user_id), id=user_id, rank=services.fetch_rank(db, user_id))
+    return respond(await run(request, work))
+
+async def log_activity(request: web.Request):
+    user_id = int(request.match_info['user_id'])
+    body = await read_body(request, 'activity_type', 'details')
+    logged_at = datetime.now()
+    # Energy is scored at the grid's measured intensity for the hour it is logged in
+    series = request.app[TELEMETRY].intensity_series() if body['activity_type'] == 'energy' else None
+    emissions, points = services.score_activity(body['activity_type'], body['details'], logged_at, series)
+
+    def work(db):
+        require_user(db, user_id)
+        new_points, unlocked = services.record_activity(
+            db, user_id, body['activity_type'], body['details'], emissions, points, logged_at
+        )
+        return {'emissions': emissions, 'points_earned': points, 'points': new_points, 'achievements': unlocked}
+    return respond(await run(request, work), 201)
+
+async def get_summary(request: web.Request):
+    user_id = int(request.match_info['user_id'])
+
+    def work(db):
+        require_user(db, user_id)
+        return services.fetch_emissions_summary(db, user_id)
+    return respond(await run(request, work))
+
+async def list_bus_rides(request: web.Request):
+    user_id = int(request.match_info['user_id'])
+
+    def work(db):
+        require_user(db, user_id)
+        return services.fetch_bus_rides(db, user_id)
+    return respond(await run(request, work))
+
+async def log_bus_ride(request: web.Request):
+    user_id = int(request.match_info['user_id'])
+    body = await read_body(request, 'route_name')
+    route = request.app[ROUTES].get(body['route_name'])
+    if route is None:
+        raise web.HTTPNotFound(reason=f"No bus route named {body['route_name']!r}")
+
+    def work(db):
+        require_user(db, user_id)
+        new_points = services.record_bus_ride(db, user_id, route['name'], route['distance'], route['points_per_ride'])
+        return {'route_name': route['name'], 'distance': route['distance'],
+                'points_earned': route['points_per_ride'], 'points': new_points}
+    return respond(await run(request, work), 201)
+
+async def list_bus_routes(request: web.Request):
+    return respond([
+        {'name': route['name'], 'distance': route['distance'], 'points_per_ride': route['points_per_ride']}
+        for route in request.app[ROUTES].values()
+    ])
+
+async def get_leaderboard(request: web.Request):
+    limit = int(request.query.get('limit', leaderboard.LEADERBOARD_SIZE))
+    if not 1 <= limit <= MAX_LEADERBOARD_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LEADERBOARD_LIMIT}")
+    return respond(await run(request, lambda db: services.fetch_leaderboard(db, limit)))
+
+def create_app(database_url: str = None) -> web.Application:
+    """The API application.
+
+    On startup the engine is created, the schema bootstrapped and a grid
+    telemetry sampler started; on cleanup they are stopped and disposed.
+    """
+    app = web.Application(middlewares=[json_errors])
+
+    async def database(app):
+        engine = create_engine_for(database_url or DATABASE_URL)
+        async with engine.begin() as connection:
+            await connection.run_sync(bootstrap_schema)
+        app[ENGINE] = engine
+        app[SESSIONS] = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+        # Route geometry is fixed for the life of the process, so look it up once
+        app[ROUTES] = {route['name']: route for route in get_bus_routes()}
+        app[TELEMETRY], sampler = start_grid_telemetry()
+        yield
+        sampler.stop()
+        await engine.dispose()
+    app.cleanup_ctx.append(database)
+
+    app.router.add_post('/api/users', create_user)
+    app.router.add_get(r'/api/users/{user_id:\d+}', get_user)
+    app.router.add_post(r'/api/users/{user_id:\d+}/activities', log_activity)
+    app.router.add_get(r'/api/users/{user_id:\d+}/summary', get_summary)
+    app.router.add_get(r'/api/users/{user_id:\d+}/bus-rides', list_bus_rides)
+    app.router.add_post(r'/api/users/{user_id:\d+}/bus-rides', log_bus_ride)
+    app.router.add_get('/api/bus-routes', list_bus_routes)
+    app.router.add_get('/api/leaderboard', get_leaderboard)
+    return app
+
+def serve(host: str, port: int, reuse_port: bool = False):
+    web.run_app(create_app(), host=host, port=port, reuse_port=reuse_port)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the carbon tracker's JSON API.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="server processes sharing the port; one event loop per core")
+    args = parser.parse_args()
+    if args.workers == 1:
+        serve(args.host, args.port)
+        return
+
+    # Bootstrap before forking, so the workers do not race to create tables
+    bootstrap_schema()
+    # Each worker has its own event loop, connection pool and leaderboard
+    # cache (kept fresh across workers by its TTL); the kernel spreads
+    # connections between them
+    workers = [
+        multiprocessing.Process(target=serve, args=(args.host, args.port, True))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,37 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 from datetime import datetime
-import base64
 
+# Page code imports pandas, plotly, folium and the telemetry, forecast,
+# map and trace modules where it uses them, so a session only loads the
+# libraries of the pages it opens
 from carbon_calculator import (
     calculate_transport_emissions,
     calculate_food_emissions,
-    calculate_energy_emissions
+    calculate_energy_emissions,
+    intensity_from_renewable_share,
+    HAWAII_ENERGY_FACTOR
 )
 from data_manager import (
     initialize_session_state,
-    add_activity,
+    log_activity,
     get_emissions_summary,
+    get_daily_emissions,
+    get_category_breakdown,
     get_leaderboard_data,
+    get_user_rank,
     update_user_points,
     get_user_achievements,
-    add_achievement,
     get_user_profile,
+    get_profile_picture,
     update_user_profile,
     get_user_bus_rides,
-    add_bus_ride
+    add_bus_ride,
+    record_detected_rides
 )
-from gamification import award_points
+from gamification import ACHIEVEMENT_RULES, LOW_ENERGY_KWH, METRIC_LABELS, award_points
+from profile_pictures import picture_ref
 from hawaii_data import get_sustainability_tips, get_tourist_recommendations
 from energy_data import get_real_time_energy_data, get_local_activities
-from map_data import create_oahu_map, get_store_locations, get_bus_routes
-import streamlit.components.v1 as components
 
 def set_page_style(page_name):
     """Set page-specific styling."""
@@ -67,15 +72,18 @@ def show_profile():
 
     with col1:
         if profile['profile_picture']:
-            st.image(profile['profile_picture'], caption="Profile Picture")
+            st.image(get_profile_picture(profile['profile_picture'], 'large'), caption="Profile Picture")
         uploaded_file = st.file_uploader("Upload Profile Picture", type=['png', 'jpg', 'jpeg'])
-        if uploaded_file:
-            # Convert the uploaded file to base64
-            bytes_data = uploaded_file.getvalue()
-            base64_image = base64.b64encode(bytes_data).decode()
-            update_user_profile(profile_picture=f"data:image/jpeg;base64,{base64_image}")
-            st.success("Profile picture updated!")
-            st.rerun()
+        # The uploader keeps its file across reruns, so only store a new picture once
+        if uploaded_file and picture_ref(uploaded_file.getvalue()) != profile['profile_picture']:
+            # Stored as fixed-size thumbnails, referenced from the user by hash
+            try:
+                update_user_profile(profile_picture=uploaded_file.getvalue())
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.success("Profile picture updated!")
+                st.rerun()
 
     with col2:
         display_name = st.text_input("Display Name", value=profile['display_name'])
@@ -93,20 +101,24 @@ def show_profile():
         ride_data = []
         for ride in rides:
             ride_data.append({
-                'Date': ride.date.strftime('%Y-%m-%d %H:%M'),
-                'Route': ride.route_name,
-                'Distance (miles)': ride.distance,
-                'Points Earned': ride.points_earned
+                'Date': ride['date'].strftime('%Y-%m-%d %H:%M'),
+                'Route': ride['route_name'],
+                'Distance (miles)': ride['distance'],
+                'Points Earned': ride['points_earned']
             })
 
-        df = pd.DataFrame(ride_data)
-        st.dataframe(df)
+        st.dataframe(ride_data)
     else:
         st.info("No bus rides recorded yet. Try taking TheBus to earn points!")
 
+def announce_achievements(names):
+    for name in names:
+        st.success(f"New Achievement Unlocked: {name}!")
+
 def show_achievements():
     st.header("🏆 Your Achievements")
 
+    # Unlocks are persisted as they happen, so this is a lookup, not a re-evaluation
     achievements = get_user_achievements()
     points = st.session_state.points
 
@@ -117,42 +129,36 @@ def show_achievements():
         </div>
     """, unsafe_allow_html=True)
 
-    # Define all possible achievements
-    all_achievements = {
-        'Eco Warrior': {'points': 1000, 'icon': '🌍', 'description': 'Earned 1000+ points through eco-friendly choices'},
-        'Carbon Crusher': {'points': 500, 'icon': '💪', 'description': 'Reached 500 points in carbon reduction'},
-        'Green Starter': {'points': 100, 'icon': '🌱', 'description': 'Started your journey with 100 points'},
-        'Green Commuter': {'icon': '🚲', 'description': 'Chose eco-friendly transportation'},
-        'Plant-Based Pioneer': {'icon': '🥗', 'description': 'Made sustainable food choices'},
-        'Energy Saver': {'icon': '⚡', 'description': 'Demonstrated energy conservation'}
-    }
-
     # Create two columns for achievements display
     col1, col2 = st.columns(2)
 
     # Display achievements in a grid
-    for i, (name, details) in enumerate(all_achievements.items()):
+    for i, rule in enumerate(ACHIEVEMENT_RULES):
         with col1 if i % 2 == 0 else col2:
-            is_earned = name in achievements
-            if 'points' in details:
-                is_earned = points >= details['points']
+            is_earned = rule['name'] in achievements
             status = "🔓 Unlocked" if is_earned else "🔒 Locked"
-            if 'points' in details and not is_earned:
-                status += f" (Requires {details['points']} points)"
+            if not is_earned:
+                status += f" (Requires {rule['threshold']} {METRIC_LABELS[rule['metric']]})"
 
             st.markdown(f"""
                 <div class='achievement-card' style='opacity: {"1" if is_earned else "0.6"}'>
-                    <h3>{details['icon']} {name}</h3>
-                    <p>{details['description']}</p>
+                    <h3>{rule['icon']} {rule['name']}</h3>
+                    <p>{rule['description']}</p>
                     <p><small>{status}</small></p>
                 </div>
             """, unsafe_allow_html=True)
 
 def show_energy_insights():
+    import pandas as pd
+    import plotly.express as px
+    from energy_forecast import cleanest_windows, get_renewable_forecaster
+    from telemetry import get_grid_telemetry
+
     st.header("Real-Time Energy Insights")
 
-    # Get real-time energy data
-    energy_data = get_real_time_energy_data()
+    # Latest reading from the background sampler, with its history for the trend
+    telemetry, _ = get_grid_telemetry()
+    energy_data = telemetry.latest or get_real_time_energy_data()
 
     # Create columns for metrics
     col1, col2, col3 = st.columns(3)
@@ -166,7 +172,10 @@ def show_energy_insights():
 
     # Display renewable percentage
     st.progress(energy_data['renewable_percentage'] / 100)
-    st.text(f"Current Renewable Energy: {energy_data['renewable_percentage']}%")
+    st.text(f"Current Renewable Energy: {energy_data['renewable_percentage']:.2f}%")
+    intensity = float(intensity_from_renewable_share(energy_data['renewable_percentage']))
+    st.metric("Grid Carbon Intensity", f"{intensity:.2f} kg CO2/kWh",
+              delta=f"{intensity - HAWAII_ENERGY_FACTOR:+.2f} vs daily average", delta_color="inverse")
 
     # Add a chart showing energy distribution
     energy_dist = pd.DataFrame({
@@ -181,6 +190,30 @@ def show_energy_insights():
     fig = px.pie(energy_dist, values='Contribution', names='Source', title='Current Energy Distribution')
     st.plotly_chart(fig)
 
+    st.subheader("Renewable Energy Trend")
+    spans = {"Last hour": 3600, "Last day": 24 * 3600, "Last week": 7 * 24 * 3600}
+    span = st.radio("Period", list(spans), index=1, horizontal=True)
+    history = telemetry.frame(spans[span])
+    if history.empty:
+        st.info("Collecting grid readings...")
+    else:
+        fig = px.line(history, x='timestamp', y='renewable_percentage',
+                      labels={'timestamp': 'Time', 'renewable_percentage': 'Renewable %'})
+        st.plotly_chart(fig)
+
+    st.subheader("🔮 Low-Carbon Hours Forecast")
+    forecast = get_renewable_forecaster().forecast()
+    fig = px.line(pd.DataFrame(forecast), x='hour', y='renewable_percentage', markers=True,
+                  labels={'hour': 'Hour', 'renewable_percentage': 'Forecast renewable %'})
+    st.plotly_chart(fig)
+
+    duration = st.slider("Appliance run time (hours)", 1, 6, 2)
+    st.write("**Cleanest times to run it:**")
+    for window in cleanest_windows(forecast, duration):
+        intensity = float(intensity_from_renewable_share(window['renewable_percentage']))
+        st.write(f"- {window['start'].strftime('%a %H:%M')}–{window['end'].strftime('%H:%M')}: "
+                 f"{window['renewable_percentage']:.0f}% renewable, {intensity:.2f} kg CO2/kWh")
+
 def show_local_activities():
     st.header("Local Sustainability Activities")
 
@@ -193,8 +226,9 @@ def show_local_activities():
             st.write(f"🏆 Points: {activity['points']}")
 
             if st.button(f"Join {activity['type']}", key=f"join_{activity['type']}"):
-                update_user_points(activity['points'])
+                unlocked = update_user_points(activity['points'], 'local_activity', activity['type'])
                 st.success(f"You've signed up for {activity['type']} and earned {activity['points']} points!")
+                announce_achievements(unlocked)
 
 def show_activity_tracking():
     st.header("Track Your Activities")
@@ -214,22 +248,18 @@ def show_activity_tracking():
         if st.button("Log Transport Activity"):
             emissions, bonus_points = calculate_transport_emissions(transport_type, distance)
             details = {"type": transport_type, "distance": distance}
-            add_activity("transport", details, emissions)
 
             # Award points based on transportation choice
-            points = award_points("transport", 0, bonus_points, transport_type=transport_type)
+            points = award_points("transport", 0, bonus_points)
 
-            # Update the user points immediately after awarding
-            update_user_points(points)
+            # Activity, points and any unlocked achievements are written in one transaction
+            unlocked = log_activity("transport", details, emissions, points)
 
             if transport_type == 'car':
                 st.info("Activity logged. Consider eco-friendly options like walking, biking, or public transit next time!")
             elif points > 0:
                 st.success(f"Great choice! You earned {points} points for choosing eco-friendly transportation!")
-
-                # Add achievement for eco-friendly transport
-                if transport_type in ['walk', 'bike', 'bus']:
-                    add_achievement("Green Commuter")
+            announce_achievements(unlocked)
 
     elif activity_type == "Food":
         food_type = st.selectbox(
@@ -241,38 +271,44 @@ def show_activity_tracking():
         if st.button("Log Food Activity"):
             emissions = calculate_food_emissions(food_type, portions)
             details = {"type": food_type, "portions": portions}
-            add_activity("food", details, emissions)
 
             # Award points for eco-friendly choices
             if food_type in ["vegetarian", "vegan"]:
                 meat_emissions = calculate_food_emissions("meat", portions)
                 points = award_points("food", meat_emissions - emissions)
-                update_user_points(points)
+                unlocked = log_activity("food", details, emissions, points)
                 st.success(f"Logged successfully! Earned {points} points!")
-
-                # Add achievement for eco-friendly food choices
-                add_achievement("Plant-Based Pioneer")
             else:
+                unlocked = log_activity("food", details, emissions)
                 st.success("Activity logged successfully!")
+            announce_achievements(unlocked)
 
     elif activity_type == "Energy":
         kwh = st.number_input("Energy usage (kWh)", min_value=0.0, step=0.1)
 
         if st.button("Log Energy Activity"):
-            emissions = calculate_energy_emissions(kwh)
+            from telemetry import get_grid_telemetry
+
+            # Scored at the grid's measured carbon intensity for the hour it is logged in
+            logged_at = datetime.now()
+            store, _ = get_grid_telemetry()
+            emissions = calculate_energy_emissions(kwh, logged_at, store.intensity_series())
             details = {"kwh": kwh}
-            add_activity("energy", details, emissions)
 
             # Award points for low energy usage
-            if kwh < 10:  # Example threshold for low energy usage
+            if kwh < LOW_ENERGY_KWH:
                 points = award_points("energy", emissions)
-                update_user_points(points)
+                unlocked = log_activity("energy", details, emissions, points, logged_at)
                 st.success(f"Great job on energy conservation! Earned {points} points!")
-                add_achievement("Energy Saver")
             else:
+                unlocked = log_activity("energy", details, emissions, date=logged_at)
                 st.success("Activity logged successfully!")
+            announce_achievements(unlocked)
 
 def show_dashboard():
+    import pandas as pd
+    import plotly.express as px
+
     st.header("Your Carbon Footprint Dashboard")
 
     # Show emissions summary
@@ -286,18 +322,41 @@ def show_dashboard():
     with col3:
         st.metric("Monthly Emissions", f"{summary['monthly']:.2f} kg CO2")
 
-    # Show emissions trend
-    if hasattr(st.session_state, 'user_data') and not st.session_state.user_data.empty:
-        fig = px.line(
-            st.session_state.user_data,
-            x='date',
+    # Show emissions trend, one bar per day from the daily rollup
+    daily_emissions = get_daily_emissions()
+    if daily_emissions:
+        fig = px.bar(
+            pd.DataFrame(daily_emissions),
+            x='day',
             y='emissions',
+            color='activity_type',
             title='Your Emissions Over Time'
         )
         st.plotly_chart(fig)
     else:
         st.info("Start logging activities to see your emissions trend!")
 
+    # Show this month's breakdown by transport and food type
+    st.subheader("This Month by Category")
+    col1, col2 = st.columns(2)
+    transport = get_category_breakdown("transport")
+    food = get_category_breakdown("food")
+
+    with col1:
+        if transport:
+            fig = px.bar(pd.DataFrame(transport), x='category', y='quantity',
+                         labels={'category': 'Transport', 'quantity': 'Miles'}, title='Miles by Transport Type')
+            st.plotly_chart(fig)
+        else:
+            st.info("No trips logged this month.")
+    with col2:
+        if food:
+            fig = px.bar(pd.DataFrame(food), x='category', y='quantity',
+                         labels={'category': 'Food', 'quantity': 'Portions'}, title='Portions by Food Type')
+            st.plotly_chart(fig)
+        else:
+            st.info("No meals logged this month.")
+
     # Show leaderboard
     st.subheader("Leaderboard")
     leaderboard = get_leaderboard_data()
@@ -305,6 +364,9 @@ def show_dashboard():
     if leaderboard:
         for i, entry in enumerate(leaderboard, 1):
             st.text(f"{i}. {entry['name']}: {entry['points']} points")
+        rank = get_user_rank()
+        if rank > len(leaderboard):
+            st.text(f"...\n{rank}. {st.session_state.username}: {st.session_state.points} points")
     else:
         st.info("Be the first one on the leaderboard!")
 
@@ -327,6 +389,12 @@ def show_tips():
             st.write(f"• {item}")
 
 def show_rewards_map():
+    import pandas as pd
+    import streamlit.components.v1 as components
+    from map_data import ISLAND_BOUNDS, get_oahu_map_html, get_store_locations, get_bus_routes
+    from spatial_index import find_nearest
+    from trace_matching import TraceFormatError, match_trace
+
     st.header("🗺️ Oahu Activities and Rewards Map")
 
     # Display current points and available rewards
@@ -353,6 +421,33 @@ def show_rewards_map():
         st.success(f"Bus ride recorded! You earned {points_earned} points!")
         st.rerun()
 
+    # Detect real rides from a phone or watch location export
+    st.subheader("🛰️ Upload a GPS Trace")
+    trace = st.file_uploader("GPX or CSV location trace", type=['gpx', 'csv'])
+    if trace is not None and st.button("Detect Bus Rides"):
+        try:
+            rides = match_trace(trace, trace.name.rsplit('.', 1)[-1].lower())
+        except TraceFormatError as e:
+            st.error(str(e))
+        else:
+            stored = record_detected_rides(rides)
+            if not rides:
+                st.info("No bus rides found in this trace.")
+            elif not stored:
+                st.info("These rides have already been recorded.")
+            else:
+                st.success(f"Recorded {len(stored)} bus ride(s) for "
+                           f"{sum(ride['points_earned'] for ride in stored)} points!")
+                st.dataframe(pd.DataFrame([
+                    {
+                        'Route': ride['route_name'],
+                        'Boarded': datetime.fromtimestamp(ride['started_at']).strftime('%Y-%m-%d %H:%M'),
+                        'Miles': ride['distance'],
+                        'Points': ride['points_earned']
+                    }
+                    for ride in stored
+                ]))
+
     # Show available store rewards
     st.subheader("Available Store Rewards")
     stores = get_store_locations()
@@ -374,10 +469,10 @@ def show_rewards_map():
 
     # Create and display the map
     st.subheader("Interactive Map")
-    m = create_oahu_map(points)
+    area = st.selectbox("Show area", list(ISLAND_BOUNDS))
 
-    # Get the HTML representation of the map
-    map_html = m._repr_html_()
+    # Only features inside the area are sent; rendered once per points tier and area
+    map_html = get_oahu_map_html(points, ISLAND_BOUNDS[area])
 
     # Display the map using components
     components.html(map_html, height=600)
@@ -392,6 +487,19 @@ def show_rewards_map():
         Click on any marker to see more details!
     """)
 
+    # Nearest rewards, activities and bus stops to a chosen spot
+    st.subheader("📍 What's Near Me")
+    col1, col2 = st.columns(2)
+    with col1:
+        lat = st.number_input("Latitude", value=21.2793, format="%.4f")
+    with col2:
+        lon = st.number_input("Longitude", value=-157.8292, format="%.4f")
+
+    for label, kind in [("Stores", 'store'), ("Activities", 'activity'), ("Bus Stops", 'bus_stop')]:
+        st.write(f"**Nearest {label}**")
+        for place in find_nearest(lat, lon, kind):
+            st.write(f"- {place['name']}: {place['distance_km']:.1f} km")
+
 
 def main():
     st.set_page_config(page_title="Hawaii Carbon Footprint Tracker", layout="wide")
@@ -0,0 +1,116 @@
+"""Benchmark the achievement rules engine: per-event evaluation and the backfill.
+
+Run from the project root:
+
+    python -m benchmarks.bench_achievements [--users 5000] [--activities-per-user 40]
+
+Seeds users with random point balances and a mix of transport, food and
+energy activities, then times unlock_achievements for single users (the
+cost added to every logged activity) and backfill_achievements over the
+whole table. The backfill must unlock exactly what evaluating each user in
+Python would, and a second backfill must add nothing.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# models reads DATABASE_URL at import time, so point it at a scratch database first
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+
+from models import Activity, SessionLocal, User, UserAchievement, bootstrap_schema
+from gamification import (
+    aggregate_achievement_counters,
+    backfill_achievements,
+    evaluate_rules,
+    fetch_achievement_metrics,
+    unlock_achievements,
+    upsert_achievement_counters
+)
+
+TRANSPORT = ['car', 'bus', 'walk', 'bike', 'electric_vehicle']
+FOOD = ['meat', 'fish', 'vegetarian', 'vegan']
+SAMPLE_USERS = 500
+
+
+def seed(db, users, per_user, rng):
+    prefix = f"bench_{time.time_ns()}"
+    db.execute(insert(User), [
+        {'username': f"{prefix}_{i}", 'points': int(points)}
+        for i, points in enumerate(rng.integers(0, 1500, users))
+    ])
+    user_ids = db.scalars(select(User.id).where(User.username.like(f"{prefix}_%"))).all()
+
+    rows = []
+    for user_id in user_ids:
+        # Most users stick to one kind of activity, so not every rule fires
+        kinds = rng.choice(['transport', 'food', 'energy'], per_user, p=rng.dirichlet([0.3] * 3))
+        for kind in kinds.tolist():
+            row = {'user_id': user_id, 'activity_type': kind, 'emissions': 1.0}
+            if kind == 'transport':
+                row.update(transport_type=str(rng.choice(TRANSPORT, p=[0.9, 0.04, 0.02, 0.02, 0.02])),
+                           distance=float(rng.uniform(0, 10)))
+            elif kind == 'food':
+                row.update(food_type=str(rng.choice(FOOD, p=[0.8, 0.15, 0.03, 0.02])), portions=1)
+            else:
+                row['kwh'] = float(rng.uniform(5, 60))
+            rows.append(row)
+    for i in range(0, len(rows), 50_000):
+        db.execute(insert(Activity), rows[i:i + 50_000])
+    upsert_achievement_counters(db, aggregate_achievement_counters(rows))
+    db.commit()
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--activities-per-user', type=int, default=40)
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    rng = np.random.default_rng(0)
+    db = SessionLocal()
+    user_ids = seed(db, args.users, args.activities_per_user, rng)
+    print(f"{len(user_ids):,} users, {len(user_ids) * args.activities_per_user:,} activities")
+
+    expected = {
+        (user_id, name)
+        for user_id in user_ids
+        for name in evaluate_rules(fetch_achievement_metrics(db, user_id))
+    }
+
+    sample = user_ids[:SAMPLE_USERS]
+    started = time.perf_counter()
+    for user_id in sample:
+        unlock_achievements(db, user_id)
+    per_user = (time.perf_counter() - started) / len(sample)
+    # Undo so the backfill starts from nothing
+    db.execute(delete(UserAchievement).where(UserAchievement.user_id.in_(sample)))
+    db.commit()
+    db.close()
+
+    started = time.perf_counter()
+    added = backfill_achievements()
+    backfill = time.perf_counter() - started
+    again = backfill_achievements()
+
+    db = SessionLocal()
+    stored = set(db.execute(
+        select(UserAchievement.user_id, UserAchievement.achievement_name).where(UserAchievement.user_id.in_(user_ids))
+    ).all())
+    db.close()
+    assert stored == expected, "backfill and per-user evaluation disagree"
+    assert again == 0, f"second backfill added {again} achievements"
+
+    print(f"per-user unlock:  {per_user * 1000:>8.3f} ms/user (one counter read + one batched insert)")
+    print(f"backfill:         {backfill * 1000:>8.1f} ms for {added:,} unlocks, "
+          f"{per_user * len(user_ids) / backfill:.1f}x faster than evaluating users one by one")
+    print("backfill matches per-user evaluation; re-running it adds nothing")
+
+
+if __name__ == '__main__':
+    main()
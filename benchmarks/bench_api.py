@@ -0,0 +1,162 @@
+"""Throughput and latency of the async JSON API under concurrent clients.
+
+Run from the project root:
+
+    python -m benchmarks.bench_api [--clients 100] [--duration 20] [--users 500]
+
+Serves api.create_app() in-process on a local port, over the scratch SQLite
+database or DATABASE_URL, with synthetic users loaded from
+benchmarks.synthetic_data. Each client is an asyncio task sending requests
+back to back, mixed the way mobile and kiosk traffic would be: mostly
+summary, leaderboard and profile reads, with logged trips and bus rides.
+Reports requests per second and p50/p95/p99 latency per endpoint.
+
+In-process, the clients share the server's CPU. To measure a server the
+way it is deployed, start it on the same database and point --url at it:
+
+    DATABASE_URL=... python api.py --workers 4 &
+    DATABASE_URL=... python -m benchmarks.bench_api --url http://localhost:8080
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+# models reads DATABASE_URL at import time, so point it at a scratch database first
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'api.db'))
+
+import numpy as np
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.test_utils import TestServer
+
+from api import create_app
+from benchmarks import synthetic_data
+from models import MAX_OVERFLOW, POOL_SIZE, SessionLocal, bootstrap_schema, engine
+
+TRANSPORT_CHOICES = ['car', 'bus', 'walk', 'bike', 'electric_vehicle']
+
+
+def summary(rng, user_id):
+    return 'GET', f'/api/users/{user_id}/summary', None
+
+
+def leaderboard(rng, user_id):
+    return 'GET', '/api/leaderboard', None
+
+
+def profile(rng, user_id):
+    return 'GET', f'/api/users/{user_id}', None
+
+
+def bus_rides(rng, user_id):
+    return 'GET', f'/api/users/{user_id}/bus-rides', None
+
+
+def log_transport(rng, user_id):
+    details = {'type': rng.choice(TRANSPORT_CHOICES), 'distance': round(rng.uniform(0.5, 15), 1)}
+    return 'POST', f'/api/users/{user_id}/activities', {'activity_type': 'transport', 'details': details}
+
+
+def log_bus_ride(rng, user_id):
+    return 'POST', f'/api/users/{user_id}/bus-rides', {'route_name': 'Route 13 - Liliha'}
+
+
+# name: (request builder, relative frequency)
+REQUESTS = {
+    'summary': (summary, 30),
+    'leaderboard': (leaderboard, 25),
+    'profile': (profile, 15),
+    'bus_rides': (bus_rides, 10),
+    'log_transport': (log_transport, 15),
+    'log_bus_ride': (log_bus_ride, 5)
+}
+
+
+async def client(session, base_url, population, deadline, latencies, errors, seed):
+    rng = random.Random(seed)
+    names = list(REQUESTS)
+    weights = [weight for _, weight in REQUESTS.values()]
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, body = REQUESTS[name][0](rng, rng.choice(population))
+        started = time.perf_counter()
+        try:
+            async with session.request(method, base_url + path, json=body) as response:
+                await response.read()
+                ok = response.status < 400
+        except Exception:
+            ok = False
+        if ok:
+            latencies[name].append(time.perf_counter() - started)
+        else:
+            errors[name] += 1
+
+
+async def run(clients, duration, population, url=None):
+    server = None
+    if url is None:
+        server = TestServer(create_app())
+        await server.start_server()
+        url = str(server.make_url(''))
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    try:
+        async with ClientSession(connector=TCPConnector(limit=clients)) as session:
+            deadline = time.monotonic() + duration
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                client(session, url.rstrip('/'), population, deadline, latencies, errors, seed)
+                for seed in range(clients)
+            ))
+            elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            await server.close()
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=100, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="seconds to run")
+    parser.add_argument('--users', type=int, default=500, help="synthetic users to draw from")
+    parser.add_argument('--activities', type=int, default=100, help="mean activities per synthetic user")
+    parser.add_argument('--url', help="base URL of an API server already running on the same database, "
+                                      "e.g. one started with --workers, instead of serving in-process")
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    db = SessionLocal()
+    existing = synthetic_data.count_synthetic_users(db)
+    db.close()
+    if existing < args.users:
+        print(f"Loading {args.users - existing:,} synthetic users...", flush=True)
+        synthetic_data.generate(args.users - existing, args.activities)
+    db = SessionLocal()
+    population = synthetic_data.fetch_synthetic_user_ids(db)
+    db.close()
+
+    print(f"{args.clients} clients for {args.duration:.0f}s against {engine.dialect.name} "
+          f"(pool {POOL_SIZE} + {MAX_OVERFLOW} overflow)", flush=True)
+    latencies, errors, elapsed = asyncio.run(run(args.clients, args.duration, population, args.url))
+
+    print(f"\n{'endpoint':<14} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    total_requests = total_errors = 0
+    for name in REQUESTS:
+        timings = np.array(latencies.get(name, [])) * 1000
+        total_requests += len(timings)
+        total_errors += errors.get(name, 0)
+        if len(timings):
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = float('nan')
+        print(f"{name:<14} {len(timings):>9,} {len(timings) / elapsed:>8.1f} "
+              f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {errors.get(name, 0):>7,}")
+    print(f"{'total':<14} {total_requests:>9,} {total_requests / elapsed:>8.1f} {'':>29} {total_errors:>7,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Compare database backends on the same data-layer workloads.
+
+Run from the project root:
+
+    python -m benchmarks.bench_backends [--postgres postgresql://localhost/carbon_bench] [--users 200] [--threads 16]
+
+Two workloads run once per backend, each in its own process against its
+own database of synthetic users:
+
+- the data-layer cases of benchmarks.suite: single hot reads, the uncached
+  leaderboard and rolled-back writes, timed one at a time
+- benchmarks.load_driver with --threads users and no think time: pages,
+  reads and committed writes from concurrent sessions, where journaling,
+  syncing and lock waits show up
+
+The backends:
+
+- sqlite: the embedded default, WAL with the tuned pragmas of models
+- sqlite, no statement cache: the same, re-preparing every statement
+- sqlite, stock settings: rollback journal, synchronous=FULL, the default
+  page cache, no mmap and sqlite3's default statement cache
+- postgresql: the --postgres database, if given (synthetic users already
+  there are reused)
+
+Prints each suite case's median and each load operation's p95 in
+milliseconds, plus load throughput and errors, with the ratio to the first
+backend.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STOCK_SQLITE = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_CACHE_SIZE': '-2000',
+    'SQLITE_MMAP_SIZE': '0',
+    'SQLITE_STATEMENT_CACHE': '128'
+}
+
+
+def run_suite(database_url, env_overrides, args):
+    """Run the suite's data-layer cases against one database; returns {case: median ms}."""
+    output = os.path.join(tempfile.mkdtemp(), 'results.json')
+    env = dict(os.environ, DATABASE_URL=database_url, **env_overrides)
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', '--only', 'data.', '--users', str(args.users),
+         '--activities', str(args.activities), '--repeats', str(args.repeats), '--output', output],
+        cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+    with open(output) as f:
+        return {name: result['median_ms'] for name, result in json.load(f)['results'].items()}
+
+
+def run_load(database_url, env_overrides, args):
+    """Run the load driver against one database; returns its per-operation results."""
+    output = os.path.join(tempfile.mkdtemp(), 'load.json')
+    env = dict(os.environ, DATABASE_URL=database_url, **env_overrides)
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.load_driver', '--users', str(args.threads),
+         '--duration', str(args.duration), '--think-time', '0', '--population', str(args.users),
+         '--activities', str(args.activities), '--output', output],
+        cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+    with open(output) as f:
+        return json.load(f)['results']
+
+
+def print_table(title, rows, names):
+    """rows: {row label: {backend: value}}; ratios are against the first backend."""
+    baseline = names[0]
+    print(f"\n{title:<44}" + ''.join(f"{name:>24}" for name in names))
+    for label, values in rows.items():
+        line = f"{label:<44}"
+        for name in names:
+            value = values.get(name)
+            if value is None or value != value:  # missing or NaN
+                line += f"{'-':>24}"
+            elif name == baseline or not values.get(baseline):
+                line += f"{value:>24.3f}"
+            else:
+                line += f"{value:>15.3f} ({value / values[baseline]:>5.2f}x)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--postgres', help="PostgreSQL URL to compare against, e.g. postgresql://localhost/carbon_bench")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--activities', type=int, default=100, help="mean activities per synthetic user")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=16, help="concurrent sessions in the load run")
+    parser.add_argument('--duration', type=float, default=20, help="seconds of load per backend")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    backends = {
+        'sqlite': ('sqlite:///' + os.path.join(scratch, 'tuned.db'), {}),
+        'sqlite, no stmt cache': ('sqlite:///' + os.path.join(scratch, 'uncached.db'), {'SQLITE_STATEMENT_CACHE': '0'}),
+        'sqlite, stock': ('sqlite:///' + os.path.join(scratch, 'stock.db'), STOCK_SQLITE)
+    }
+    if args.postgres:
+        backends['postgresql'] = (args.postgres, {})
+
+    medians = {}
+    loads = {}
+    for name, (database_url, env_overrides) in backends.items():
+        print(f"Running {name}...", flush=True)
+        medians[name] = run_suite(database_url, env_overrides, args)
+        loads[name] = run_load(database_url, env_overrides, args)
+
+    names = list(backends)
+    print_table('suite case (median ms)', {
+        case: {name: medians[name].get(case) for name in names} for case in medians[names[0]]
+    }, names)
+    print_table(f'load, {args.threads} sessions (p95 ms)', {
+        operation: {name: loads[name][operation]['p95_ms'] for name in names}
+        for operation in loads[names[0]] if operation != 'total'
+    }, names)
+    print_table('load totals', {
+        'ops/s': {name: loads[name]['total']['ops_per_s'] for name in names},
+        'errors': {name: loads[name]['total']['errors'] for name in names}
+    }, names)
+
+
+if __name__ == '__main__':
+    main()
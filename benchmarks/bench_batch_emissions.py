@@ -0,0 +1,94 @@
+"""Benchmark batch emissions scoring against the scalar calculator.
+
+Run from the project root:
+
+    python -m benchmarks.bench_batch_emissions [--rows 10000000]
+
+Generates a random activity log, scores it with
+carbon_calculator.calculate_batch_emissions, times the per-row scalar
+functions on a sample, and checks both produce identical results.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from carbon_calculator import (
+    FOOD_EMISSIONS_FACTORS,
+    TRANSPORT_EMISSIONS_FACTORS,
+    calculate_batch_emissions,
+    calculate_energy_emissions,
+    calculate_food_emissions,
+    calculate_transport_emissions
+)
+
+SCALAR_SAMPLE = 200_000
+
+
+def synthetic_log(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    activity_types = rng.choice(np.array(['transport', 'food', 'energy'], dtype=object), rows, p=[0.6, 0.3, 0.1])
+    transport = np.array(list(TRANSPORT_EMISSIONS_FACTORS), dtype=object)
+    food = np.array(list(FOOD_EMISSIONS_FACTORS), dtype=object)
+    subtypes = np.where(
+        activity_types == 'transport',
+        transport[rng.integers(0, len(transport), rows)],
+        np.where(activity_types == 'food', food[rng.integers(0, len(food), rows)], '')
+    )
+    quantities = np.where(
+        activity_types == 'food',
+        rng.integers(1, 5, rows).astype(np.float64),
+        np.round(rng.uniform(0, 30, rows), 1)
+    )
+    return activity_types, subtypes, quantities
+
+
+def score_scalar(activity_type, subtype, quantity):
+    if activity_type == 'transport':
+        return calculate_transport_emissions(subtype, quantity)
+    if activity_type == 'food':
+        return calculate_food_emissions(subtype, int(quantity)), 0
+    if activity_type == 'energy':
+        return calculate_energy_emissions(quantity), 0
+    return 0, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    activity_types, subtypes, quantities = synthetic_log(args.rows)
+
+    started = time.perf_counter()
+    emissions, points = calculate_batch_emissions(activity_types, subtypes, quantities)
+    batch_seconds = time.perf_counter() - started
+
+    # Columnar sources (Parquet, pandas category columns) already carry codes
+    categorical_types, categorical_subtypes = pd.Categorical(activity_types), pd.Categorical(subtypes)
+    started = time.perf_counter()
+    categorical_emissions, _ = calculate_batch_emissions(categorical_types, categorical_subtypes, quantities)
+    categorical_seconds = time.perf_counter() - started
+    assert np.array_equal(emissions, categorical_emissions), "categorical inputs scored differently"
+
+    sample = min(SCALAR_SAMPLE, args.rows)
+    started = time.perf_counter()
+    scalar = [score_scalar(t, s, q) for t, s, q in zip(activity_types[:sample], subtypes[:sample], quantities[:sample])]
+    scalar_seconds = (time.perf_counter() - started) * args.rows / sample
+
+    scalar_emissions = np.array([e for e, _ in scalar])
+    scalar_points = np.array([p for _, p in scalar])
+    assert np.array_equal(emissions[:sample], scalar_emissions), "batch emissions differ from scalar"
+    assert np.array_equal(points[:sample], scalar_points), "batch points differ from scalar"
+
+    print(f"rows:            {args.rows:,}")
+    print(f"batch:           {batch_seconds:.2f}s ({args.rows / batch_seconds:,.0f} rows/s)")
+    print(f"categorical:     {categorical_seconds:.2f}s ({args.rows / categorical_seconds:,.0f} rows/s)")
+    print(f"scalar (est.):   {scalar_seconds:.2f}s ({args.rows / scalar_seconds:,.0f} rows/s)")
+    print(f"speedup:         {scalar_seconds / batch_seconds:.0f}x")
+    print(f"results identical on the first {sample:,} rows")
+
+
+if __name__ == '__main__':
+    main()
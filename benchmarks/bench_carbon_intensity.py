@@ -0,0 +1,89 @@
+"""Benchmark time-of-use energy scoring against a per-row lookup.
+
+Run from the project root:
+
+    python -m benchmarks.bench_carbon_intensity [--rows 5000000] [--days 365]
+
+Builds an hourly carbon-intensity series from simulated grid readings and a
+log of timestamped energy records (some outside the series, some untimed),
+then scores the log with carbon_calculator.calculate_batch_emissions in one
+pass. A per-row bisect lookup over the same series is timed on a sample
+and must give identical results.
+"""
+import argparse
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from carbon_calculator import (
+    HAWAII_ENERGY_FACTOR,
+    HOURLY_CARBON_INTENSITY,
+    CarbonIntensitySeries,
+    calculate_batch_emissions
+)
+from energy_data import GridSimulator
+
+SCALAR_SAMPLE = 100_000
+
+
+def hourly_series(days):
+    simulator = GridSimulator(seed=0)
+    start = datetime(2024, 1, 1)
+    hours = [start + timedelta(hours=h) for h in range(days * 24)]
+    shares = [simulator(hour + timedelta(minutes=30))['renewable_percentage'] for hour in hours]
+    return CarbonIntensitySeries.from_renewable_share(hours, shares)
+
+
+def synthetic_log(rows, days, rng):
+    # A tenth of the records fall after the series ends, a twentieth have no time
+    span = int(days * 1.1 * 86400)
+    stamps = np.datetime64('2024-01-01T00:00:00') + rng.integers(0, span, rows).astype('timedelta64[s]')
+    stamps = stamps.astype('datetime64[ns]')
+    stamps[rng.random(rows) < 0.05] = np.datetime64('NaT')
+    return stamps, np.round(rng.uniform(0, 40, rows), 2)
+
+
+def lookup_row(series, starts, ends, second):
+    """Per-row reference: bisect into the series, typical hour outside it."""
+    if np.isnan(second):
+        return HAWAII_ENERGY_FACTOR
+    i = bisect_right(starts, second) - 1
+    if i >= 0 and second < ends[i]:
+        return series.values[i]
+    return HOURLY_CARBON_INTENSITY[int(second // 3600) % 24]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    series = hourly_series(args.days)
+    stamps, kwh = synthetic_log(args.rows, args.days, np.random.default_rng(0))
+    activity_types = pd.Categorical(['energy'] * args.rows)
+
+    started = time.perf_counter()
+    emissions, _ = calculate_batch_emissions(activity_types, activity_types, kwh, stamps, series)
+    batch = time.perf_counter() - started
+
+    seconds = (stamps.astype('datetime64[s]').astype(np.int64)).astype(np.float64)
+    seconds[np.isnat(stamps)] = np.nan
+    starts, ends = series.starts.tolist(), series.ends.tolist()
+    sample = min(SCALAR_SAMPLE, args.rows)
+    started = time.perf_counter()
+    expected = [q * lookup_row(series, starts, ends, s) for q, s in zip(kwh[:sample].tolist(), seconds[:sample].tolist())]
+    scalar = (time.perf_counter() - started) / sample * args.rows
+
+    assert np.allclose(emissions[:sample], expected, rtol=0, atol=1e-12), "batch and per-row results differ"
+    print(f"{args.rows:,} energy records against {len(series.starts):,} hourly intensities")
+    print(f"vectorized:  {batch:>8.2f} s  ({args.rows / batch:,.0f} rows/s)")
+    print(f"per-row:     {scalar:>8.2f} s  (extrapolated from {sample:,} rows)")
+    print(f"speedup:     {scalar / batch:>8.1f}x, results identical on the sample")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark the emissions summary query as a user's history grows.
+
+Run from the project root:
+
+    python -m benchmarks.bench_emissions_summary [--max-rows 1000000]
+
+Activities are logged at a fixed rate going back in time, so a bigger history
+means older data rather than a busier last month. Latency should stay flat
+because the summary only reads the last 30 rows of the user's
+daily_emissions rollup.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# models reads DATABASE_URL at import time, so point it at a scratch database first
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from sqlalchemy import insert
+
+from models import Activity, User, SessionLocal, bootstrap_schema
+from services import fetch_emissions_summary
+from rollups import rebuild_daily_emissions
+
+LOG_INTERVAL = timedelta(minutes=5)
+SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def seed_activities(db, user_id, start, stop, now):
+    """Insert activities start..stop-1, each LOG_INTERVAL further in the past."""
+    batch = 50_000
+    for offset in range(start, stop, batch):
+        rows = [
+            {
+                'user_id': user_id,
+                'activity_type': 'transport',
+                'details': "{'type': 'car', 'distance': 4.0}",
+                'emissions': 1.0,
+                'date': now - LOG_INTERVAL * i
+            }
+            for i in range(offset, min(offset + batch, stop))
+        ]
+        db.execute(insert(Activity), rows)
+    db.commit()
+
+
+def time_summary(db, user_id, now, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fetch_emissions_summary(db, user_id, now=now)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-rows', type=int, default=SIZES[-1])
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    db = SessionLocal()
+    user = User(username=f"bench_{time.time_ns()}")
+    db.add(user)
+    db.commit()
+
+    now = datetime.now()
+    seeded = 0
+    print(f"{'activities':>12} {'median ms':>10}")
+    for size in [s for s in SIZES if s <= args.max_rows]:
+        seed_activities(db, user.id, seeded, size, now)
+        rebuild_daily_emissions(user.id)
+        seeded = size
+        median = time_summary(db, user.id, now, args.repeats)
+        print(f"{size:>12,} {median * 1000:>10.3f}")
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
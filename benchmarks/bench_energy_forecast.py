@@ -0,0 +1,71 @@
+"""Benchmark the low-carbon hours forecaster.
+
+Run from the project root:
+
+    python -m benchmarks.bench_energy_forecast [--days 14] [--queries 10000]
+
+Feeds a RenewableForecaster two weeks of simulated one-minute grid readings
+from a grid 25% sunnier and windier than energy_data's typical day, timing
+each O(1) update, then times 24-hour forecasts and cleanest-window
+searches. Forecast error against the new grid's typical day is compared
+with the untrained prior to show the profile adapts.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from energy_data import GridSimulator, typical_renewable_share
+from energy_forecast import RenewableForecaster, cleanest_windows
+
+SHIFT = 1.25
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--queries', type=int, default=10_000)
+    args = parser.parse_args()
+
+    simulator = GridSimulator(seed=0)
+    start = datetime(2024, 3, 1)
+    minutes = [start + timedelta(minutes=m) for m in range(args.days * 24 * 60)]
+    readings = [(moment.timestamp(), simulator(moment)['renewable_percentage'] * SHIFT) for moment in minutes]
+
+    prior = RenewableForecaster()
+    forecaster = RenewableForecaster()
+    started = time.perf_counter()
+    for timestamp, renewable_percentage in readings:
+        forecaster.update(timestamp, renewable_percentage)
+    update = (time.perf_counter() - started) / len(readings)
+
+    now = readings[-1][0]
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        forecast = forecaster.forecast(now)
+    query = (time.perf_counter() - started) / args.queries
+
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        cleanest_windows(forecast, 3)
+    windows = (time.perf_counter() - started) / args.queries
+
+    def error(model):
+        # Hours 4+ ahead, where the current departure has faded out
+        entries = model.forecast(now)[4:]
+        truth = [typical_renewable_share(entry['hour'].hour + 0.5) * SHIFT for entry in entries]
+        return float(np.mean(np.abs([e['renewable_percentage'] - t for e, t in zip(entries, truth)])))
+
+    print(f"{len(readings):,} one-minute readings over {args.days} days")
+    print(f"update:            {update * 1e6:>8.2f} us/reading")
+    print(f"24 h forecast:     {query * 1e6:>8.2f} us/query")
+    print(f"cleanest windows:  {windows * 1e6:>8.2f} us/query")
+    print(f"mean abs error vs the sunnier grid: prior {error(prior):.2f} pts, trained {error(forecaster):.2f} pts")
+    print("best 3 h windows: " + ", ".join(
+        f"{w['start']:%H:%M}-{w['end']:%H:%M} ({w['renewable_percentage']:.0f}%)" for w in cleanest_windows(forecast, 3)
+    ))
+
+
+if __name__ == '__main__':
+    main()
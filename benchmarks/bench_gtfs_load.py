@@ -0,0 +1,124 @@
+"""Benchmark GTFS feed parsing against loading the memory-mapped cache.
+
+Run from the project root:
+
+    python -m benchmarks.bench_gtfs_load [--routes 120] [--points 2000] [--trips 200]
+
+Writes a synthetic TheBus-sized feed (routes, trips, shapes, stops and
+stop_times) to a temporary zip, then times gtfs.build_cache (the streaming
+parse) and gtfs.load_feed on the warm cache. Peak Python memory during the
+parse is reported to show the large files are never held whole. Route
+lengths are checked against a straight per-route haversine sum.
+"""
+import argparse
+import csv
+import io
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import gtfs
+
+
+def write_table(feed, name, header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(rows)
+    feed.writestr(name, buffer.getvalue())
+
+
+def synthetic_feed(path, n_routes, points_per_shape, trips_per_route, stops_per_route, rng):
+    """Write a feed zip; returns the expected length in km of each route's shape."""
+    expected_km = []
+    shape_rows, stop_rows, trip_rows, stop_time_rows = [], [], [], []
+    for route in range(n_routes):
+        lat, lon = rng.uniform(21.25, 21.70), rng.uniform(-158.25, -157.65)
+        points = []
+        for _ in range(points_per_shape):
+            lat += rng.uniform(-0.0005, 0.0005)
+            lon += rng.uniform(-0.0005, 0.0005)
+            # Rounded as written to the feed, so expected lengths match exactly
+            points.append((round(lat, 6), round(lon, 6)))
+        expected_km.append(sum(
+            gtfs_haversine(a, b) for a, b in zip(points, points[1:])
+        ))
+        # Shape rows are written out of sequence order, as some feeds do
+        order = list(range(points_per_shape))
+        rng.shuffle(order)
+        shape_rows.extend((f"shape{route}", f"{points[i][0]:.6f}", f"{points[i][1]:.6f}", i) for i in order)
+
+        stop_ids = [f"r{route}s{i}" for i in range(stops_per_route)]
+        for i, stop_id in enumerate(stop_ids):
+            lat, lon = points[i * (points_per_shape - 1) // max(stops_per_route - 1, 1)]
+            stop_rows.append((stop_id, f"Stop {route}-{i}", f"{lat:.6f}", f"{lon:.6f}"))
+        for trip in range(trips_per_route):
+            trip_id = f"r{route}t{trip}"
+            trip_rows.append((f"R{route}", trip_id, f"shape{route}"))
+            stop_time_rows.extend((trip_id, stop_id, sequence) for sequence, stop_id in enumerate(stop_ids))
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as feed:
+        write_table(feed, 'routes.txt', ['route_id', 'route_short_name', 'route_long_name'],
+                    [(f"R{route}", str(route), f"Synthetic Line {route}") for route in range(n_routes)])
+        write_table(feed, 'stops.txt', ['stop_id', 'stop_name', 'stop_lat', 'stop_lon'], stop_rows)
+        write_table(feed, 'trips.txt', ['route_id', 'trip_id', 'shape_id'], trip_rows)
+        write_table(feed, 'shapes.txt', ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence'], shape_rows)
+        write_table(feed, 'stop_times.txt', ['trip_id', 'stop_id', 'stop_sequence'], stop_time_rows)
+    return expected_km, len(shape_rows), len(stop_time_rows)
+
+
+def gtfs_haversine(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * gtfs.EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', type=int, default=120)
+    parser.add_argument('--points', type=int, default=2000, help="shape points per route")
+    parser.add_argument('--trips', type=int, default=200, help="trips per route")
+    parser.add_argument('--stops', type=int, default=40, help="stops per route")
+    parser.add_argument('--loads', type=int, default=50, help="cached loads timed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, 'gtfs.zip')
+        expected_km, shape_points, stop_times = synthetic_feed(
+            path, args.routes, args.points, args.trips, args.stops, random.Random(0)
+        )
+        print(f"feed: {args.routes} routes, {shape_points:,} shape points, {stop_times:,} stop_times, "
+              f"{os.path.getsize(path) / 2 ** 20:.1f} MiB zipped")
+
+        started = time.perf_counter()
+        cache_dir = gtfs.build_cache(path)
+        parse = time.perf_counter() - started
+        # Traced separately: tracemalloc slows the parse several times over
+        tracemalloc.start()
+        gtfs.build_cache(path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"parse + cache write: {parse * 1000:>9.1f} ms, peak {peak / 2 ** 20:.1f} MiB")
+
+        started = time.perf_counter()
+        for _ in range(args.loads):
+            feed = gtfs.load_feed(path, cache_dir)
+        load = (time.perf_counter() - started) / args.loads
+        print(f"cached load:         {load * 1000:>9.2f} ms")
+
+        started = time.perf_counter()
+        routes = feed.routes()
+        print(f"routes():            {(time.perf_counter() - started) * 1000:>9.1f} ms for {len(routes)} routes")
+
+        measured = [route['distance_km'] for route in routes]
+        assert all(math.isclose(a, b, rel_tol=1e-6) for a, b in zip(measured, expected_km)), "route lengths differ"
+        assert all(len(stop['routes']) == 1 for stop in feed.stops()), "stops should each serve one route"
+        print(f"route lengths match; mean {sum(measured) / len(measured):.1f} km")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark Rewards Map rendering with many routes and stores.
+
+Run from the project root:
+
+    python -m benchmarks.bench_map_render [--routes 300] [--stores 300] [--renders 200]
+
+Compares three ways of producing the map HTML for a stream of users with
+random point balances:
+
+* polyline: the original approach, one folium.PolyLine per route, rebuilt
+  and rendered on every page view
+* uncached: map_data.create_oahu_map (routes as one GeoJSON layer), rebuilt
+  and rendered on every page view
+* cached:   map_data.OahuMapCache, rendered once per points tier
+
+Store layers above map_data.CLUSTER_THRESHOLD are clustered. The payload of a
+bounding-box-limited map is reported as well.
+"""
+import argparse
+import random
+import time
+
+import folium
+
+from map_data import OahuMapCache, add_activity_layer, add_store_layer, create_oahu_map, get_activity_locations
+
+OAHU_BOUNDS = ((21.25, -158.28), (21.71, -157.65))
+
+
+def random_location(rng):
+    (south, west), (north, east) = OAHU_BOUNDS
+    return [rng.uniform(south, north), rng.uniform(west, east)]
+
+
+def synthetic_routes(count, rng, points_per_route=20):
+    routes = []
+    for i in range(count):
+        lat, lon = random_location(rng)
+        path = []
+        for _ in range(points_per_route):
+            lat += rng.uniform(-0.005, 0.005)
+            lon += rng.uniform(-0.005, 0.005)
+            path.append([lat, lon])
+        routes.append({'name': f"Route {i}", 'path': path, 'distance': round(rng.uniform(1, 20), 1),
+                       'points_per_ride': rng.randrange(10, 100, 5)})
+    return routes
+
+
+def synthetic_stores(count, rng):
+    return [
+        {'name': f"Store {i}", 'location': random_location(rng), 'points_required': rng.randrange(100, 5000, 50),
+         'discount': '10% off', 'description': 'Partner store'}
+        for i in range(count)
+    ]
+
+
+def polyline_map(user_points, routes, activities, stores):
+    m = folium.Map(location=[21.4389, -157.9243], zoom_start=11, tiles="cartodb positron")
+    for route in routes:
+        folium.PolyLine(
+            locations=route['path'], color='blue', weight=2,
+            popup=f"<b>{route['name']}</b><br>Distance: {route['distance']} miles<br>"
+                  f"Points per ride: {route['points_per_ride']}"
+        ).add_to(m)
+    add_activity_layer(m, activities)
+    add_store_layer(m, stores, user_points)
+    return m
+
+
+def time_renders(render, balances):
+    started = time.perf_counter()
+    for points in balances:
+        render(points)
+    return (time.perf_counter() - started) / len(balances)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', type=int, default=300)
+    parser.add_argument('--stores', type=int, default=300)
+    parser.add_argument('--renders', type=int, default=200)
+    parser.add_argument('--uncached-renders', type=int, default=10, help="renders timed for the slow paths")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    routes = synthetic_routes(args.routes, rng)
+    stores = synthetic_stores(args.stores, rng)
+    activities = get_activity_locations()
+    # Most users sit in the lower tiers, as on the real leaderboard
+    balances = [int(rng.expovariate(1 / 400)) for _ in range(args.renders)]
+
+    polyline = time_renders(lambda p: polyline_map(p, routes, activities, stores)._repr_html_(),
+                            balances[:args.uncached_renders])
+    uncached = time_renders(lambda p: create_oahu_map(p, routes, activities, stores)._repr_html_(),
+                            balances[:args.uncached_renders])
+    cache = OahuMapCache(routes, activities, stores)
+    cached = time_renders(cache.html, balances)
+
+    size = len(cache.html(balances[0])) / 1024
+    print(f"{args.routes} routes, {args.stores} stores, {args.renders} page views, "
+          f"{len(cache._html)} distinct tiers rendered, {size:,.0f} KiB per page")
+    print(f"polyline  {polyline * 1000:>10.2f} ms/view")
+    print(f"uncached  {uncached * 1000:>10.2f} ms/view")
+    print(f"cached    {cached * 1000:>10.2f} ms/view")
+
+    # Payload for a neighbourhood-sized viewport instead of the whole island
+    honolulu = ((21.27, -157.90), (21.33, -157.80))
+    viewport = len(create_oahu_map(balances[0], routes, activities, stores, bbox=honolulu)._repr_html_()) / 1024
+    print(f"viewport-limited page: {viewport:,.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
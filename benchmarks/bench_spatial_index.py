@@ -0,0 +1,69 @@
+"""Benchmark spatial_index lookups over many points.
+
+Run from the project root:
+
+    python -m benchmarks.bench_spatial_index [--points 100000] [--queries 10000]
+
+Indexes random points spread over the main Hawaiian islands, times k-nearest
+and radius queries, and checks a sample of answers against brute force.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from spatial_index import SpatialIndex, haversine_km
+
+HAWAII_BOUNDS = ((18.9, -160.3), (22.3, -154.8))
+CHECKED_QUERIES = 200
+
+
+def random_points(count, rng):
+    (south, west), (north, east) = HAWAII_BOUNDS
+    return rng.uniform(south, north, count), rng.uniform(west, east, count)
+
+
+def time_queries(query, lats, lons):
+    started = time.perf_counter()
+    for lat, lon in zip(lats, lons):
+        query(lat, lon)
+    return (time.perf_counter() - started) / len(lats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=10_000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--radius-km', type=float, default=2.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats, lons = random_points(args.points, rng)
+    query_lats, query_lons = random_points(args.queries, rng)
+
+    started = time.perf_counter()
+    index = SpatialIndex(lats, lons)
+    build_seconds = time.perf_counter() - started
+
+    nearest = time_queries(lambda lat, lon: index.nearest(lat, lon, args.k), query_lats, query_lons)
+    within = time_queries(lambda lat, lon: index.within(lat, lon, args.radius_km), query_lats, query_lons)
+    brute = time_queries(lambda lat, lon: np.argpartition(haversine_km(lat, lon, lats, lons), args.k)[:args.k],
+                         query_lats[:CHECKED_QUERIES], query_lons[:CHECKED_QUERIES])
+
+    for lat, lon in zip(query_lats[:CHECKED_QUERIES], query_lons[:CHECKED_QUERIES]):
+        distances = haversine_km(lat, lon, lats, lons)
+        _, found = index.nearest(lat, lon, args.k)
+        assert np.allclose(found, np.sort(distances)[:args.k]), "nearest differs from brute force"
+        ids, _ = index.within(lat, lon, args.radius_km)
+        assert set(ids) == set(np.flatnonzero(distances <= args.radius_km)), "within differs from brute force"
+
+    print(f"{args.points:,} points indexed in {build_seconds * 1000:.1f} ms")
+    print(f"nearest k={args.k}:        {nearest * 1e6:>8.1f} us/query")
+    print(f"within {args.radius_km} km:      {within * 1e6:>8.1f} us/query")
+    print(f"brute-force nearest:  {brute * 1e6:>8.1f} us/query")
+    print(f"answers match brute force on {CHECKED_QUERIES} queries")
+
+
+if __name__ == '__main__':
+    main()
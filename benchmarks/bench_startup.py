@@ -0,0 +1,137 @@
+"""Cold-start time of the app: imports, schema bootstrap and time to first render of each page.
+
+Run from the project root:
+
+    python -m benchmarks.bench_startup [--repeats 5] [--pages] [--output startup.json]
+
+Every measurement runs in a fresh interpreter against a scratch SQLite
+database (or DATABASE_URL), so nothing is warm from an earlier run:
+
+- import: `import app`, as a Streamlit server does before the first run
+- bootstrap (new/current database): models.bootstrap_schema on an empty
+  database, and on one already at SCHEMA_VERSION
+- first render: the first script run through Streamlit's AppTest, which
+  shows the Profile page
+- first visit <page> (with --pages): switching to the page right after the first render,
+  including the libraries the page imports on first use
+
+Each row lists the heavy libraries loaded by then; the process column is
+the child's wall time including interpreter startup. --output writes the
+medians as JSON for tracking over time.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["Track Activities", "Dashboard", "Energy Insights", "Local Activities",
+         "Tips & Recommendations", "Achievements", "Rewards Map"]
+HEAVY_MODULES = ('pandas', 'plotly.express', 'folium', 'PIL')
+
+_LOADED = f"[name for name in {HEAVY_MODULES!r} if name in sys.modules]"
+
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+print(json.dumps({{'seconds': time.perf_counter() - started, 'loaded': {_LOADED}}}))
+"""
+
+BOOTSTRAP_PROBE = f"""
+import json, sys, time
+import models
+started = time.perf_counter()
+changed = models.bootstrap_schema()
+print(json.dumps({{'seconds': time.perf_counter() - started, 'changed': changed, 'loaded': {_LOADED}}}))
+"""
+
+RENDER_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file('app.py', default_timeout=120)
+at.run()
+assert not at.exception, at.exception
+seconds = time.perf_counter() - started
+if len(sys.argv) > 1:
+    started = time.perf_counter()
+    at.sidebar.selectbox[0].select(sys.argv[1]).run()
+    assert not at.exception, at.exception
+    seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds, 'loaded': {_LOADED}}}))
+"""
+
+
+def probe(code, database_url, *args):
+    """Run a probe in a fresh interpreter; returns its report plus the process wall time."""
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=ROOT)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code, *args], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        raise RuntimeError(f"probe failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['process'] = elapsed
+    return report
+
+
+def summarize(reports):
+    seconds = [report['seconds'] * 1000 for report in reports]
+    process = [report['process'] * 1000 for report in reports]
+    return {
+        'median_ms': float(np.median(seconds)),
+        'min_ms': float(min(seconds)),
+        'process_median_ms': float(np.median(process)),
+        'loaded': reports[-1]['loaded'],
+        'runs': len(reports)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--pages', action='store_true', help="also time the first visit to every page")
+    parser.add_argument('--output', help="write results to this JSON file")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    database_url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(scratch, 'startup.db')
+
+    cases = {
+        'import': lambda i: probe(IMPORT_PROBE, database_url),
+        'bootstrap (new database)': lambda i: probe(
+            BOOTSTRAP_PROBE, 'sqlite:///' + os.path.join(scratch, f'new_{i}.db')),
+        'bootstrap (current database)': lambda i: probe(BOOTSTRAP_PROBE, database_url),
+        'first render': lambda i: probe(RENDER_PROBE, database_url)
+    }
+    if args.pages:
+        for page in PAGES:
+            cases[f'first visit {page}'] = lambda i, page=page: probe(RENDER_PROBE, database_url, page)
+
+    # The database is bootstrapped once up front, so every case but the
+    # new-database one measures a schema that is already current
+    probe(BOOTSTRAP_PROBE, database_url)
+
+    results = {}
+    print(f"{'case':<36} {'median ms':>10} {'min ms':>9} {'process ms':>11}  loaded")
+    for name, case in cases.items():
+        results[name] = summarize([case(i) for i in range(args.repeats)])
+        result = results[name]
+        print(f"{name:<36} {result['median_ms']:>10.1f} {result['min_ms']:>9.1f} "
+              f"{result['process_median_ms']:>11.1f}  {', '.join(result['loaded']) or '-'}", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'repeats': args.repeats, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Benchmark bus ride detection on long GPS traces.
+
+Run from the project root:
+
+    python -m benchmarks.bench_trace_matching [--routes 120] [--route-points 500] [--rides 40]
+
+Builds synthetic bus routes and a 1 Hz trace alternating walks off the
+network with rides along randomly chosen routes, plus GPS noise. Times
+BusRideMatcher on the trace (matching throughput in points per ms) and
+GPX parsing separately, then checks that every planted ride is detected on
+the right route and nothing else is.
+"""
+import argparse
+import io
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from trace_matching import BusRideMatcher, TRACE_CHUNK_SIZE, iter_trace_chunks
+
+OAHU_BOUNDS = ((21.25, -158.28), (21.71, -157.65))
+BUS_SPEED_KMH = 30
+WALK_SPEED_KMH = 4
+GPS_NOISE_DEGREES = 0.00008  # about 9 m
+
+
+def synthetic_routes(count, points_per_route, rng):
+    (south, west), (north, east) = OAHU_BOUNDS
+    routes = []
+    for i in range(count):
+        start = rng.uniform((south, west), (north, east))
+        heading = rng.uniform(0, 2 * np.pi)
+        # Gently curving roads with ~100 m between shape points
+        headings = heading + np.cumsum(rng.normal(0, 0.05, points_per_route))
+        steps = 0.0009 * np.column_stack((np.sin(headings), np.cos(headings)))
+        path = start + np.cumsum(steps, axis=0)
+        routes.append({'name': f"Route {i}", 'path': path.tolist(), 'distance': 30.0, 'points_per_ride': 50})
+    return routes
+
+
+def densify(path, speed_kmh):
+    """1 Hz positions moving along a path at a steady speed."""
+    path = np.asarray(path)
+    km = np.hypot(np.diff(path[:, 0]) * 111.2, np.diff(path[:, 1]) * 103.6)
+    along = np.concatenate(([0.0], np.cumsum(km)))
+    samples = np.arange(0, along[-1], speed_kmh / 3600)
+    return np.column_stack((np.interp(samples, along, path[:, 0]), np.interp(samples, along, path[:, 1])))
+
+
+def synthetic_trace(routes, n_rides, rng):
+    """Points of a trace plus the (route index, start second) of each ride in it."""
+    pieces, planted = [], []
+    seconds = 0
+    (south, west), (north, east) = OAHU_BOUNDS
+    for _ in range(n_rides):
+        # Walk across open ocean-side ground south of the network between rides
+        walk_start = rng.uniform((south - 0.2, west), (south - 0.1, east))
+        walk = densify([walk_start, walk_start + rng.normal(0, 0.005, 2)], WALK_SPEED_KMH)[:900]
+        pieces.append(walk)
+        seconds += len(walk)
+
+        route = int(rng.integers(len(routes)))
+        path = np.asarray(routes[route]['path'])
+        board = int(rng.integers(0, len(path) // 2))
+        alight = int(rng.integers(board + len(path) // 4, len(path)))
+        ride = densify(path[board:alight + 1], BUS_SPEED_KMH)
+        planted.append((route, seconds))
+        pieces.append(ride)
+        seconds += len(ride)
+
+    points = np.vstack(pieces)
+    points += rng.normal(0, GPS_NOISE_DEGREES, points.shape)
+    return points, planted
+
+
+def as_gpx(points, start):
+    lines = ['<?xml version="1.0"?>', '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>']
+    for second, (lat, lon) in enumerate(points.tolist()):
+        stamp = datetime.fromtimestamp(start + second, timezone.utc).isoformat()
+        lines.append(f'<trkpt lat="{lat:.6f}" lon="{lon:.6f}"><time>{stamp}</time></trkpt>')
+    lines.append('</trkseg></trk></gpx>')
+    return '\n'.join(lines).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', type=int, default=120)
+    parser.add_argument('--route-points', type=int, default=500)
+    parser.add_argument('--rides', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    routes = synthetic_routes(args.routes, args.route_points, rng)
+    points, planted = synthetic_trace(routes, args.rides, rng)
+    start = 1_700_000_000
+    times = start + np.arange(len(points), dtype=np.float64)
+    print(f"{args.routes} routes x {args.route_points} points, trace of {len(points):,} points "
+          f"({len(points) / 3600:.1f} h at 1 Hz) with {len(planted)} rides")
+
+    started = time.perf_counter()
+    matcher = BusRideMatcher(routes)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(0, len(points), TRACE_CHUNK_SIZE):
+        chunk = slice(i, i + TRACE_CHUNK_SIZE)
+        matcher.feed(points[chunk, 0], points[chunk, 1], times[chunk])
+    rides = matcher.finish()
+    elapsed = time.perf_counter() - started
+    print(f"index build:   {build * 1000:>8.1f} ms")
+    print(f"matching:      {elapsed * 1000:>8.1f} ms, {len(points) / elapsed / 1000:,.0f} points/ms")
+
+    gpx = as_gpx(points[:200_000], start)
+    started = time.perf_counter()
+    parsed = sum(len(lats) for lats, _, _ in iter_trace_chunks(io.BytesIO(gpx), 'gpx'))
+    elapsed = time.perf_counter() - started
+    print(f"GPX parsing:   {elapsed * 1000:>8.1f} ms for {parsed:,} points, {parsed / elapsed / 1000:,.0f} points/ms")
+
+    found = [(ride['route_name'], ride['started_at'] - start) for ride in rides]
+    expected = [(routes[route]['name'], second) for route, second in planted]
+    assert len(found) == len(expected), f"detected {len(found)} rides, planted {len(expected)}"
+    for (name, second), (expected_name, expected_second) in zip(found, expected):
+        # Noise can shift boarding by a few points
+        assert name == expected_name and abs(second - expected_second) < 60, (name, second, expected_name)
+    print(f"all {len(rides)} rides detected on the right routes")
+
+
+if __name__ == '__main__':
+    main()
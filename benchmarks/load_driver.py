@@ -0,0 +1,209 @@
+"""Drive the service layer with many concurrent simulated users.
+
+Run from the project root:
+
+    python -m benchmarks.load_driver [--users 200] [--duration 60] [--think-time 0.5] [--output load.json]
+
+Each simulated user is a thread that picks operations with the weights a
+browsing session would produce (page loads, dashboard reads, leaderboard
+checks, logged activities, bus rides, profile views) and calls the
+headless services layer directly, one unit of work per operation, with a
+random pause between them. Users come from benchmarks.synthetic_data,
+loaded into the scratch database or DATABASE_URL first if needed.
+
+Reports throughput and p50/p95/p99 latency per operation. Latency
+includes waiting for a pooled connection, so too small a pool for the
+number of users shows up here the way it would in production. Failed
+operations (e.g. SQLite's "database is locked") are counted, not retried.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# models reads DATABASE_URL at import time, so point it at a scratch database first
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load.db'))
+
+import numpy as np
+from sqlalchemy import select
+
+import services
+from benchmarks import synthetic_data
+from carbon_calculator import calculate_transport_emissions
+from gamification import award_points
+from models import MAX_OVERFLOW, POOL_SIZE, SessionLocal, User, bootstrap_schema, engine, session_scope
+
+TRANSPORT_CHOICES = ['car', 'bus', 'walk', 'bike', 'electric_vehicle']
+
+
+def page_load(db, user):
+    services.get_or_create_user(db, user['username'])
+    for max_id, _ in services.fetch_new_activities(db, user['id'], user['max_activity_id']):
+        user['max_activity_id'] = max_id
+    services.fetch_emissions_summary(db, user['id'])
+
+
+def dashboard(db, user):
+    month_ago = datetime.now() - timedelta(days=30)
+    services.fetch_emissions_summary(db, user['id'])
+    services.fetch_daily_emissions(db, user['id'], month_ago)
+    for activity_type in ('transport', 'food', 'energy'):
+        services.fetch_category_breakdown(db, user['id'], activity_type, month_ago)
+
+
+def leaderboard(db, user):
+    services.fetch_leaderboard(db)
+    services.fetch_rank(db, user['id'])
+
+
+def log_transport(db, user):
+    transport_type = user['rng'].choice(TRANSPORT_CHOICES)
+    distance = round(user['rng'].uniform(0.5, 15), 1)
+    emissions, bonus = calculate_transport_emissions(transport_type, distance)
+    services.record_activity(db, user['id'], 'transport', {'type': transport_type, 'distance': distance},
+                             emissions, award_points('transport', 0, bonus))
+
+
+def bus_ride(db, user):
+    services.record_bus_ride(db, user['id'], 'Route 13 - Liliha', 2.8, 40)
+
+
+def achievements(db, user):
+    services.fetch_user_profile(db, user['id'])
+    services.fetch_user_achievements(db, user['id'])
+
+
+def profile(db, user):
+    services.fetch_user_profile(db, user['id'])
+    services.fetch_bus_rides(db, user['id'])
+
+
+# name: (operation, relative frequency)
+OPERATIONS = {
+    'page_load': (page_load, 30),
+    'dashboard': (dashboard, 20),
+    'leaderboard': (leaderboard, 10),
+    'log_transport': (log_transport, 15),
+    'bus_ride': (bus_ride, 5),
+    'achievements': (achievements, 10),
+    'profile': (profile, 10)
+}
+
+
+class Recorder:
+    """Latencies and failures per operation, shared by all user threads."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.last_error = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, error=None):
+        with self._lock:
+            if error is None:
+                self.latencies[name].append(seconds)
+            else:
+                self.errors[name] += 1
+                self.last_error[name] = repr(error)
+
+
+def simulated_user(user, deadline, think_time, recorder, seed):
+    rng = user['rng'] = random.Random(seed)
+    names = list(OPERATIONS)
+    weights = [weight for _, weight in OPERATIONS.values()]
+    # Stagger starts so the first requests do not all land at once
+    time.sleep(rng.uniform(0, think_time))
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            with session_scope() as db:
+                OPERATIONS[name][0](db, user)
+        except Exception as e:
+            recorder.record(name, None, e)
+        else:
+            recorder.record(name, time.perf_counter() - started)
+        time.sleep(rng.expovariate(1 / think_time) if think_time else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200, help="concurrent simulated users")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to run")
+    parser.add_argument('--think-time', type=float, default=0.5, help="mean pause between a user's operations")
+    parser.add_argument('--population', type=int, default=1000, help="synthetic users to draw from")
+    parser.add_argument('--activities', type=int, default=100, help="mean activities per synthetic user")
+    parser.add_argument('--output', help="write per-operation results to this JSON file")
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    db = SessionLocal()
+    existing = synthetic_data.count_synthetic_users(db)
+    db.close()
+    if existing < args.population:
+        print(f"Loading {args.population - existing:,} synthetic users...", flush=True)
+        synthetic_data.generate(args.population - existing, args.activities)
+    db = SessionLocal()
+    population = synthetic_data.fetch_synthetic_user_ids(db)
+    usernames = dict(db.execute(
+        select(User.id, User.username).where(User.id.in_(population))
+    ).all())
+    db.close()
+
+    rng = np.random.default_rng(0)
+    chosen = rng.choice(population, args.users, replace=args.users > len(population)).tolist()
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(
+            target=simulated_user,
+            args=({'id': user_id, 'username': usernames[user_id], 'max_activity_id': 0},
+                  deadline, args.think_time, recorder, i),
+            daemon=True
+        )
+        for i, user_id in enumerate(chosen)
+    ]
+    print(f"{args.users} users for {args.duration:.0f}s against {engine.dialect.name} "
+          f"(pool {POOL_SIZE} + {MAX_OVERFLOW} overflow)", flush=True)
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{'operation':<14} {'ops':>7} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    results = {}
+    total_ops = total_errors = 0
+    for name in OPERATIONS:
+        latencies = np.array(recorder.latencies.get(name, [])) * 1000
+        errors = recorder.errors.get(name, 0)
+        total_ops += len(latencies)
+        total_errors += errors
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = float('nan')
+        results[name] = {'ops': len(latencies), 'ops_per_s': len(latencies) / elapsed,
+                         'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'errors': errors}
+        print(f"{name:<14} {len(latencies):>7,} {len(latencies) / elapsed:>8.1f} "
+              f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {errors:>7,}")
+    results['total'] = {'ops': total_ops, 'ops_per_s': total_ops / elapsed, 'errors': total_errors}
+    print(f"{'total':<14} {total_ops:>7,} {total_ops / elapsed:>8.1f} {'':>29} {total_errors:>7,}")
+    for name, error in recorder.last_error.items():
+        print(f"last {name} error: {error}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'database': engine.dialect.name, 'users': args.users, 'duration': args.duration,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Soak the session/connection pool with simulated Dashboard page loads.
+
+Run from the project root:
+
+    python -m benchmarks.soak_sessions [--page-loads 10000] [--workers 8]
+
+Each page load opens one unit of work and runs the same queries as a
+Dashboard rerun. Pool statistics are sampled along the way; the open
+connection count must stay at or below pool_size + max_overflow and must not
+grow with the number of page loads.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# models reads DATABASE_URL at import time, so point it at a scratch database first
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'soak.db'))
+
+from models import MAX_OVERFLOW, POOL_SIZE, bootstrap_schema, get_pool_stats, session_scope
+from services import fetch_emissions_summary, fetch_leaderboard, fetch_new_activities, get_or_create_user
+
+
+def page_load(username):
+    with session_scope() as db:
+        user = get_or_create_user(db, username)
+        for _ in fetch_new_activities(db, user.id):
+            pass
+        fetch_emissions_summary(db, user.id)
+        fetch_leaderboard(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page-loads', type=int, default=10_000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    sample_every = max(args.page_loads // 10, 1)
+    samples = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for start in range(0, args.page_loads, sample_every):
+            stop = min(start + sample_every, args.page_loads)
+            list(executor.map(page_load, (f"soak_user_{i % args.users}" for i in range(start, stop))))
+            stats = get_pool_stats()
+            samples.append(stats['open_connections'])
+            print(f"{stop:>8,} loads  open={stats['open_connections']:>3}  "
+                  f"checked_out={stats['checked_out']:>3}  idle={stats['idle']:>3}  "
+                  f"mean_wait={stats['mean_wait'] * 1000:.3f}ms  max_wait={stats['max_wait'] * 1000:.3f}ms")
+    elapsed = time.perf_counter() - started
+
+    stats = get_pool_stats()
+    print(f"{args.page_loads:,} page loads in {elapsed:.1f}s, {stats['checkouts']:,} checkouts, "
+          f"{stats['timeouts']} timeouts")
+
+    limit = POOL_SIZE + MAX_OVERFLOW
+    assert stats['checked_out'] == 0, "connections leaked: still checked out after all page loads"
+    assert max(samples) <= limit, f"open connections exceeded pool limit {limit}"
+    assert samples[-1] <= samples[0], f"open connections grew from {samples[0]} to {samples[-1]}"
+    print("connection count stayed flat")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Hammer the activity write path from many threads and check no points are lost.
+
+Run from the project root:
+
+    python -m benchmarks.stress_points [--threads 16] [--writes 200]
+
+Every thread logs activities for the same user through
+services.record_activity, each worth a known number of points. The final
+balance must equal the starting balance plus every increment, both in the
+users.points cache and in the points ledger.
+"""
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# models reads DATABASE_URL at import time, so point it at a scratch database first
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db'))
+
+from sqlalchemy.exc import OperationalError
+
+from models import User, UserAchievement, bootstrap_schema, session_scope
+from services import get_or_create_user, record_activity
+from points_ledger import fetch_balance, fetch_drift
+
+
+def writer(user_id, thread_index, writes):
+    awarded = 0
+    for i in range(writes):
+        points = thread_index + i % 7 + 1
+        while True:
+            try:
+                with session_scope() as db:
+                    record_activity(db, user_id, "transport", {"type": "bike", "distance": 1.0}, 0.0, points)
+                break
+            except OperationalError:
+                # SQLite reports writer contention as "database is locked"; the
+                # transaction was rolled back as a whole, so retrying is safe
+                time.sleep(0.001)
+        awarded += points
+    return awarded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=200, help="activities logged per thread")
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    with session_scope() as db:
+        user = get_or_create_user(db, f"stress_{time.time_ns()}")
+        user_id, start_points = user.id, user.points
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        awarded = sum(executor.map(writer, [user_id] * args.threads, range(args.threads),
+                                   [args.writes] * args.threads))
+    elapsed = time.perf_counter() - started
+
+    with session_scope() as db:
+        final_points = db.query(User.points).filter(User.id == user_id).scalar()
+        ledger_points = fetch_balance(db, user_id)
+        drift = fetch_drift(db, user_id, user_id)
+        achievements = [name for (name,) in db.query(UserAchievement.achievement_name).filter(
+            UserAchievement.user_id == user_id
+        )]
+
+    writes = args.threads * args.writes
+    print(f"{writes:,} writes from {args.threads} threads in {elapsed:.2f}s ({writes / elapsed:,.0f}/s)")
+    print(f"expected {start_points + awarded:,} points, found {final_points:,}")
+    assert final_points == start_points + awarded, "points were lost"
+    assert ledger_points == final_points and not drift, f"ledger balance {ledger_points:,} drifted from the cache"
+    print(f"achievement rows: {dict(Counter(achievements))}")
+    print("no increments lost")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Benchmark suite: the calculator, every data-layer query and the map, saved as JSON.
+
+Run from the project root:
+
+    python -m benchmarks.suite [--users 500] [--activities 100] [--output results.json]
+    python -m benchmarks.suite --output after.json --compare before.json [--threshold 1.25]
+
+Loads benchmarks.synthetic_data into a scratch SQLite database (or into
+DATABASE_URL, e.g. a local PostgreSQL, reusing synthetic users already
+there), then times each case a number of times and records the median,
+95th percentile and fastest run in milliseconds. Data-layer cases run for
+users drawn across the synthetic population; writes are rolled back so
+runs do not change the data. With --compare, any case whose median is more
+than --threshold times the baseline's is reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# models reads DATABASE_URL at import time, so point it at a scratch database first
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'suite.db'))
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+import leaderboard
+from benchmarks import synthetic_data
+from carbon_calculator import (
+    calculate_batch_emissions,
+    calculate_energy_emissions,
+    calculate_food_emissions,
+    calculate_transport_emissions,
+    score_activity_frame
+)
+from gamification import fetch_achievement_metrics
+from map_data import OahuMapCache, create_oahu_map, get_activity_locations, get_bus_routes, get_store_locations
+from models import SessionLocal, User, bootstrap_schema, engine
+from points_ledger import fetch_balance
+from services import (
+    fetch_bus_rides,
+    fetch_category_breakdown,
+    fetch_daily_emissions,
+    fetch_emissions_summary,
+    fetch_leaderboard,
+    fetch_new_activities,
+    fetch_rank,
+    fetch_user_achievements,
+    fetch_user_profile,
+    get_or_create_user,
+    record_activity,
+    record_bus_ride
+)
+
+BATCH_ROWS = 1_000_000
+SCALAR_CALLS = 10_000
+
+
+def measure(case, repeats):
+    """Time case() repeats times, after one warm-up call, and summarize in ms."""
+    case()  # warm caches and lazy imports
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        case()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': float(np.median(timings)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'min_ms': float(min(timings)),
+        'runs': repeats
+    }
+
+
+def calculator_cases():
+    rng = np.random.default_rng(0)
+    types, subtypes, quantities, dates, _, _ = synthetic_data.synthetic_activities(rng, BATCH_ROWS, 365, datetime.now())
+    frame = pd.DataFrame({'activity_type': pd.Categorical(types), 'subtype': subtypes,
+                          'quantity': quantities, 'timestamp': pd.to_datetime(dates)})
+
+    def scalar_calls(function, *args):
+        def case():
+            for _ in range(SCALAR_CALLS):
+                function(*args)
+        return case
+
+    return {
+        f'calculator.transport_emissions x{SCALAR_CALLS:,}': scalar_calls(calculate_transport_emissions, 'bus', 4.2),
+        f'calculator.food_emissions x{SCALAR_CALLS:,}': scalar_calls(calculate_food_emissions, 'vegan', 2),
+        f'calculator.energy_emissions x{SCALAR_CALLS:,}': scalar_calls(calculate_energy_emissions, 12.5),
+        'calculator.energy_emissions_at_time': lambda: calculate_energy_emissions(12.5, datetime(2024, 6, 1, 13)),
+        f'calculator.batch_emissions {BATCH_ROWS:,} rows': lambda: calculate_batch_emissions(types, subtypes, quantities),
+        f'calculator.score_activity_frame {BATCH_ROWS:,} rows': lambda: score_activity_frame(frame)
+    }
+
+
+def data_cases(db, user_ids):
+    """One case per data-layer query; each call moves on to the next sample user."""
+    users = iter(np.resize(user_ids, 1_000_000).tolist())
+    month_ago = datetime.now() - timedelta(days=30)
+    username = db.execute(select(User.username).where(User.id == user_ids[0])).scalar_one()
+
+    def for_next_user(query):
+        return lambda: query(next(users))
+
+    def rolled_back(write):
+        def case():
+            try:
+                write(next(users))
+            finally:
+                db.rollback()
+        return case
+
+    def uncached_leaderboard():
+        leaderboard.invalidate()
+        return fetch_leaderboard(db)
+
+    return {
+        'data.get_or_create_user': lambda: get_or_create_user(db, username),
+        'data.fetch_new_activities (full history)': for_next_user(lambda user_id: list(fetch_new_activities(db, user_id))),
+        'data.fetch_emissions_summary': for_next_user(lambda user_id: fetch_emissions_summary(db, user_id)),
+        'data.fetch_daily_emissions (30 days)': for_next_user(lambda user_id: fetch_daily_emissions(db, user_id, month_ago)),
+        'data.fetch_daily_emissions (all)': for_next_user(lambda user_id: fetch_daily_emissions(db, user_id)),
+        **{
+            f'data.fetch_category_breakdown {activity_type}': for_next_user(
+                lambda user_id, activity_type=activity_type: fetch_category_breakdown(db, user_id, activity_type, month_ago)
+            )
+            for activity_type in ('transport', 'food', 'energy')
+        },
+        'data.fetch_leaderboard (uncached)': uncached_leaderboard,
+        'data.fetch_leaderboard (cached)': lambda: fetch_leaderboard(db),
+        'data.fetch_rank': for_next_user(lambda user_id: fetch_rank(db, user_id)),
+        'data.fetch_user_achievements': for_next_user(lambda user_id: fetch_user_achievements(db, user_id)),
+        'data.fetch_achievement_metrics': for_next_user(lambda user_id: fetch_achievement_metrics(db, user_id)),
+        'data.fetch_balance': for_next_user(lambda user_id: fetch_balance(db, user_id)),
+        'data.fetch_user_profile': for_next_user(lambda user_id: fetch_user_profile(db, user_id)),
+        'data.fetch_bus_rides': for_next_user(lambda user_id: fetch_bus_rides(db, user_id)),
+        'data.record_activity (rolled back)': rolled_back(lambda user_id: record_activity(
+            db, user_id, 'transport', {'type': 'bike', 'distance': 3.0}, 0.0, 15)),
+        'data.record_bus_ride (rolled back)': rolled_back(lambda user_id: record_bus_ride(
+            db, user_id, 'Route 13 - Liliha', 2.8, 40))
+    }
+
+
+def map_cases():
+    routes, activities, stores = get_bus_routes(), get_activity_locations(), get_store_locations()
+    cache = OahuMapCache(routes, activities, stores)
+    return {
+        'map.create_oahu_map (build + render)': lambda: create_oahu_map(500, routes, activities, stores)._repr_html_(),
+        'map.OahuMapCache.html (cached)': lambda: cache.html(500)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print each case against the baseline; return the names of regressions."""
+    regressions = []
+    print(f"\n{'case':<52} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<52} {'-':>10} {result['median_ms']:>10.3f} {'new':>7}")
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<52} {before['median_ms']:>10.3f} {result['median_ms']:>10.3f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--activities', type=int, default=100, help="mean activities per synthetic user")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--sample-users', type=int, default=50, help="users the data-layer cases rotate through")
+    parser.add_argument('--only', help="run only cases whose name contains this")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=1.25, help="median slowdown counted as a regression")
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    db = SessionLocal()
+    existing = synthetic_data.count_synthetic_users(db)
+    if existing < args.users:
+        print(f"Loading {args.users - existing:,} synthetic users...", flush=True)
+        db.close()
+        synthetic_data.generate(args.users - existing, args.activities)
+        db = SessionLocal()
+    user_ids = synthetic_data.fetch_synthetic_user_ids(db)
+    sample = np.random.default_rng(0).choice(user_ids, min(args.sample_users, len(user_ids)), replace=False).tolist()
+
+    cases = {**calculator_cases(), **data_cases(db, sample), **map_cases()}
+    results = {}
+    for name, case in cases.items():
+        if args.only and args.only not in name:
+            continue
+        # The slow cases get fewer repeats
+        repeats = args.repeats if not name.startswith(('calculator.batch', 'calculator.score', 'map.create')) else 5
+        results[name] = measure(case, repeats)
+        print(f"{name:<52} median {results[name]['median_ms']:>10.3f} ms   p95 {results[name]['p95_ms']:>10.3f} ms",
+              flush=True)
+    db.close()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': engine.dialect.name,
+            'users': len(user_ids),
+            'repeats': args.repeats
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold}x the baseline median")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Load a synthetic user base into the database for benchmarks.
+
+Run from the project root, against SQLite or a local PostgreSQL:
+
+    DATABASE_URL=sqlite:///synthetic.db python -m benchmarks.synthetic_data [--users 1000] [--activities 200]
+    DATABASE_URL=postgresql://localhost/carbon_bench python -m benchmarks.synthetic_data
+
+Users get a long-tailed number of activities (--activities is the mean)
+spread over the last --days days, weighted towards recent days and the
+hours people commute and eat. Emissions and points follow the same
+calculator and award rules as the app, so every derived table is
+consistent: the daily emissions rollup, the points ledger and snapshots,
+users.points, bus rides and the achievements the rules engine grants.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+# models reads DATABASE_URL at import time; without one, load a file next to the caller
+os.environ.setdefault('DATABASE_URL', 'sqlite:///synthetic.db')
+
+import numpy as np
+from sqlalchemy import func, insert, select
+
+from carbon_calculator import FOOD_EMISSIONS_FACTORS, calculate_batch_emissions
+from gamification import (
+    LOW_ENERGY_KWH,
+    aggregate_achievement_counters,
+    backfill_achievements,
+    upsert_achievement_counters
+)
+from map_data import get_bus_routes
+from models import Activity, BusRide, PointsLedger, User, bootstrap_schema, session_scope
+from points_ledger import take_snapshots
+from rollups import aggregate_daily_emissions, upsert_daily_emissions
+
+USERS_PER_CHUNK = 200
+USERNAME_PREFIX = 'synthetic'
+
+ACTIVITY_TYPES = {'transport': 0.5, 'food': 0.35, 'energy': 0.15}
+TRANSPORT_TYPES = {'car': 0.55, 'bus': 0.15, 'walk': 0.12, 'bike': 0.1, 'electric_vehicle': 0.08}
+FOOD_TYPES = {'meat': 0.4, 'fish': 0.15, 'vegetarian': 0.3, 'vegan': 0.15}
+# Relative activity by hour of day: commutes and meals
+HOUR_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 5, 9, 8, 4, 3, 5, 8, 5, 3, 3, 5, 9, 9, 7, 5, 4, 3, 2], dtype=float)
+
+
+def _choice(rng, weights: dict, size):
+    return rng.choice(list(weights), size, p=list(weights.values()))
+
+
+def synthetic_activities(rng, n, days, now):
+    """Columns for n activities: type, subtype, quantity, date, emissions and points."""
+    days_ago = np.minimum(rng.exponential(days / 3, n), days - 1).astype(int)
+    hours = rng.choice(24, n, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = rng.integers(0, 3600, n)
+    midnight = np.datetime64(now.date(), 's')
+    dates = midnight - days_ago.astype('timedelta64[D]') + (hours * 3600 + seconds).astype('timedelta64[s]')
+    dates = np.minimum(dates, np.datetime64(now, 's'))
+
+    types = _choice(rng, ACTIVITY_TYPES, n)
+    transport = types == 'transport'
+    food = types == 'food'
+    energy = types == 'energy'
+    subtypes = np.full(n, None, dtype=object)
+    subtypes[transport] = _choice(rng, TRANSPORT_TYPES, transport.sum())
+    subtypes[food] = _choice(rng, FOOD_TYPES, food.sum())
+    quantities = np.zeros(n)
+    quantities[transport] = np.round(rng.lognormal(1.3, 0.8, transport.sum()), 1)
+    quantities[food] = rng.integers(1, 4, food.sum())
+    quantities[energy] = np.round(rng.lognormal(2.3, 0.6, energy.sum()), 1)
+
+    emissions, bonus = calculate_batch_emissions(types, subtypes, quantities)
+
+    # The same awards as the Track Activities page
+    points = np.zeros(n)
+    points[transport] = np.trunc(bonus[transport] * 100)
+    plant_based = food & np.isin(subtypes, ['vegetarian', 'vegan'])
+    points[plant_based] = np.trunc((quantities[plant_based] * FOOD_EMISSIONS_FACTORS['meat'] - emissions[plant_based]) * 10)
+    low_energy = energy & (quantities < LOW_ENERGY_KWH)
+    points[low_energy] = np.trunc(emissions[low_energy] * 10)
+
+    return types, subtypes, quantities, dates.astype('datetime64[us]').tolist(), emissions, points.astype(int)
+
+
+def _details(activity_type, subtype, quantity) -> dict:
+    if activity_type == 'transport':
+        return {'type': subtype, 'distance': quantity}
+    if activity_type == 'food':
+        return {'type': subtype, 'portions': int(quantity)}
+    return {'kwh': quantity}
+
+
+def load_chunk(db, rng, first_index, n_users, activities_per_user, bus_rides_per_user, days, now, routes):
+    """Insert one chunk of users with their activities, rides, ledger and rollup rows."""
+    counts = np.maximum(1, rng.lognormal(np.log(activities_per_user) - 0.32, 0.8, n_users)).astype(int)
+    owners = np.repeat(np.arange(n_users), counts)
+    types, subtypes, quantities, dates, emissions, points = synthetic_activities(rng, len(owners), days, now)
+
+    ride_counts = rng.poisson(bus_rides_per_user, n_users)
+    ride_owners = np.repeat(np.arange(n_users), ride_counts)
+    ride_routes = rng.integers(len(routes), size=len(ride_owners))
+    ride_dates = synthetic_activities(rng, len(ride_owners), days, now)[3]
+
+    totals = np.bincount(owners, weights=points, minlength=n_users)
+    totals += np.bincount(ride_owners, weights=[routes[r]['points_per_ride'] for r in ride_routes.tolist()],
+                          minlength=n_users)
+    usernames = [f"{USERNAME_PREFIX}_{first_index + i}" for i in range(n_users)]
+    db.execute(insert(User), [
+        {'username': username, 'points': int(total)} for username, total in zip(usernames, totals.tolist())
+    ])
+    ids = dict(db.execute(select(User.username, User.id).where(User.username.in_(usernames))).all())
+    user_ids = [ids[username] for username in usernames]
+
+    activity_rows = []
+    ledger_rows = []
+    for owner, activity_type, subtype, quantity, date, emission, earned in zip(
+            owners.tolist(), types.tolist(), subtypes.tolist(), quantities.tolist(), dates,
+            emissions.tolist(), points.tolist()):
+        details = _details(activity_type, subtype, quantity)
+        user_id = user_ids[owner]
+        activity_rows.append({
+            'user_id': user_id,
+            'activity_type': activity_type,
+            'details': json.dumps(details),
+            'emissions': emission,
+            'date': date,
+            'transport_type': subtype if activity_type == 'transport' else None,
+            'distance': quantity if activity_type == 'transport' else None,
+            'food_type': subtype if activity_type == 'food' else None,
+            'portions': int(quantity) if activity_type == 'food' else None,
+            'kwh': quantity if activity_type == 'energy' else None
+        })
+        if earned:
+            ledger_rows.append({'user_id': user_id, 'points': earned, 'source': 'activity', 'created_at': date})
+
+    ride_rows = []
+    for owner, route, date in zip(ride_owners.tolist(), ride_routes.tolist(), ride_dates):
+        route = routes[route]
+        ride_rows.append({'user_id': user_ids[owner], 'route_name': route['name'], 'distance': route['distance'],
+                          'points_earned': route['points_per_ride'], 'date': date})
+        ledger_rows.append({'user_id': user_ids[owner], 'points': route['points_per_ride'],
+                            'source': 'bus_ride', 'created_at': date})
+
+    db.execute(insert(Activity), activity_rows)
+    if ride_rows:
+        db.execute(insert(BusRide), ride_rows)
+    # Ledger ids follow time order within each user, like entries appended live
+    ledger_rows.sort(key=lambda row: row['created_at'])
+    if ledger_rows:
+        db.execute(insert(PointsLedger), ledger_rows)
+    upsert_daily_emissions(db, aggregate_daily_emissions(activity_rows))
+    upsert_achievement_counters(db, aggregate_achievement_counters(activity_rows))
+    take_snapshots(db, user_ids)
+    return len(activity_rows), len(ride_rows)
+
+
+def _is_synthetic():
+    return User.username.like(f"{USERNAME_PREFIX}\\_%", escape='\\')
+
+
+def count_synthetic_users(db) -> int:
+    return db.execute(select(func.count(User.id)).where(_is_synthetic())).scalar_one()
+
+
+def fetch_synthetic_user_ids(db) -> list:
+    return db.execute(select(User.id).where(_is_synthetic()).order_by(User.id)).scalars().all()
+
+
+def generate(users: int = 1000, activities_per_user: int = 200, bus_rides_per_user: float = 10,
+             days: int = 365, seed: int = 0, progress=None) -> dict:
+    """Load synthetic users after any already loaded; returns row counts."""
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    routes = get_bus_routes()
+    with session_scope() as db:
+        first_index = count_synthetic_users(db)
+
+    loaded = {'users': 0, 'activities': 0, 'bus_rides': 0}
+    for start in range(0, users, USERS_PER_CHUNK):
+        n_users = min(USERS_PER_CHUNK, users - start)
+        with session_scope() as db:
+            activities, rides = load_chunk(db, rng, first_index + start, n_users, activities_per_user,
+                                           bus_rides_per_user, days, now, routes)
+        loaded['users'] += n_users
+        loaded['activities'] += activities
+        loaded['bus_rides'] += rides
+        if progress:
+            progress(loaded)
+
+    loaded['achievements'] = backfill_achievements()
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--activities', type=int, default=200, help="mean activities per user")
+    parser.add_argument('--bus-rides', type=float, default=10, help="mean bus rides per user")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    started = time.perf_counter()
+    loaded = generate(
+        args.users, args.activities, args.bus_rides, args.days, args.seed,
+        progress=lambda loaded: print(f"{loaded['users']:,} users, {loaded['activities']:,} activities", flush=True)
+    )
+    print(f"Loaded {loaded['users']:,} users, {loaded['activities']:,} activities, {loaded['bus_rides']:,} bus rides "
+          f"and {loaded['achievements']:,} achievements in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""Bulk import of historical activity logs from CSV or JSON Lines files.
+
+Each record describes one activity:
+
+    username, date, activity_type, type, distance, portions, kwh
+
+where activity_type is 'transport', 'food' or 'energy' and the remaining
+columns mirror the details logged from the Track Activities page (date is
+ISO 8601 and defaults to the import time). Records with an unknown type or
+a negative or non-finite quantity are rejected. Energy records whose date
+includes a time of day are scored at the grid's carbon intensity for that
+hour; the rest use the average factor. Files are streamed in fixed-size
+chunks, scored with carbon_calculator and written with multi-row inserts,
+or COPY on PostgreSQL, along with their daily emissions rollup increments.
+Imported history does not award points.
+
+Progress is checkpointed in the same transaction as each chunk, so an
+interrupted import resumes after the last committed chunk:
+
+    python bulk_import.py partner_trips.csv [--chunk-size 10000]
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import time
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from carbon_calculator import FOOD_EMISSIONS_FACTORS, TRANSPORT_EMISSIONS_FACTORS, calculate_batch_emissions
+from gamification import aggregate_achievement_counters, upsert_achievement_counters
+from models import Activity, ImportCheckpoint, User, activity_detail_columns, bootstrap_schema, session_scope
+from rollups import aggregate_daily_emissions, upsert_daily_emissions
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Which record field holds the quantity for each activity type
+QUANTITY_FIELDS = {
+    'transport': 'distance',
+    'food': 'portions',
+    'energy': 'kwh'
+}
+
+# The subtypes each activity type can be scored for; energy has none
+SUBTYPES = {
+    'transport': TRANSPORT_EMISSIONS_FACTORS,
+    'food': FOOD_EMISSIONS_FACTORS
+}
+
+ACTIVITY_COLUMNS = [
+    'user_id', 'activity_type', 'details', 'emissions', 'date',
+    'transport_type', 'distance', 'food_type', 'portions', 'kwh'
+]
+
+def iter_records(path: str, file_format: str = None):
+    """Stream records from a CSV or JSON Lines file as dicts.
+
+    A JSON Lines line that is not a JSON object yields None rather than
+    raising, so it is still counted as a row, and rejected, and checkpoints
+    stay in step with the file.
+    """
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None
+                yield record if isinstance(record, dict) else None
+
+def _parse_record(record: dict, imported_at: datetime):
+    """Normalize one record, or return None when it cannot be imported."""
+    if not isinstance(record, dict):
+        return None
+    activity_type = str(record.get('activity_type') or '').strip().lower()
+    quantity_field = QUANTITY_FIELDS.get(activity_type)
+    username = record.get('username')
+    if not quantity_field or not username:
+        return None
+
+    date_text = str(record.get('date') or '').strip()
+    try:
+        quantity = float(record[quantity_field])
+        date = datetime.fromisoformat(date_text) if date_text else imported_at
+    except (KeyError, TypeError, ValueError):
+        return None
+    # Negative or non-finite quantities would import negative or NaN emissions
+    if not math.isfinite(quantity) or quantity < 0:
+        return None
+
+    subtype = None
+    if activity_type in SUBTYPES:
+        subtype = str(record.get('type') or '').strip().lower()
+        if subtype not in SUBTYPES[activity_type]:
+            return None
+    if activity_type == 'transport':
+        details = {"type": subtype, "distance": quantity}
+    elif activity_type == 'food':
+        quantity = int(quantity)
+        details = {"type": subtype, "portions": quantity}
+    else:
+        details = {"kwh": quantity}
+
+    return {
+        'username': str(username),
+        'activity_type': activity_type,
+        'subtype': subtype,
+        'quantity': quantity,
+        'details': details,
+        'date': date,
+        # Only a recorded time of day says when energy was used
+        'used_at': date.replace(tzinfo=None) if len(date_text) > 10 else None
+    }
+
+def _resolve_user_ids(db: Session, usernames: set, cache: dict) -> dict:
+    """Map usernames to ids, creating the users that do not exist yet."""
+    missing = usernames - cache.keys()
+    if missing:
+        for user_id, username in db.execute(select(User.id, User.username).where(User.username.in_(missing))):
+            cache[username] = user_id
+        new_users = missing - cache.keys()
+        if new_users:
+            db.execute(insert(User), [{'username': username, 'points': 0} for username in new_users])
+            for user_id, username in db.execute(select(User.id, User.username).where(User.username.in_(new_users))):
+                cache[username] = user_id
+    return cache
+
+def _copy_activities(db: Session, rows: list):
+    """Write rows with PostgreSQL COPY on the session's own connection and transaction."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in ACTIVITY_COLUMNS])
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY activities ({', '.join(ACTIVITY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def _write_chunk(db: Session, records: list, user_ids: dict):
+    """Score a chunk of parsed records and insert them as activities."""
+    emissions, _ = calculate_batch_emissions(
+        [r['activity_type'] for r in records],
+        [r['subtype'] for r in records],
+        [r['quantity'] for r in records],
+        [r['used_at'] for r in records]
+    )
+    rows = []
+    for r, e in zip(records, emissions):
+        row = dict.fromkeys(ACTIVITY_COLUMNS)
+        row.update(
+            user_id=user_ids[r['username']],
+            activity_type=r['activity_type'],
+            details=json.dumps(r['details']),
+            emissions=float(e),
+            date=r['date'],
+            **activity_detail_columns(r['activity_type'], r['details'])
+        )
+        rows.append(row)
+
+    if db.get_bind().dialect.name == 'postgresql':
+        _copy_activities(db, rows)
+    else:
+        db.execute(insert(Activity), rows)
+    upsert_daily_emissions(db, aggregate_daily_emissions(rows))
+    upsert_achievement_counters(db, aggregate_achievement_counters(rows))
+
+def import_activities(path: str, source: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      file_format: str = None, progress=None) -> dict:
+    """Import an activity log file, resuming from its checkpoint if one exists.
+
+    progress, if given, is called with the running report after every chunk.
+    Returns a report with rows read, imported and rejected, and rows per second.
+    """
+    source = source or os.path.abspath(path)
+    with session_scope() as db:
+        checkpoint = db.get(ImportCheckpoint, source)
+        resumed_from = checkpoint.rows_done if checkpoint else 0
+
+    report = {
+        'source': source,
+        'resumed_from': resumed_from,
+        'rows_read': 0,
+        'rows_imported': 0,
+        'rows_rejected': 0,
+        'seconds': 0.0,
+        'rows_per_second': 0.0
+    }
+    user_ids = {}
+    imported_at = datetime.now()
+    started = time.perf_counter()
+
+    # Skip what earlier runs already committed, then work one chunk at a time
+    records = islice(iter_records(path, file_format), resumed_from, None)
+    rows_done = resumed_from
+    while True:
+        raw_chunk = list(islice(records, chunk_size))
+        if not raw_chunk:
+            break
+
+        parsed = [_parse_record(record, imported_at) for record in raw_chunk]
+        valid = [record for record in parsed if record is not None]
+        rows_done += len(raw_chunk)
+
+        with session_scope() as db:
+            if valid:
+                _resolve_user_ids(db, {r['username'] for r in valid}, user_ids)
+                _write_chunk(db, valid, user_ids)
+            # The checkpoint commits with the chunk, so a crash never double-imports rows
+            db.merge(ImportCheckpoint(source=source, rows_done=rows_done))
+
+        report['rows_read'] += len(raw_chunk)
+        report['rows_imported'] += len(valid)
+        report['rows_rejected'] += len(raw_chunk) - len(valid)
+        report['seconds'] = time.perf_counter() - started
+        report['rows_per_second'] = report['rows_read'] / report['seconds'] if report['seconds'] else 0.0
+        if progress:
+            progress(report)
+
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import activity logs from CSV or JSON Lines.")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="defaults to the file extension")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--source', help="checkpoint key; defaults to the absolute file path")
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    def progress(report):
+        print(f"{report['rows_read']:>12,} rows  {report['rows_per_second']:>10,.0f} rows/s  "
+              f"{report['rows_rejected']:,} rejected", flush=True)
+
+    report = import_activities(args.path, args.source, args.chunk_size, args.format, progress)
+    if report['resumed_from']:
+        print(f"Resumed after {report['resumed_from']:,} previously imported rows")
+    print(f"Imported {report['rows_imported']:,} of {report['rows_read']:,} rows in "
+          f"{report['seconds']:.1f}s ({report['rows_per_second']:,.0f} rows/s)")
+
+if __name__ == '__main__':
+    main()
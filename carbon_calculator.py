@@ -1,43 +1,129 @@
-import pandas as pd
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from energy_data import HOURLY_DEMAND, HOURLY_RENEWABLE_SHARE
+
+# pandas is only needed by the batch and timestamp paths, so it is imported
+# there; the scalar calculators the pages use load without it
+if TYPE_CHECKING:
+    import pandas as pd
+
+TRANSPORT_EMISSIONS_FACTORS = {
+    'car': 0.25,      # kg CO2 per mile (gasoline car)
+    'bus': 0.15,      # kg CO2 per mile
+    'walk': 0,
+    'bike': 0,
+    'electric_vehicle': 0.05  # kg CO2 per mile
+}
+
+# Points system (negative for emissions, positive for eco-friendly choices)
+TRANSPORT_POINTS_FACTORS = {
+    'car': -0.25,
+    'bus': 0.15,      # Changed to positive to reward public transit
+    'walk': 0.05,     # Bonus points for walking
+    'bike': 0.05,     # Bonus points for biking
+    'electric_vehicle': -0.05
+}
+
+FOOD_EMISSIONS_FACTORS = {
+    'meat': 3.0,      # kg CO2 per portion
+    'fish': 1.34,     # kg CO2 per portion
+    'vegetarian': 0.5, # kg CO2 per portion
+    'vegan': 0.25     # kg CO2 per portion
+}
+
+HAWAII_ENERGY_FACTOR = 0.7  # kg CO2 per kWh (Hawaii-specific grid mix)
+
+# Emission factor of the fossil part of the grid, calibrated so that a typical
+# day's demand-weighted intensity still averages HAWAII_ENERGY_FACTOR
+_FOSSIL_SHARE = 1 - np.array(HOURLY_RENEWABLE_SHARE) / 100
+FOSSIL_ENERGY_FACTOR = HAWAII_ENERGY_FACTOR * sum(HOURLY_DEMAND) / float(np.dot(HOURLY_DEMAND, _FOSSIL_SHARE))
+
+# kg CO2 per kWh by local hour of a typical day
+HOURLY_CARBON_INTENSITY = FOSSIL_ENERGY_FACTOR * _FOSSIL_SHARE
+
+def intensity_from_renewable_share(renewable_percentage):
+    """Grid carbon intensity in kg CO2 per kWh at a renewable percentage (scalar or array)."""
+    return FOSSIL_ENERGY_FACTOR * (1 - np.asarray(renewable_percentage, dtype=np.float64) / 100)
+
+class CarbonIntensitySeries:
+    """Grid carbon intensity (kg CO2 per kWh) over time, as a step function.
+
+    Each value holds from its start time until the next start, for at most
+    step_seconds. Times are naive local datetimes, like activities.date.
+    Lookups are a single searchsorted over the sorted start times.
+    """
+
+    def __init__(self, start_times, intensities, step_seconds: int = 3600):
+        starts = _wall_clock_seconds(start_times)
+        order = np.argsort(starts, kind='stable')
+        self.starts = starts[order]
+        self.values = np.asarray(intensities, dtype=np.float64)[order]
+        # A value stops at the next start or after one step, whichever is first
+        self.ends = np.minimum(np.r_[self.starts[1:], np.inf], self.starts + step_seconds)
+
+    @classmethod
+    def from_renewable_share(cls, start_times, renewable_percentage, step_seconds: int = 3600):
+        """A series from measured renewable percentages, e.g. hourly grid telemetry."""
+        return cls(start_times, intensity_from_renewable_share(renewable_percentage), step_seconds)
+
+    def lookup(self, timestamps) -> np.ndarray:
+        return carbon_intensity(timestamps, self)
+
+def _wall_clock_seconds(timestamps) -> np.ndarray:
+    """Seconds since 1970-01-01 of wall-clock timestamps, NaN where missing."""
+    import pandas as pd
+
+    stamps = pd.DatetimeIndex(pd.to_datetime(timestamps if np.ndim(timestamps) else [timestamps]))
+    if stamps.tz is not None:
+        stamps = stamps.tz_localize(None)
+    seconds = stamps.as_unit('ns').asi8 / 1e9
+    seconds[stamps.isna()] = np.nan
+    return seconds
+
+def _intensity_at(seconds: np.ndarray, series: CarbonIntensitySeries = None) -> np.ndarray:
+    # Untimed rows get the daily average; timed rows their hour of a typical
+    # day, overridden by the series wherever it has a value
+    intensity = np.full(len(seconds), HAWAII_ENERGY_FACTOR)
+    timed = ~np.isnan(seconds)
+    hours = (np.floor(seconds[timed] / 3600) % 24).astype(np.int64)
+    intensity[timed] = HOURLY_CARBON_INTENSITY[hours]
+    if series is not None and len(series.starts):
+        # NaN sorts last and fails the end check, so untimed rows are never covered
+        index = np.searchsorted(series.starts, seconds, side='right') - 1
+        covered = (index >= 0) & (seconds < series.ends[np.maximum(index, 0)])
+        intensity[covered] = series.values[index[covered]]
+    return intensity
+
+def carbon_intensity(timestamps, series: CarbonIntensitySeries = None) -> np.ndarray:
+    """Grid carbon intensity in kg CO2 per kWh at each timestamp.
+
+    Uses series where it covers a timestamp and the typical-day hourly
+    profile elsewhere; missing timestamps get HAWAII_ENERGY_FACTOR.
+    """
+    return _intensity_at(_wall_clock_seconds(timestamps), series)
 
 def calculate_transport_emissions(transport_type: str, distance: float) -> tuple[float, float]:
     """Calculate carbon emissions and points from transportation."""
-    emissions_factors = {
-        'car': 0.25,      # kg CO2 per mile (gasoline car)
-        'bus': 0.15,      # kg CO2 per mile
-        'walk': 0,
-        'bike': 0,
-        'electric_vehicle': 0.05  # kg CO2 per mile
-    }
-
-    # Points system (negative for emissions, positive for eco-friendly choices)
-    points_factors = {
-        'car': -0.25,
-        'bus': 0.15,      # Changed to positive to reward public transit
-        'walk': 0.05,     # Bonus points for walking
-        'bike': 0.05,     # Bonus points for biking
-        'electric_vehicle': -0.05
-    }
-
-    emissions = distance * emissions_factors.get(transport_type, 0)
-    points = distance * points_factors.get(transport_type, 0)
+    emissions = distance * TRANSPORT_EMISSIONS_FACTORS.get(transport_type, 0)
+    points = distance * TRANSPORT_POINTS_FACTORS.get(transport_type, 0)
 
     return emissions, points
 
 def calculate_food_emissions(food_type: str, portions: int) -> float:
     """Calculate carbon emissions from food consumption."""
-    emissions_factors = {
-        'meat': 3.0,      # kg CO2 per portion
-        'fish': 1.34,     # kg CO2 per portion
-        'vegetarian': 0.5, # kg CO2 per portion
-        'vegan': 0.25     # kg CO2 per portion
-    }
-    return portions * emissions_factors.get(food_type, 0)
-
-def calculate_energy_emissions(kwh: float) -> float:
-    """Calculate carbon emissions from energy usage."""
-    hawaii_energy_factor = 0.7  # kg CO2 per kWh (Hawaii-specific grid mix)
-    return kwh * hawaii_energy_factor
+    return portions * FOOD_EMISSIONS_FACTORS.get(food_type, 0)
+
+def calculate_energy_emissions(kwh: float, timestamp=None, series: CarbonIntensitySeries = None) -> float:
+    """Calculate carbon emissions from energy usage.
+
+    Without a timestamp the grid's average factor is used; with one, the
+    carbon intensity of the grid at that time.
+    """
+    if timestamp is None:
+        return kwh * HAWAII_ENERGY_FACTOR
+    return kwh * float(carbon_intensity(timestamp, series)[0])
 
 def calculate_total_daily_emissions(activities: dict) -> tuple[float, float]:
     """Calculate total daily carbon emissions and points."""
@@ -64,4 +150,71 @@ def calculate_total_daily_emissions(activities: dict) -> tuple[float, float]:
     if 'energy' in activities:
         total_emissions += calculate_energy_emissions(activities['energy']['kwh'])
     
-    return total_emissions, total_points
\ No newline at end of file
+    return total_emissions, total_points
+
+def _factorize(values) -> tuple[np.ndarray, list]:
+    """Integer codes and distinct values for a column, reusing categorical codes when present."""
+    import pandas as pd
+
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        categorical = pd.Categorical(values)
+        return categorical.codes, list(categorical.categories)
+    # Missing values get code -1, which _factor_tables maps to its last row/column
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return codes, list(uniques)
+
+def _factor_tables(activity_types: list, subtypes: list) -> tuple[np.ndarray, np.ndarray]:
+    """Emissions and points factors for every (activity type, subtype) code pair."""
+    # The extra last row/column is indexed by missing values (code -1); a
+    # missing activity type scores zero, a missing subtype scores like None
+    emissions = np.zeros((len(activity_types) + 1, len(subtypes) + 1), dtype=np.float64)
+    points = np.zeros_like(emissions)
+    for i, activity_type in enumerate(activity_types):
+        for j, subtype in enumerate(subtypes + [None]):
+            if activity_type == 'transport':
+                emissions[i, j] = TRANSPORT_EMISSIONS_FACTORS.get(subtype, 0)
+                points[i, j] = TRANSPORT_POINTS_FACTORS.get(subtype, 0)
+            elif activity_type == 'food':
+                emissions[i, j] = FOOD_EMISSIONS_FACTORS.get(subtype, 0)
+            elif activity_type == 'energy':
+                emissions[i, j] = HAWAII_ENERGY_FACTOR
+    return emissions, points
+
+def calculate_batch_emissions(activity_types, subtypes, quantities, timestamps=None,
+                              series: CarbonIntensitySeries = None) -> tuple[np.ndarray, np.ndarray]:
+    """Score many activities at once from columnar inputs.
+
+    activity_types holds 'transport', 'food' or 'energy'; subtypes the transport
+    or food type (ignored for energy); quantities the miles, portions or kWh.
+    With timestamps, energy rows are scored at the grid's carbon intensity at
+    their time (missing timestamps use the average factor).
+    Returns (emissions, points) arrays matching the scalar functions row for row.
+    Like calculate_total_daily_emissions, only transport earns points here.
+    """
+    quantities = np.asarray(quantities, dtype=np.float64)
+
+    # Hash each distinct string once, then score every row with array indexing
+    type_codes, type_uniques = _factorize(activity_types)
+    subtype_codes, subtype_uniques = _factorize(subtypes)
+    emissions_table, points_table = _factor_tables(type_uniques, subtype_uniques)
+
+    emissions = quantities * emissions_table[type_codes, subtype_codes]
+    points = quantities * points_table[type_codes, subtype_codes]
+
+    if timestamps is not None and 'energy' in type_uniques:
+        energy = type_codes == type_uniques.index('energy')
+        seconds = _wall_clock_seconds(timestamps)
+        emissions[energy] = quantities[energy] * _intensity_at(seconds[energy], series)
+
+    return emissions, points
+
+def score_activity_frame(df: 'pd.DataFrame', series: CarbonIntensitySeries = None) -> 'pd.DataFrame':
+    """Add 'emissions' and 'points' columns to a frame with activity_type, subtype and quantity columns.
+
+    An optional 'timestamp' column scores energy rows by time of use.
+    """
+    emissions, points = calculate_batch_emissions(
+        df['activity_type'], df['subtype'], df['quantity'],
+        df['timestamp'] if 'timestamp' in df.columns else None, series
+    )
+    return df.assign(emissions=emissions, points=points)
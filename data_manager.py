@@ -1,178 +1,133 @@
-import pandas as pd
+"""Streamlit-facing data access: thin wrappers over services for the current session's user.
+
+Each wrapper opens a unit of work, calls the headless service with
+st.session_state.user_id and keeps the session's cached points in step.
+"""
 from datetime import datetime, timedelta
+
 import streamlit as st
-from sqlalchemy.orm import Session
-from models import User, Activity, UserAchievement, get_db, BusRide # Assuming BusRide model exists
-import os
-
-def get_or_create_user(db: Session, username: str):
-    """Get existing user or create new one."""
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        user = User(username=username)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    return user
+
+import services
+from models import bootstrap_schema, session_scope
+from profile_pictures import load_profile_image
+
+@st.cache_resource
+def ensure_schema():
+    """Bootstrap the database schema once per server process."""
+    return bootstrap_schema()
 
 def initialize_session_state():
     """Initialize session state variables."""
+    ensure_schema()
     if 'username' not in st.session_state:
         st.session_state.username = "default_user"
-    if 'user_data' not in st.session_state:
-        st.session_state.user_data = pd.DataFrame(columns=['date', 'activity_type', 'details', 'emissions'])
-
-    # Get user from database
-    db = next(get_db())
-    user = get_or_create_user(db, st.session_state.username)
-    st.session_state.user_id = user.id
-    st.session_state.points = user.points
-
-    # Update user_data from database
-    activities = db.query(Activity).filter(Activity.user_id == user.id).all()
-    if activities:
-        data = []
-        for activity in activities:
-            data.append({
-                'date': activity.date,
-                'activity_type': activity.activity_type,
-                'details': activity.details,
-                'emissions': activity.emissions
-            })
-        st.session_state.user_data = pd.DataFrame(data)
+
+    with session_scope() as db:
+        # Get user from database
+        user = services.get_or_create_user(db, st.session_state.username)
+        st.session_state.user_id = user.id
+        st.session_state.points = user.points
+
+def log_activity(activity_type: str, details: dict, emissions: float, points: int = 0, date: datetime = None):
+    """Log an activity with its points and achievements in one transaction; date defaults to now."""
+    with session_scope() as db:
+        new_points, new_achievements = services.record_activity(
+            db, st.session_state.user_id, activity_type, details, emissions, points, date
+        )
+    st.session_state.points = new_points
+    return new_achievements
 
 def add_activity(activity_type: str, details: dict, emissions: float):
     """Add a new activity to the database and session state."""
-    # Add to database
-    db = next(get_db())
-    activity = Activity(
-        user_id=st.session_state.user_id,
-        activity_type=activity_type,
-        details=str(details),
-        emissions=emissions
-    )
-    db.add(activity)
-    db.commit()
-
-    # Update session state data
-    new_activity = pd.DataFrame([{
-        'date': datetime.now(),
-        'activity_type': activity_type,
-        'details': str(details),
-        'emissions': emissions
-    }])
-    st.session_state.user_data = pd.concat([st.session_state.user_data, new_activity], ignore_index=True)
+    log_activity(activity_type, details, emissions)
 
 def get_emissions_summary():
     """Get summary statistics of emissions from database."""
-    db = next(get_db())
-    now = datetime.now()
-
-    activities = db.query(Activity).filter(
-        Activity.user_id == st.session_state.user_id
-    ).all()
-
-    daily = sum(a.emissions for a in activities if now - a.date <= timedelta(days=1))
-    weekly = sum(a.emissions for a in activities if now - a.date <= timedelta(days=7))
-    monthly = sum(a.emissions for a in activities if now - a.date <= timedelta(days=30))
-
-    return {
-        'daily': daily,
-        'weekly': weekly,
-        'monthly': monthly
-    }
+    with session_scope() as db:
+        return services.fetch_emissions_summary(db, st.session_state.user_id)
+
+def get_daily_emissions(days: int = None):
+    """Get the user's daily emissions trend, optionally limited to recent days."""
+    since = datetime.now() - timedelta(days=days) if days else None
+    with session_scope() as db:
+        return services.fetch_daily_emissions(db, st.session_state.user_id, since)
+
+def get_category_breakdown(activity_type: str, days: int = 30):
+    """Breakdown of the user's activities of one type over the last few days."""
+    with session_scope() as db:
+        return services.fetch_category_breakdown(
+            db, st.session_state.user_id, activity_type, datetime.now() - timedelta(days=days)
+        )
 
 def get_leaderboard_data():
     """Get leaderboard data from database."""
-    db = next(get_db())
-    users = db.query(User).order_by(User.points.desc()).limit(10).all()
-    return [{'name': user.username, 'points': user.points} for user in users]
-
-def update_user_points(points: int):
-    """Update user points in database and session state."""
-    db = next(get_db())
-    user = db.query(User).filter(User.id == st.session_state.user_id).first()
-    user.points += points
-    db.commit()
-    st.session_state.points = user.points
+    with session_scope() as db:
+        return services.fetch_leaderboard(db)
+
+def get_user_rank():
+    """Get the user's leaderboard rank."""
+    with session_scope() as db:
+        return services.fetch_rank(db, st.session_state.user_id)
+
+def update_user_points(points: int, source: str, reference=None):
+    """Update user points in database and session state; return any achievements unlocked."""
+    with session_scope() as db:
+        st.session_state.points, unlocked = services.award_user_points(
+            db, st.session_state.user_id, points, source, reference
+        )
+    return unlocked
 
 def add_achievement(achievement_name: str):
     """Add new achievement for user."""
-    db = next(get_db())
-    # Check if achievement already exists
-    existing = db.query(UserAchievement).filter(
-        UserAchievement.user_id == st.session_state.user_id,
-        UserAchievement.achievement_name == achievement_name
-    ).first()
-
-    if not existing:
-        achievement = UserAchievement(
-            user_id=st.session_state.user_id,
-            achievement_name=achievement_name
-        )
-        db.add(achievement)
-        db.commit()
+    with session_scope() as db:
+        services.add_user_achievement(db, st.session_state.user_id, achievement_name)
 
 def get_user_achievements():
     """Get user's achievements from database."""
-    db = next(get_db())
-    achievements = db.query(UserAchievement).filter(
-        UserAchievement.user_id == st.session_state.user_id
-    ).all()
-    return [achievement.achievement_name for achievement in achievements]
-
-def update_user_profile(display_name: str = None, description: str = None, profile_picture: str = None):
-    """Update user profile information."""
-    db = next(get_db())
-    user = db.query(User).filter(User.id == st.session_state.user_id).first()
-
-    if display_name:
-        user.display_name = display_name
-    if description:
-        user.description = description
-    if profile_picture:
-        user.profile_picture = profile_picture
-
-    db.commit()
-    db.refresh(user)
-    return user
+    with session_scope() as db:
+        return services.fetch_user_achievements(db, st.session_state.user_id)
+
+def update_user_profile(display_name: str = None, description: str = None, profile_picture: bytes = None):
+    """Update user profile information; profile_picture is the uploaded image file's bytes."""
+    with session_scope() as db:
+        return services.update_user_profile(
+            db, st.session_state.user_id, display_name, description, profile_picture
+        )
 
 def get_user_profile():
     """Get user profile information."""
-    db = next(get_db())
-    user = db.query(User).filter(User.id == st.session_state.user_id).first()
-    return {
-        'display_name': user.display_name or user.username,
-        'description': user.description or "No description provided",
-        'profile_picture': user.profile_picture,
-        'points': user.points
-    }
+    with session_scope() as db:
+        return services.fetch_user_profile(db, st.session_state.user_id)
+
+@st.cache_data(max_entries=256)
+def get_profile_picture(ref: str, size: str = 'large'):
+    """Thumbnail bytes for a profile picture reference."""
+    # References are content hashes, so a cached image can never go stale
+    with session_scope() as db:
+        return load_profile_image(db, ref, size)
 
 def add_bus_ride(route_name: str, distance: float, points_earned: int):
     """Add a bus ride record and award points."""
-    db = next(get_db())
-
-    # Create bus ride record
-    bus_ride = BusRide(
-        user_id=st.session_state.user_id,
-        route_name=route_name,
-        distance=distance,
-        points_earned=points_earned
-    )
-    db.add(bus_ride)
-
-    # Update user points
-    user = db.query(User).filter(User.id == st.session_state.user_id).first()
-    user.points += points_earned
-    st.session_state.points = user.points
-
-    db.commit()
+    with session_scope() as db:
+        st.session_state.points = services.record_bus_ride(
+            db, st.session_state.user_id, route_name, distance, points_earned
+        )
+
     return points_earned
 
+def record_detected_rides(rides) -> list:
+    """Store bus rides detected in a GPS trace and award their points.
+
+    Rides already stored from an earlier upload of the same trace are
+    skipped. Returns the rides stored, each with its points_earned.
+    """
+    with session_scope() as db:
+        stored, new_points = services.record_detected_rides(db, st.session_state.user_id, rides)
+    if new_points is not None:
+        st.session_state.points = new_points
+    return stored
+
 def get_user_bus_rides():
-    """Get user's bus ride history."""
-    db = next(get_db())
-    rides = db.query(BusRide).filter(
-        BusRide.user_id == st.session_state.user_id
-    ).order_by(BusRide.date.desc()).all()
-    return rides
\ No newline at end of file
+    """Get user's bus ride history as dicts with date, route_name, distance and points_earned."""
+    with session_scope() as db:
+        return services.fetch_bus_rides(db, st.session_state.user_id)
@@ -1,3 +1,4 @@
+import math
 import random
 from datetime import datetime, timedelta
 
@@ -21,6 +22,60 @@ def get_real_time_energy_data():
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
 
+SOLAR_CAPACITY = 450  # MW at clear-sky noon
+WIND_MEAN = 100  # MW
+MEAN_CLOUD_COVER = 0.3
+
+def solar_output(hour: float, cloud: float = MEAN_CLOUD_COVER) -> float:
+    """Solar generation in MW at a local hour of day."""
+    daylight = max(math.sin(math.pi * (hour - 6) / 12), 0.0) if 6 <= hour <= 18 else 0.0
+    return SOLAR_CAPACITY * daylight * (1 - cloud)
+
+def grid_demand(hour: float) -> float:
+    """Grid demand in MW at a local hour of day: a morning shoulder and an evening peak after sunset."""
+    return 950 + 80 * math.exp(-((hour - 8) / 2) ** 2) + 220 * math.exp(-((hour - 19) / 2.5) ** 2)
+
+def typical_renewable_share(hour: float) -> float:
+    """Renewable percentage of an average day at a local hour."""
+    return (solar_output(hour) + WIND_MEAN) / grid_demand(hour) * 100
+
+# Typical-day renewable percentage and demand by hour, averaged over each hour
+HOURLY_RENEWABLE_SHARE = [sum(typical_renewable_share(h + m / 60) for m in range(60)) / 60 for h in range(24)]
+HOURLY_DEMAND = [sum(grid_demand(h + m / 60) for m in range(60)) / 60 for h in range(24)]
+
+class GridSimulator:
+    """Stand-in for a live Hawaii grid feed with a daily solar and demand cycle.
+
+    Cloud cover drifts slowly instead of jumping between readings, so a series
+    of samples looks like a real trend. Called with a datetime it returns the
+    reading for that moment, which is how history is backfilled.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.cloud = MEAN_CLOUD_COVER
+        self.wind = WIND_MEAN
+
+    def __call__(self, when=None):
+        when = when or datetime.now()
+        hour = when.hour + when.minute / 60 + when.second / 3600
+
+        # Mean-reverting random walks, so consecutive readings stay close
+        self.cloud = min(max(self.cloud + 0.05 * (MEAN_CLOUD_COVER - self.cloud) + self.rng.gauss(0, 0.01), 0.0), 0.9)
+        self.wind = max(self.wind + 0.05 * (WIND_MEAN - self.wind) + self.rng.gauss(0, 2), 0.0)
+
+        solar_contribution = solar_output(hour, self.cloud)
+        total_demand = grid_demand(hour)
+        renewable_percentage = ((solar_contribution + self.wind) / total_demand) * 100
+
+        return {
+            'total_demand': round(total_demand, 2),
+            'solar_contribution': round(solar_contribution, 2),
+            'wind_contribution': round(self.wind, 2),
+            'renewable_percentage': round(renewable_percentage, 2),
+            'timestamp': when.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
 def get_local_activities():
     """Return current local sustainability activities in Hawaii."""
     return [
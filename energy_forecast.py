@@ -0,0 +1,129 @@
+"""Renewable share forecast for the next day, and the cleanest hours to use power.
+
+The forecaster keeps two time-weighted EWMAs, both updated in O(1) per
+reading: a seasonal hour-of-day profile of the renewable percentage, and
+the current departure from that profile (passing clouds, a windy spell).
+A forecast is the profile for each coming hour plus the departure, fading
+out over RESIDUAL_PERSISTENCE. The profile starts from energy_data's
+typical day, so forecasts are sensible before any readings arrive.
+
+The forecaster listens to the telemetry sampler, so nothing is recomputed
+from history on Streamlit reruns; answering a query costs microseconds.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import accumulate
+
+import streamlit as st
+
+from energy_data import HOURLY_RENEWABLE_SHARE
+from telemetry import get_grid_telemetry
+
+PROFILE_TIME_CONSTANT = 3 * 3600    # seconds of readings within one hour's bin, i.e. about three days
+RESIDUAL_TIME_CONSTANT = 15 * 60    # smoothing of the current departure from the profile
+RESIDUAL_PERSISTENCE = 3 * 3600     # how long a departure is expected to last
+MAX_SAMPLE_GAP = 3600               # longer gaps weigh a reading as if one hour had passed
+FORECAST_HOURS = 24
+SEED_SECONDS = 7 * 24 * 3600
+
+class RenewableForecaster:
+    """Incremental forecaster of the grid's renewable percentage by hour."""
+
+    def __init__(self, profile=HOURLY_RENEWABLE_SHARE):
+        self.profile = list(profile)
+        self.residual = 0.0
+        self.last_time = None
+        self.observations = 0
+        self._lock = threading.Lock()
+
+    def update(self, timestamp: float, renewable_percentage: float):
+        """Fold in one reading taken at timestamp (epoch seconds); older readings are ignored."""
+        hour = time.localtime(timestamp).tm_hour
+        with self._lock:
+            if self.last_time is not None and timestamp <= self.last_time:
+                return
+            elapsed = MAX_SAMPLE_GAP if self.last_time is None else min(timestamp - self.last_time, MAX_SAMPLE_GAP)
+            self.last_time = timestamp
+            # Weights scale with the time a reading covers, so the sampling
+            # rate does not change how much history is remembered
+            self.profile[hour] += (1 - math.exp(-elapsed / PROFILE_TIME_CONSTANT)) * (
+                renewable_percentage - self.profile[hour])
+            departure = renewable_percentage - self.profile[hour]
+            self.residual += (1 - math.exp(-elapsed / RESIDUAL_TIME_CONSTANT)) * (departure - self.residual)
+            self.observations += 1
+
+    def observe(self, timestamp: float, reading: dict):
+        """Sampler listener: update from a grid reading dict."""
+        self.update(timestamp, reading['renewable_percentage'])
+
+    def forecast(self, now: float = None, hours: int = FORECAST_HOURS) -> list:
+        """Expected renewable percentage for each hour starting with the current one.
+
+        Returns [{'hour': datetime, 'renewable_percentage': float}], in local time.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            profile = self.profile[:]
+            residual = self.residual
+            age = now - self.last_time if self.last_time is not None else 0.0
+
+        start = datetime.fromtimestamp(now).replace(minute=0, second=0, microsecond=0)
+        departure = residual * math.exp(-max(age, 0.0) / RESIDUAL_PERSISTENCE)
+        steps, fades = _hour_steps(hours)
+        return [
+            {
+                'hour': start + step,
+                'renewable_percentage': min(max(profile[(start.hour + ahead) % 24] + departure * fade, 0.0), 100.0)
+            }
+            for ahead, (step, fade) in enumerate(zip(steps, fades))
+        ]
+
+@lru_cache(maxsize=8)
+def _hour_steps(hours: int) -> tuple:
+    """Offsets and departure fade factors for each forecast hour, built once per horizon."""
+    steps = [timedelta(hours=ahead) for ahead in range(hours)]
+    fades = [math.exp(-ahead * 3600 / RESIDUAL_PERSISTENCE) for ahead in range(hours)]
+    return steps, fades
+
+def cleanest_windows(forecast: list, duration_hours: int = 2, count: int = 3) -> list:
+    """The count best non-overlapping windows of duration_hours in a forecast, in time order.
+
+    Window averages come from one running sum over the forecast. Returns
+    [{'start', 'end', 'renewable_percentage'}].
+    """
+    values = [entry['renewable_percentage'] for entry in forecast]
+    duration_hours = max(1, min(duration_hours, len(values)))
+    if not values:
+        return []
+    sums = [0.0, *accumulate(values)]
+    means = [(sums[i + duration_hours] - sums[i]) / duration_hours for i in range(len(values) - duration_hours + 1)]
+
+    chosen = []
+    for start in sorted(range(len(means)), key=lambda i: -means[i]):
+        if all(abs(start - other) >= duration_hours for other in chosen):
+            chosen.append(start)
+            if len(chosen) == count:
+                break
+    return [
+        {
+            'start': forecast[start]['hour'],
+            'end': forecast[start]['hour'] + timedelta(hours=duration_hours),
+            'renewable_percentage': means[start]
+        }
+        for start in sorted(chosen)
+    ]
+
+@st.cache_resource
+def get_renewable_forecaster():
+    """The process-wide forecaster, seeded from telemetry history and then fed by the sampler."""
+    store, sampler = get_grid_telemetry()
+    forecaster = RenewableForecaster()
+    times, values = store.arrays(SEED_SECONDS, '1min')
+    column = store.fields.index('renewable_percentage')
+    for timestamp, renewable_percentage in zip(times.tolist(), values[:, column].tolist()):
+        forecaster.update(timestamp, renewable_percentage)
+    sampler.add_listener(forecaster.observe)
+    return forecaster
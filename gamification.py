@@ -1,58 +1,208 @@
-import streamlit as st
+"""Points and achievements.
 
-def initialize_achievements():
-    """Initialize achievements in session state."""
-    if 'achievements' not in st.session_state:
-        st.session_state.achievements = set()
+Achievements are declared as rules over a few per-user aggregates: the
+point balance and counts of qualifying activities. The counts are kept in
+achievement_counters, incremented in the same transaction as every
+activity insert, so evaluating a user is one primary-key read however many
+activities they have logged. Every rule is checked against the aggregates
+in one pass, and new unlocks are written with a single batched insert that
+skips any a concurrent writer got to first. Unlocks are persisted in
+user_achievements, so showing them never re-derives state.
+"""
+from collections import defaultdict
+from datetime import datetime
 
-def award_points(activity_type: str, emissions_saved: float, bonus_points: float = 0, transport_type: str = ""):
-    """Award points based on eco-friendly activities."""
-    if 'points' not in st.session_state:
-        st.session_state.points = 0
+from sqlalchemy import and_, case, delete, exists, func, insert, literal, or_, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
 
-    initialize_achievements()
+from models import AchievementCounter, Activity, User, UserAchievement, session_scope
 
-    # Add bonus points directly
-    points = int(bonus_points * 100)  # Convert to whole numbers for easier tracking
-    st.session_state.points += points
+LOW_ENERGY_KWH = 10  # energy logs below this count as conservation
+GREEN_TRANSPORT = ('walk', 'bike', 'bus')
+PLANT_BASED_FOODS = ('vegetarian', 'vegan')
+
+# Activities counted by each aggregate; 'points' comes from users.points.
+# activity_metrics() must count the same activities.
+ACTIVITY_METRICS = {
+    'green_trips': and_(Activity.activity_type == 'transport',
+                        Activity.transport_type.in_(GREEN_TRANSPORT), Activity.distance > 0),
+    'plant_based_meals': and_(Activity.activity_type == 'food', Activity.food_type.in_(PLANT_BASED_FOODS)),
+    'low_energy_logs': and_(Activity.activity_type == 'energy', Activity.kwh < LOW_ENERGY_KWH)
+}
+
+METRIC_LABELS = {
+    'points': 'points',
+    'green_trips': 'walk, bike or bus trips',
+    'plant_based_meals': 'vegetarian or vegan meals',
+    'low_energy_logs': f'energy logs under {LOW_ENERGY_KWH} kWh'
+}
+
+# Unlocked once the metric reaches the threshold; listed in display order
+ACHIEVEMENT_RULES = [
+    {'name': 'Eco Warrior', 'metric': 'points', 'threshold': 1000,
+     'icon': '🌍', 'description': 'Earned 1000+ points through eco-friendly choices'},
+    {'name': 'Carbon Crusher', 'metric': 'points', 'threshold': 500,
+     'icon': '💪', 'description': 'Reached 500 points in carbon reduction'},
+    {'name': 'Green Starter', 'metric': 'points', 'threshold': 100,
+     'icon': '🌱', 'description': 'Started your journey with 100 points'},
+    {'name': 'Green Commuter', 'metric': 'green_trips', 'threshold': 1,
+     'icon': '🚲', 'description': 'Chose eco-friendly transportation'},
+    {'name': 'Plant-Based Pioneer', 'metric': 'plant_based_meals', 'threshold': 1,
+     'icon': '🥗', 'description': 'Made sustainable food choices'},
+    {'name': 'Energy Saver', 'metric': 'low_energy_logs', 'threshold': 1,
+     'icon': '⚡', 'description': 'Demonstrated energy conservation'}
+]
+
+def award_points(activity_type: str, emissions_saved: float, bonus_points: float = 0) -> int:
+    """Points earned by an eco-friendly activity.
+
+    Only computes the amount; it is credited through the points ledger when
+    the activity is recorded.
+    """
+    # Bonus points count directly, as whole numbers for easier tracking
+    points = int(bonus_points * 100)
 
     # Add points based on emissions saved (if any)
     if emissions_saved > 0:
-        emission_points = int(emissions_saved * 10)
-        st.session_state.points += emission_points
-        points += emission_points
-
-    # Only check achievements if not using a car
-    if transport_type != 'car':
-        check_achievements()
+        points += int(emissions_saved * 10)
 
     return points
 
-def check_achievements():
-    """Check and award achievements based on user activities."""
-    points = st.session_state.points
-
-    achievement_thresholds = {
-        'Eco Warrior': 1000,
-        'Carbon Crusher': 500,
-        'Green Starter': 100,
-        'Plant-Based Pioneer': 200, # Added achievement
-        'Energy Saver': 300 # Added achievement
-
-    }
-
-    # Check point-based achievements
-    for achievement, threshold in achievement_thresholds.items():
-        if points >= threshold:
-            add_achievement(achievement)
-
-def get_achievements():
-    """Get list of earned achievements."""
-    initialize_achievements()
-    return list(st.session_state.achievements)
-
-def add_achievement(achievement_name: str):
-    """Add a new achievement."""
-    initialize_achievements()
-    st.session_state.achievements.add(achievement_name)
-    st.success(f"New Achievement Unlocked: {achievement_name}!")
\ No newline at end of file
+def activity_metrics(row: dict) -> list:
+    """Names of the ACTIVITY_METRICS an activity row (activity_type plus detail columns) counts towards."""
+    activity_type = row['activity_type']
+    names = []
+    if (activity_type == 'transport' and row.get('transport_type') in GREEN_TRANSPORT
+            and (row.get('distance') or 0) > 0):
+        names.append('green_trips')
+    if activity_type == 'food' and row.get('food_type') in PLANT_BASED_FOODS:
+        names.append('plant_based_meals')
+    if activity_type == 'energy' and row.get('kwh') is not None and row['kwh'] < LOW_ENERGY_KWH:
+        names.append('low_energy_logs')
+    return names
+
+def aggregate_achievement_counters(rows) -> list:
+    """Collapse activity rows into per-user counter increments; users with nothing to count are left out."""
+    totals = defaultdict(lambda: dict.fromkeys(ACTIVITY_METRICS, 0))
+    for row in rows:
+        for name in activity_metrics(row):
+            totals[row['user_id']][name] += 1
+    return [{'user_id': user_id, **counts} for user_id, counts in totals.items()]
+
+def upsert_achievement_counters(db: Session, increments: list):
+    """Add counter increments, creating missing users' rows."""
+    if not increments:
+        return
+    dialect = db.get_bind().dialect.name
+    insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert_(AchievementCounter)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={
+                name: getattr(AchievementCounter, name) + statement.excluded[name]
+                for name in ACTIVITY_METRICS
+            }
+        ),
+        increments
+    )
+
+def rebuild_achievement_counters(db, user_ids=None):
+    """Recompute the counters of the given users (default: everyone) from their activities.
+
+    Takes a session or a connection; runs in its transaction.
+    """
+    clear = delete(AchievementCounter)
+    counted = select(
+        Activity.user_id,
+        *[func.sum(case((condition, 1), else_=0)) for condition in ACTIVITY_METRICS.values()]
+    ).where(or_(*ACTIVITY_METRICS.values()))
+    if user_ids is not None:
+        clear = clear.where(AchievementCounter.user_id.in_(list(user_ids)))
+        counted = counted.where(Activity.user_id.in_(list(user_ids)))
+    db.execute(clear)
+    db.execute(insert(AchievementCounter).from_select(
+        ['user_id', *ACTIVITY_METRICS], counted.group_by(Activity.user_id)
+    ))
+
+def _metrics_query():
+    """Aggregates for every user: users.points and the stored activity counters."""
+    return select(
+        User.id.label('user_id'),
+        User.points.label('points'),
+        *[func.coalesce(getattr(AchievementCounter, name), 0).label(name) for name in ACTIVITY_METRICS]
+    ).outerjoin(AchievementCounter, AchievementCounter.user_id == User.id)
+
+def fetch_achievement_metrics(db: Session, user_id: int) -> dict:
+    """All rule aggregates for one user, from a single primary-key read."""
+    row = db.execute(_metrics_query().where(User.id == user_id)).mappings().one()
+    return {name: row[name] for name in METRIC_LABELS}
+
+def evaluate_rules(metrics: dict) -> list:
+    """Names of every achievement whose rule the aggregates satisfy."""
+    return [rule['name'] for rule in ACHIEVEMENT_RULES if (metrics[rule['metric']] or 0) >= rule['threshold']]
+
+def fetch_achievement_names(db: Session, user_id: int) -> set:
+    """Names of the achievements a user has unlocked."""
+    return set(db.scalars(select(UserAchievement.achievement_name).where(UserAchievement.user_id == user_id)))
+
+def _insert_ignoring_duplicates(db: Session):
+    """INSERT into user_achievements that skips rows the unique (user, name) index already holds."""
+    dialect = db.get_bind().dialect.name
+    insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    return insert_(UserAchievement).on_conflict_do_nothing(index_elements=['user_id', 'achievement_name'])
+
+def insert_achievements(db: Session, user_id: int, achievement_names) -> list:
+    """Record achievements the user does not have yet in one batched insert; return the new names.
+
+    Names another transaction unlocked concurrently are skipped by the
+    unique index, not inserted twice, and are not reported as new.
+    """
+    earned = fetch_achievement_names(db, user_id)
+    new_names = [name for name in dict.fromkeys(achievement_names) if name not in earned]
+    if not new_names:
+        return []
+    now = datetime.now()
+    added = set(db.execute(
+        _insert_ignoring_duplicates(db)
+        .values([{'user_id': user_id, 'achievement_name': name, 'date_earned': now} for name in new_names])
+        .returning(UserAchievement.achievement_name)
+    ).scalars())
+    return [name for name in new_names if name in added]
+
+def unlock_achievements(db: Session, user_id: int) -> list:
+    """Evaluate every rule for a user in the caller's transaction; return the newly unlocked names."""
+    return insert_achievements(db, user_id, evaluate_rules(fetch_achievement_metrics(db, user_id)))
+
+def backfill_achievements() -> int:
+    """Unlock every achievement any user has earned but not been awarded, set-wise in SQL.
+
+    One INSERT ... SELECT reads the aggregates of all users once and adds
+    a row per satisfied rule that is not already recorded. Returns the
+    number of achievements added.
+    """
+    metrics = _metrics_query().cte('achievement_metrics')
+    now = datetime.now()
+    unlocks = union_all(*[
+        select(
+            metrics.c.user_id,
+            literal(rule['name']).label('achievement_name'),
+            literal(now).label('date_earned')
+        ).where(
+            metrics.c[rule['metric']] >= rule['threshold'],
+            ~exists().where(
+                UserAchievement.user_id == metrics.c.user_id,
+                UserAchievement.achievement_name == rule['name']
+            )
+        )
+        for rule in ACHIEVEMENT_RULES
+    ])
+    with session_scope() as db:
+        # RETURNING, since drivers report no rowcount for an INSERT led by a WITH clause
+        added = db.execute(
+            _insert_ignoring_duplicates(db)
+            .from_select(['user_id', 'achievement_name', 'date_earned'], unlocks)
+            .returning(UserAchievement.id)
+        ).all()
+    return len(added)
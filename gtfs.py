@@ -0,0 +1,283 @@
+"""TheBus GTFS feed ingestion into compact NumPy arrays.
+
+The feed zip is read once: shapes.txt, trips.txt and stop_times.txt are
+streamed row by row into typed arrays rather than loaded into DataFrames,
+and route lengths are measured along each route's shape. The result is
+written next to the feed as .npy files plus a small meta.json, and later
+loads memory-map those files instead of re-parsing the zip. Build the
+cache ahead of a deploy with:
+
+    python gtfs.py build path/to/gtfs.zip
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Bumped whenever the cached layout changes, so old caches are rebuilt
+CACHE_VERSION = 1
+ARRAY_NAMES = (
+    'route_shape', 'shape_offsets', 'shape_lats', 'shape_lons', 'shape_km',
+    'stop_lats', 'stop_lons', 'stop_routes'
+)
+
+class GtfsFeed:
+    """Routes, shapes and stops of a feed, backed by (possibly memory-mapped) arrays.
+
+    Shape points for shape i are shape_lats/shape_lons[shape_offsets[i]:shape_offsets[i + 1]].
+    route_shape holds each route's most used shape, or -1. stop_routes holds
+    (stop index, route index) pairs for every route that serves a stop.
+    """
+
+    def __init__(self, meta: dict, arrays: dict):
+        self.route_ids = meta['route_ids']
+        self.route_names = meta['route_names']
+        self.stop_ids = meta['stop_ids']
+        self.stop_names = meta['stop_names']
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+
+    def shape_path(self, shape: int) -> list:
+        """[[lat, lon], ...] points of a shape."""
+        start, end = self.shape_offsets[shape], self.shape_offsets[shape + 1]
+        return np.column_stack((self.shape_lats[start:end], self.shape_lons[start:end])).tolist()
+
+    def routes(self) -> list:
+        """Routes with a shape as {'route_id', 'name', 'path', 'distance_km'}."""
+        return [
+            {
+                'route_id': route_id,
+                'name': name,
+                'path': self.shape_path(shape),
+                'distance_km': float(self.shape_km[shape])
+            }
+            for route_id, name, shape in zip(self.route_ids, self.route_names, self.route_shape.tolist())
+            if shape >= 0
+        ]
+
+    def stops(self) -> list:
+        """Stops as {'stop_id', 'name', 'location', 'routes'}."""
+        served = [[] for _ in self.stop_ids]
+        for stop, route in self.stop_routes.tolist():
+            served[stop].append(self.route_names[route])
+        return [
+            {'stop_id': stop_id, 'name': name, 'location': [lat, lon], 'routes': routes}
+            for stop_id, name, lat, lon, routes in zip(
+                self.stop_ids, self.stop_names, self.stop_lats.tolist(), self.stop_lons.tolist(), served
+            )
+        ]
+
+def _read_columns(feed: zipfile.ZipFile, name: str, columns: tuple):
+    """Stream one feed file as tuples of the given columns.
+
+    Columns the file lacks read as '', and a missing file yields nothing.
+    Plain csv.reader rows are used because building a dict per row doubles
+    the parse time of shapes.txt and stop_times.txt.
+    """
+    try:
+        raw = feed.open(name)
+    except KeyError:
+        return
+    with raw, io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as text:
+        reader = csv.reader(text)
+        header = [column.strip() for column in next(reader, [])]
+        # Missing columns point one past the end of a padded row
+        positions = [header.index(column) if column in header else len(header) for column in columns]
+        for row in reader:
+            if len(row) <= len(header):
+                row += [''] * (len(header) + 1 - len(row))
+            yield tuple(row[position] for position in positions)
+
+def _route_name(route_id: str, short_name: str, long_name: str) -> str:
+    short_name, long_name = short_name.strip(), long_name.strip()
+    if short_name and long_name:
+        return f"Route {short_name} - {long_name}"
+    return f"Route {short_name}" if short_name else long_name or route_id
+
+def _path_lengths_km(lats, lons, offsets) -> np.ndarray:
+    """Haversine length of every shape, summed segment by segment."""
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (np.sin(np.diff(lats) / 2) ** 2
+         + np.cos(lats[:-1]) * np.cos(lats[1:]) * np.sin(np.diff(lons) / 2) ** 2)
+    segments = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    # Segments joining the last point of one shape to the first of the next don't count
+    segments[offsets[1:-1] - 1] = 0.0
+    cumulative = np.concatenate(([0.0], np.cumsum(segments)))
+    return cumulative[offsets[1:] - 1] - cumulative[offsets[:-1]]
+
+def parse_feed(path: str) -> tuple:
+    """Parse a GTFS zip into (meta, arrays) without holding any large file in memory."""
+    with zipfile.ZipFile(path) as feed:
+        route_ids, route_names = [], []
+        for route_id, short_name, long_name in _read_columns(
+                feed, 'routes.txt', ('route_id', 'route_short_name', 'route_long_name')):
+            route_ids.append(route_id)
+            route_names.append(_route_name(route_id, short_name, long_name))
+        route_index = {route_id: i for i, route_id in enumerate(route_ids)}
+
+        stop_ids, stop_names = [], []
+        stop_lats, stop_lons = array('d'), array('d')
+        for stop_id, name, lat, lon in _read_columns(
+                feed, 'stops.txt', ('stop_id', 'stop_name', 'stop_lat', 'stop_lon')):
+            # Stations and entrances may have no coordinates of their own
+            if not lat or not lon:
+                continue
+            stop_ids.append(stop_id)
+            stop_names.append(name.strip())
+            stop_lats.append(float(lat))
+            stop_lons.append(float(lon))
+        stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+        trip_route = {}
+        shape_trips = Counter()
+        for route_id, trip_id, shape_id in _read_columns(feed, 'trips.txt', ('route_id', 'trip_id', 'shape_id')):
+            route = route_index.get(route_id)
+            if route is None:
+                continue
+            trip_route[trip_id] = route
+            if shape_id:
+                shape_trips[route, shape_id] += 1
+
+        shape_index = {}
+        point_shapes, sequences = array('q'), array('q')
+        point_lats, point_lons = array('d'), array('d')
+        for shape_id, lat, lon, sequence in _read_columns(
+                feed, 'shapes.txt', ('shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence')):
+            point_shapes.append(shape_index.setdefault(shape_id, len(shape_index)))
+            sequences.append(int(sequence))
+            point_lats.append(float(lat))
+            point_lons.append(float(lon))
+
+        # stop_times.txt is the largest file by far; only the distinct
+        # (stop, route) pairs are kept, packed into one integer each
+        served = set()
+        n_routes = max(len(route_ids), 1)
+        for trip_id, stop_id in _read_columns(feed, 'stop_times.txt', ('trip_id', 'stop_id')):
+            route = trip_route.get(trip_id)
+            stop = stop_index.get(stop_id)
+            if route is not None and stop is not None:
+                served.add(stop * n_routes + route)
+
+    point_shapes = np.frombuffer(point_shapes, dtype=np.int64)
+    order = np.lexsort((np.frombuffer(sequences, dtype=np.int64), point_shapes))
+    shape_offsets = np.searchsorted(point_shapes[order], np.arange(len(shape_index) + 1)).astype(np.int64)
+    shape_lats = np.frombuffer(point_lats, dtype=np.float64)[order]
+    shape_lons = np.frombuffer(point_lons, dtype=np.float64)[order]
+    shape_km = (_path_lengths_km(shape_lats, shape_lons, shape_offsets)
+                if len(shape_lats) else np.zeros(len(shape_index)))
+
+    # Each route is drawn with the shape most of its trips follow
+    route_shape = np.full(len(route_ids), -1, dtype=np.int64)
+    trips_on_shape = np.zeros(len(route_ids), dtype=np.int64)
+    for (route, shape_id), trips in shape_trips.items():
+        if shape_id in shape_index and trips > trips_on_shape[route]:
+            route_shape[route] = shape_index[shape_id]
+            trips_on_shape[route] = trips
+
+    packed = np.sort(np.fromiter(served, dtype=np.int64, count=len(served)))
+    stop_routes = np.column_stack((packed // n_routes, packed % n_routes))
+
+    meta = {
+        'route_ids': route_ids,
+        'route_names': route_names,
+        'stop_ids': stop_ids,
+        'stop_names': stop_names
+    }
+    arrays = {
+        'route_shape': route_shape,
+        'shape_offsets': shape_offsets,
+        'shape_lats': shape_lats,
+        'shape_lons': shape_lons,
+        'shape_km': shape_km,
+        'stop_lats': np.frombuffer(stop_lats, dtype=np.float64),
+        'stop_lons': np.frombuffer(stop_lons, dtype=np.float64),
+        'stop_routes': stop_routes
+    }
+    return meta, arrays
+
+def _source_signature(path: str) -> dict:
+    stat = os.stat(path)
+    return {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def default_cache_dir(path: str) -> str:
+    return os.environ.get('GTFS_CACHE_DIR') or f"{path}.cache"
+
+def build_cache(path: str, cache_dir: str = None) -> str:
+    """Parse the feed and write its arrays to cache_dir; returns the directory."""
+    cache_dir = cache_dir or default_cache_dir(path)
+    meta, arrays = parse_feed(path)
+    meta['source'] = _source_signature(path)
+
+    # Written to a sibling directory and swapped in, so readers never see half a cache
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    staging = tempfile.mkdtemp(prefix='.gtfs-', dir=parent)
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(values))
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(staging, cache_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return cache_dir
+
+def _read_cache(path: str, cache_dir: str):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('source') != _source_signature(path):
+        return None
+    try:
+        arrays = {name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode='r') for name in ARRAY_NAMES}
+    except (OSError, ValueError):
+        return None
+    return GtfsFeed(meta, arrays)
+
+def load_feed(path: str, cache_dir: str = None) -> GtfsFeed:
+    """A feed from its memory-mapped cache, parsing the zip first when the cache is missing or stale."""
+    cache_dir = cache_dir or default_cache_dir(path)
+    feed = _read_cache(path, cache_dir)
+    if feed is None:
+        build_cache(path, cache_dir)
+        feed = _read_cache(path, cache_dir)
+    return feed
+
+@lru_cache(maxsize=1)
+def get_default_feed():
+    """The feed named by the GTFS_PATH environment variable, or None when unset."""
+    path = os.environ.get('GTFS_PATH')
+    return load_feed(path) if path else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the array cache for a GTFS feed.")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('path', help="GTFS zip file")
+    parser.add_argument('--cache-dir', help="defaults to GTFS_CACHE_DIR or <path>.cache")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    cache_dir = build_cache(args.path, args.cache_dir)
+    feed = load_feed(args.path, cache_dir)
+    print(f"{len(feed.route_ids):,} routes, {len(feed.shape_offsets) - 1:,} shapes, "
+          f"{len(feed.shape_lats):,} shape points, {len(feed.stop_ids):,} stops "
+          f"cached in {cache_dir} ({time.perf_counter() - started:.1f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Leaderboard reads backed by the users.points index and an in-process top-K cache.
+
+Point-changing writes report their new balance with note_points_change; the
+cache applies it once the transaction commits, updating the cached entry in
+place or dropping the cache when the top K might have changed. A short TTL
+bounds staleness from writes made by other processes.
+"""
+import threading
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import User
+
+LEADERBOARD_SIZE = 10
+CACHE_TTL = 30  # seconds
+
+_lock = threading.Lock()
+_entries = None  # [{'user_id', 'name', 'points'}], best first
+_loaded_at = 0.0
+
+def _load_top(db: Session, limit: int) -> list:
+    users = db.query(User.id, User.username, User.points).filter(
+        User.points.isnot(None)
+    ).order_by(User.points.desc(), User.id).limit(limit)
+    return [{'user_id': user_id, 'name': username, 'points': points} for user_id, username, points in users]
+
+def _cached_entries():
+    """The cached top K if it is within its TTL, else None; call with _lock held."""
+    if _entries is not None and time.monotonic() - _loaded_at < CACHE_TTL:
+        return _entries
+    return None
+
+def invalidate():
+    """Drop the cached top K; the next read reloads it."""
+    global _entries
+    with _lock:
+        _entries = None
+
+def get_top(db: Session, limit: int = LEADERBOARD_SIZE) -> list:
+    """Top users by points as [{'user_id', 'name', 'points'}], best first."""
+    global _entries, _loaded_at
+    if limit > LEADERBOARD_SIZE:
+        return _load_top(db, limit)
+
+    with _lock:
+        cached = _cached_entries()
+        if cached is not None:
+            return [dict(entry) for entry in cached[:limit]]
+
+    entries = _load_top(db, LEADERBOARD_SIZE)
+    with _lock:
+        _entries = entries
+        _loaded_at = time.monotonic()
+    return [dict(entry) for entry in entries[:limit]]
+
+def get_rank(db: Session, user_id: int) -> int:
+    """A user's 1-based rank by points, answered from the points index without a table scan.
+
+    Ties share a rank: one plus the number of users strictly ahead, whether
+    the answer comes from the cache or the database.
+    """
+    with _lock:
+        cached = _cached_entries()
+        entry = next((e for e in cached if e['user_id'] == user_id), None) if cached is not None else None
+        if entry is not None:
+            # Everyone strictly ahead of a top-K user is in the top K too
+            return 1 + sum(1 for e in cached if e['points'] > entry['points'])
+
+    points = db.query(User.points).filter(User.id == user_id).scalar() or 0
+    ahead = db.query(func.count(User.id)).filter(User.points > points).scalar()
+    return ahead + 1
+
+def _apply_points_change(user_id: int, points: int):
+    global _entries
+    with _lock:
+        if _entries is None:
+            return
+        entry = next((e for e in _entries if e['user_id'] == user_id), None)
+        # Rank order: more points first, then the lower user id
+        rank_key = (-points, user_id)
+        lowest = (-_entries[-1]['points'], _entries[-1]['user_id']) if _entries else None
+
+        if entry is None:
+            # Anyone outside the top K who now ranks above the lowest entry needs a reload
+            if len(_entries) < LEADERBOARD_SIZE or rank_key < lowest:
+                _entries = None
+            return
+
+        entry['points'] = points
+        # Users outside the cache rank below the old lowest entry, so falling
+        # below it could let one of them in
+        if len(_entries) == LEADERBOARD_SIZE and rank_key > lowest:
+            _entries = None
+            return
+        _entries.sort(key=lambda e: (-e['points'], e['user_id']))
+
+def note_points_change(db: Session, user_id: int, points: int):
+    """Record a user's new balance, applied to the cache when db commits."""
+    db.info.setdefault('leaderboard_changes', {})[user_id] = points
+
+# Listening on every Session, so the sessions behind the async API apply changes too
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for user_id, points in session.info.pop('leaderboard_changes', {}).items():
+        _apply_points_change(user_id, points)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    session.info.pop('leaderboard_changes', None)
@@ -1,8 +1,41 @@
-import folium
-from datetime import datetime, timedelta
+import numpy as np
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from gtfs import get_default_feed
+
+# folium is imported by the functions that draw maps, so route, store and
+# trace-matching lookups load this module without it
+
+# Marker layers bigger than this are clustered
+CLUSTER_THRESHOLD = 50
+
+# Douglas-Peucker tolerance for drawn route paths, in degrees (~11 m)
+ROUTE_SIMPLIFY_TOLERANCE = 0.0001
+
+KM_PER_MILE = 1.609344
+
+# Points for a bus ride on a GTFS route, rounded to a multiple of 5
+BUS_POINTS_PER_MILE = 14
+
+# ((south, west), (north, east)) map areas offered on the Rewards Map
+ISLAND_BOUNDS = {
+    'Oahu': ((21.25, -158.29), (21.72, -157.64)),
+    'Maui': ((20.57, -156.70), (21.04, -155.97)),
+    'Hawaii (Big Island)': ((18.90, -156.10), (20.27, -154.80)),
+    'Kauai': ((21.86, -159.80), (22.24, -159.28)),
+    'Molokai': ((21.05, -157.32), (21.23, -156.70)),
+    'Lanai': ((20.72, -157.07), (20.93, -156.80)),
+    'All Islands': ((18.90, -160.30), (22.30, -154.80))
+}
 
 def get_bus_routes():
-    """Get TheBus routes in Oahu."""
+    """Get TheBus routes in Oahu, from the GTFS feed when GTFS_PATH is set."""
+    feed = get_default_feed()
+    if feed is not None:
+        return _feed_routes(feed)
     return [
         {
             'name': 'Route 2 - Waikiki-School-Middle St.',
@@ -19,6 +52,20 @@ def get_bus_routes():
         
     ]
 
+@lru_cache(maxsize=1)
+def _feed_routes(feed) -> list:
+    # Converting thousands of shape points to lists is the slow part, so it happens once
+    routes = []
+    for route in feed.routes():
+        distance = round(route['distance_km'] / KM_PER_MILE, 1)
+        routes.append({
+            'name': route['name'],
+            'path': route['path'],
+            'distance': distance,
+            'points_per_ride': max(5, 5 * round(distance * BUS_POINTS_PER_MILE / 5))
+        })
+    return routes
+
 def get_store_locations():
     """Get store locations and their rewards."""
     return [
@@ -71,58 +118,242 @@ def get_activity_locations():
         }
     ]
 
-def create_oahu_map(user_points: int):
-    """Create an interactive map of Oahu with markers for activities, stores, and bus routes."""
-    # Center the map on Oahu
-    m = folium.Map(
-        location=[21.4389, -157.9243],
-        zoom_start=11,
-        tiles="cartodb positron"
+def store_points_tier(user_points: int, stores=None) -> int:
+    """Number of store rewards unlocked at a points balance.
+
+    Store marker colours only depend on this, so every balance in the same
+    tier renders an identical map.
+    """
+    stores = stores if stores is not None else get_store_locations()
+    thresholds = sorted(store['points_required'] for store in stores)
+    return bisect_right(thresholds, user_points)
+
+def simplify_path(path, tolerance: float = ROUTE_SIMPLIFY_TOLERANCE):
+    """Douglas-Peucker simplification of a [[lat, lon], ...] path, tolerance in degrees."""
+    points = np.asarray(path, dtype=np.float64)
+    if len(points) < 3:
+        return [list(point) for point in points]
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        inner = points[first + 1:last] - start
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            # Perpendicular distance of every inner point to the chord, in one pass
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep].tolist()
+
+def simplify_routes(routes, tolerance: float = ROUTE_SIMPLIFY_TOLERANCE):
+    """Copies of routes with simplified paths."""
+    return [dict(route, path=simplify_path(route['path'], tolerance)) for route in routes]
+
+def in_bbox(location, bbox) -> bool:
+    """Whether a [lat, lon] lies inside ((south, west), (north, east))."""
+    (south, west), (north, east) = bbox
+    return south <= location[0] <= north and west <= location[1] <= east
+
+def path_intersects_bbox(path, bbox) -> bool:
+    """Whether a path's own bounding box overlaps bbox."""
+    (south, west), (north, east) = bbox
+    lats = [point[0] for point in path]
+    lons = [point[1] for point in path]
+    return min(lats) <= north and max(lats) >= south and min(lons) <= east and max(lons) >= west
+
+def filter_to_bbox(routes, activities, stores, bbox):
+    """Only the routes, activities and stores inside (or crossing) bbox."""
+    return (
+        [route for route in routes if route['path'] and path_intersects_bbox(route['path'], bbox)],
+        [activity for activity in activities if in_bbox(activity['location'], bbox)],
+        [store for store in stores if in_bbox(store['location'], bbox)]
     )
 
-    # Add bus routes
-    for route in get_bus_routes():
-        folium.PolyLine(
-            locations=route['path'],
-            color='blue',
-            weight=2,
-            popup=f"""
-                <b>{route['name']}</b><br>
-                Distance: {route['distance']} miles<br>
-                Points per ride: {route['points_per_ride']}
-            """
-        ).add_to(m)
-
-    # Add activity locations
-    for activity in get_activity_locations():
-        folium.Marker(
-            activity['location'],
-            popup=folium.Popup(
-                f"""<b>{activity['name']}</b><br>
+def routes_geojson(routes) -> dict:
+    """Bus routes as one GeoJSON FeatureCollection ([lon, lat] order)."""
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': [[lon, lat] for lat, lon in route['path']]
+                },
+                'properties': {
+                    'name': route['name'],
+                    'distance': route['distance'],
+                    'points_per_ride': route['points_per_ride']
+                }
+            }
+            for route in routes
+        ]
+    }
+
+def add_route_layer(m, routes):
+    """Add bus routes as a single GeoJSON layer rather than one PolyLine per route."""
+    import folium
+
+    if not routes:
+        return
+    folium.GeoJson(
+        routes_geojson(routes),
+        name='Bus Routes',
+        style_function=lambda feature: {'color': 'blue', 'weight': 2},
+        popup=folium.GeoJsonPopup(
+            fields=['name', 'distance', 'points_per_ride'],
+            aliases=['Route', 'Distance (miles)', 'Points per ride']
+        )
+    ).add_to(m)
+
+# Builds each clustered marker in the browser from a compact
+# [lat, lon, popup_html, color, icon] row
+_CLUSTER_MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: row[4], markerColor: row[3], prefix: 'glyphicon'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[2], {maxWidth: 300});
+    return marker;
+}
+"""
+
+def add_marker_layer(m, markers, name: str, cluster_threshold: int = CLUSTER_THRESHOLD):
+    """Add markers ({location, popup, color, icon}) individually, or clustered when there are many.
+
+    Clustered markers ship as one JSON array and are only drawn by the browser
+    when their cluster is expanded, which keeps large layers light.
+    """
+    import folium
+    from folium.plugins import FastMarkerCluster
+
+    if len(markers) <= cluster_threshold:
+        for marker in markers:
+            folium.Marker(
+                marker['location'],
+                popup=folium.Popup(marker['popup'], max_width=300),
+                icon=folium.Icon(color=marker['color'], icon=marker['icon'])
+            ).add_to(m)
+        return
+
+    FastMarkerCluster(
+        [[*marker['location'], marker['popup'], marker['color'], marker['icon']] for marker in markers],
+        callback=_CLUSTER_MARKER_CALLBACK,
+        name=name
+    ).add_to(m)
+
+def add_activity_layer(m, activities, cluster_threshold: int = CLUSTER_THRESHOLD):
+    """Add activity location markers."""
+    add_marker_layer(m, [
+        {
+            'location': activity['location'],
+            'popup': f"""<b>{activity['name']}</b><br>
                 Date: {activity['date']}<br>
                 Points: {activity['points']}<br>
                 {activity['description']}""",
-                max_width=300
-            ),
-            icon=folium.Icon(color='green', icon='info-sign')
-        ).add_to(m)
+            'color': 'green',
+            'icon': 'info-sign'
+        }
+        for activity in activities
+    ], 'Activities', cluster_threshold)
 
-    # Add store locations with rewards
-    for store in get_store_locations():
+def add_store_layer(m, stores, user_points: int, cluster_threshold: int = CLUSTER_THRESHOLD):
+    """Add store reward markers, coloured by whether the user has unlocked them."""
+    markers = []
+    for store in stores:
         color = 'red' if user_points < store['points_required'] else 'green'
         status = "🔒 Locked" if user_points < store['points_required'] else "🔓 Unlocked"
-
-        folium.Marker(
-            store['location'],
-            popup=folium.Popup(
-                f"""<b>{store['name']}</b><br>
+        markers.append({
+            'location': store['location'],
+            'popup': f"""<b>{store['name']}</b><br>
                 {store['description']}<br>
                 Points Required: {store['points_required']}<br>
                 Reward: {store['discount']}<br>
                 Status: {status}""",
-                max_width=300
-            ),
-            icon=folium.Icon(color=color, icon='shopping-cart')
-        ).add_to(m)
+            'color': color,
+            'icon': 'shopping-cart'
+        })
+    add_marker_layer(m, markers, 'Store Rewards', cluster_threshold)
+
+def create_oahu_map(user_points: int, routes=None, activities=None, stores=None, bbox=None,
+                    cluster_threshold: int = CLUSTER_THRESHOLD):
+    """Create an interactive map of Oahu with markers for activities, stores, and bus routes.
+
+    With bbox ((south, west), (north, east)) only features inside it are
+    emitted and the map is fitted to it.
+    """
+    routes = routes if routes is not None else get_bus_routes()
+    activities = activities if activities is not None else get_activity_locations()
+    stores = stores if stores is not None else get_store_locations()
+    if bbox is not None:
+        routes, activities, stores = filter_to_bbox(routes, activities, stores, bbox)
+
+    import folium
+
+    # Center the map on Oahu
+    m = folium.Map(
+        location=[21.4389, -157.9243],
+        zoom_start=11,
+        tiles="cartodb positron"
+    )
+    if bbox is not None:
+        m.fit_bounds([list(bbox[0]), list(bbox[1])])
+
+    add_route_layer(m, routes)
+    add_activity_layer(m, activities, cluster_threshold)
+    add_store_layer(m, stores, user_points, cluster_threshold)
+
+    return m
+
+class OahuMapCache:
+    """Rendered map HTML for fixed routes, activities and stores, one entry per points tier and area.
+
+    Only the store markers depend on the user, and only through their points
+    tier, so each (tier, bbox) is rendered once and then served from memory.
+    Route paths are simplified once up front.
+    """
+
+    def __init__(self, routes, activities, stores, max_entries: int = 64):
+        self.routes = simplify_routes(routes)
+        self.activities = activities
+        self.stores = stores
+        self.max_entries = max_entries
+        self._html = OrderedDict()
+        self._lock = threading.Lock()
+
+    def html(self, user_points: int, bbox=None) -> str:
+        key = (store_points_tier(user_points, self.stores), bbox)
+        with self._lock:
+            cached = self._html.get(key)
+            if cached is not None:
+                self._html.move_to_end(key)
+                return cached
+
+        m = create_oahu_map(user_points, self.routes, self.activities, self.stores, bbox)
+        cached = m._repr_html_()
+        with self._lock:
+            self._html[key] = cached
+            if len(self._html) > self.max_entries:
+                self._html.popitem(last=False)
+        return cached
+
+@lru_cache(maxsize=1)
+def _map_cache_for_day(day: date) -> OahuMapCache:
+    # Activity dates are relative to today, so the cache is rebuilt daily
+    return OahuMapCache(get_bus_routes(), get_activity_locations(), get_store_locations())
 
-    return m
\ No newline at end of file
+def get_oahu_map_html(user_points: int, bbox=None) -> str:
+    """HTML for the map at a points balance, rendered at most once per tier and area per day."""
+    return _map_cache_for_day(date.today()).html(user_points, bbox)
@@ -0,0 +1,123 @@
+"""Data migrations for existing databases.
+
+Schema changes (new tables, columns and indexes) are applied by the
+versioned schema bootstrap, which the app and the API also run at startup;
+the other jobs here backfill data into them. Run from the project root:
+
+    python migrations.py schema
+    python migrations.py activity-details [--batch-size 1000]
+    python migrations.py profile-pictures [--batch-size 100]
+    python migrations.py achievements
+"""
+import argparse
+import ast
+import json
+
+from sqlalchemy import select, update
+
+from gamification import backfill_achievements, rebuild_achievement_counters
+from models import SCHEMA_VERSION, Activity, activity_detail_columns, bootstrap_schema, session_scope
+from profile_pictures import PICTURE_BATCH_SIZE, migrate_legacy_pictures
+
+DEFAULT_BATCH_SIZE = 1000
+
+def parse_details(details: str) -> dict:
+    """Parse an activity details string, either JSON or a legacy Python dict repr.
+
+    Returns {} for anything that is not a dict, unparseable or not: legacy
+    rows also hold JSON strings, lists and numbers.
+    """
+    try:
+        parsed = json.loads(details)
+    except (TypeError, ValueError):
+        try:
+            parsed = ast.literal_eval(details)
+        except (ValueError, SyntaxError):
+            return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+def migrate_activity_details(batch_size: int = DEFAULT_BATCH_SIZE, progress=None) -> tuple:
+    """Fill the typed detail columns of existing activities in batches and store details as JSON.
+
+    Walks the table by id, committing each batch on its own so it can run
+    against a live database. Rows whose details are not a dict are left as
+    they are. Returns the numbers of rows migrated and skipped.
+    """
+    last_id = 0
+    migrated = 0
+    skipped = 0
+    while True:
+        with session_scope() as db:
+            rows = db.execute(
+                select(Activity.id, Activity.activity_type, Activity.details).where(
+                    Activity.id > last_id,
+                    Activity.details.isnot(None),
+                    Activity.transport_type.is_(None),
+                    Activity.food_type.is_(None),
+                    Activity.kwh.is_(None)
+                ).order_by(Activity.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            updates = []
+            for activity_id, activity_type, details in rows:
+                parsed = parse_details(details)
+                if not parsed:
+                    skipped += 1
+                    continue
+                updates.append({
+                    'id': activity_id,
+                    'details': json.dumps(parsed),
+                    **activity_detail_columns(activity_type, parsed)
+                })
+            if updates:
+                # Bulk UPDATE by primary key, executed as one batch
+                db.execute(update(Activity), updates)
+                # Achievement counters read the columns just filled in
+                rebuild_achievement_counters(db, db.scalars(select(Activity.user_id).where(
+                    Activity.id.in_([row['id'] for row in updates])
+                ).distinct()).all())
+
+        last_id = rows[-1][0]
+        migrated += len(updates)
+        if progress:
+            progress(migrated, last_id)
+    return migrated, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Run data migrations.")
+    parser.add_argument('migration', choices=['schema', 'activity-details', 'profile-pictures', 'achievements'])
+    parser.add_argument('--batch-size', type=int)
+    args = parser.parse_args()
+
+    # Every backfill needs the schema it fills in
+    changed = bootstrap_schema()
+    if args.migration == 'schema':
+        print(f"Done: schema {'bootstrapped to' if changed else 'already at'} version {SCHEMA_VERSION}")
+        return
+
+    if args.migration == 'achievements':
+        # Set-wise in SQL, so there are no batches: recount every user's
+        # qualifying activities, then unlock whatever the counts earn
+        with session_scope() as db:
+            rebuild_achievement_counters(db)
+        print(f"Done: {backfill_achievements():,} achievements unlocked")
+        return
+
+    if args.migration == 'activity-details':
+        migrated, skipped = migrate_activity_details(
+            args.batch_size or DEFAULT_BATCH_SIZE,
+            progress=lambda count, last_id: print(f"{count:,} activities migrated (through id {last_id})", flush=True)
+        )
+        print(f"Done: {migrated:,} activities migrated, {skipped:,} skipped (details not a dict)")
+        return
+
+    migrated = migrate_legacy_pictures(
+        args.batch_size or PICTURE_BATCH_SIZE,
+        progress=lambda count, last_id: print(f"{count:,} profile pictures migrated (through id {last_id})", flush=True)
+    )
+    print(f"Done: {migrated:,} profile pictures migrated")
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,162 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, delete, event, exc, func, insert, inspect, select, text, Column, Integer, Float, String, Date, DateTime, ForeignKey, Text, Index, LargeBinary
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, deferred
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
 import os
+import threading
+import time
 from datetime import datetime
 
-# Get database URL from environment
-DATABASE_URL = os.getenv('DATABASE_URL')
+# PostgreSQL or any SQLAlchemy URL from the environment; without one, an
+# embedded SQLite database next to the app, for single-node deployments and tests
+DEFAULT_DATABASE_URL = 'sqlite:///carbon_tracker.db'
+DATABASE_URL = os.getenv('DATABASE_URL') or DEFAULT_DATABASE_URL
+
+# Set on every SQLite connection as it opens. WAL lets readers carry on
+# while a write commits; with WAL, synchronous=NORMAL only syncs at
+# checkpoints, so a power loss (not an app crash) can drop the last commits.
+# Set SQLITE_JOURNAL_MODE=DELETE where WAL is unsupported, e.g. network filesystems.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -32000)),  # negative: KiB per connection
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'MEMORY',
+    # ms a writer waits for the write lock; SQLite's retries are unfair, so
+    # under a burst of writes the unlucky one can wait several seconds
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 15000)),
+}
+# Prepared statements kept per connection, keyed by SQL text; SQLAlchemy
+# renders the same text for each query, so hot reads skip re-preparing
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', 256))
+
+# Connection pool settings, overridable per deployment
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 3600))
+
+class PoolStatistics:
+    """Thread-safe counters for connection pool checkouts and waits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.timeouts = 0
+            self.connections_opened = 0
+            self.connections_closed = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def record_checkout(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def record_close(self):
+        with self._lock:
+            self.connections_closed += 1
+
+pool_stats = PoolStatistics()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_timeout()
+            raise
+        pool_stats.record_checkout(time.perf_counter() - started)
+        return connection
+
+def sqlite_connect_args() -> dict:
+    """DBAPI connect() arguments for SQLite connections, shared by the sync and async engines."""
+    # Pooled connections are handed between Streamlit's script threads
+    return {'check_same_thread': False, 'cached_statements': SQLITE_STATEMENT_CACHE}
+
+def configure_sqlite(sync_engine):
+    """Apply SQLITE_PRAGMAS to each new connection of a SQLite engine; other engines are left alone."""
+    if sync_engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == 'sqlite'
 
 # Create engine with proper connection parameters
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=3600)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    # A local file cannot drop connections, so SQLite skips the ping per checkout
+    pool_pre_ping=not IS_SQLITE,
+    pool_recycle=POOL_RECYCLE,
+    connect_args=sqlite_connect_args() if IS_SQLITE else {}
+)
+configure_sqlite(engine)
+# Objects handed back to the pages stay readable after their session closes
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_stats.record_checkin()
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.record_connect()
+
+@event.listens_for(engine, "close")
+def _on_close(dbapi_connection, connection_record):
+    pool_stats.record_close()
+
+def get_pool_stats():
+    """Snapshot of the connection pool state and checkout statistics."""
+    pool = engine.pool
+    with pool_stats._lock:
+        checkouts = pool_stats.checkouts
+        return {
+            'pool_size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': pool.overflow(),
+            'open_connections': pool_stats.connections_opened - pool_stats.connections_closed,
+            'checkouts': checkouts,
+            'checkins': pool_stats.checkins,
+            'timeouts': pool_stats.timeouts,
+            'mean_wait': pool_stats.total_wait / checkouts if checkouts else 0.0,
+            'max_wait': pool_stats.max_wait
+        }
+
 Base = declarative_base()
 
 class User(Base):
@@ -19,24 +166,81 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     display_name = Column(String, nullable=True)
     description = Column(Text, nullable=True)
-    profile_picture = Column(String, nullable=True)  # Store as base64
-    points = Column(Integer, default=0)
+    # Legacy base64 data URI, kept until migrated; deferred so user queries never load it
+    profile_picture = deferred(Column(String, nullable=True))
+    profile_picture_ref = Column(String(64), nullable=True)  # ProfileImage.source_hash
+    points = Column(Integer, default=0, index=True)
     activities = relationship("Activity", back_populates="user")
     achievements = relationship("UserAchievement", back_populates="user")
     bus_rides = relationship("BusRide", back_populates="user")
 
+class ProfileImage(Base):
+    """Profile picture thumbnails, content-addressed by the uploaded file's hash."""
+    __tablename__ = "profile_images"
+
+    source_hash = Column(String(64), primary_key=True)  # sha256 of the original upload
+    size = Column(String, primary_key=True)  # key of profile_pictures.THUMBNAIL_SIZES
+    content_type = Column(String)
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.now)
+
 class Activity(Base):
     __tablename__ = "activities"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     activity_type = Column(String)
-    details = Column(String)
+    details = Column(String)  # JSON; legacy rows hold a Python dict repr
     emissions = Column(Float)
     date = Column(DateTime, default=datetime.now)
 
+    # Typed copies of the details, so breakdowns can run as SQL GROUP BYs
+    transport_type = Column(String, nullable=True)
+    distance = Column(Float, nullable=True)  # in miles
+    food_type = Column(String, nullable=True)
+    portions = Column(Integer, nullable=True)
+    kwh = Column(Float, nullable=True)
+
     user = relationship("User", back_populates="activities")
 
+    __table_args__ = (
+        # Serves the per-user date window scans behind the emissions summary
+        Index('ix_activities_user_id_date', 'user_id', 'date'),
+        # Keyset for incremental history loading (WHERE user_id = ? AND id > ?)
+        Index('ix_activities_user_id_id', 'user_id', 'id'),
+        Index('ix_activities_user_id_transport_type', 'user_id', 'transport_type'),
+        Index('ix_activities_user_id_food_type', 'user_id', 'food_type'),
+    )
+
+def activity_detail_columns(activity_type: str, details: dict) -> dict:
+    """Typed Activity column values for an activity's details dict."""
+    if activity_type == 'transport':
+        return {'transport_type': details.get('type'), 'distance': details.get('distance')}
+    if activity_type == 'food':
+        return {'food_type': details.get('type'), 'portions': details.get('portions')}
+    if activity_type == 'energy':
+        return {'kwh': details.get('kwh')}
+    return {}
+
+class DailyEmission(Base):
+    """Per-user, per-day, per-activity-type emissions rollup for dashboards."""
+    __tablename__ = "daily_emissions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    activity_type = Column(String, primary_key=True)
+    emissions = Column(Float, default=0)
+    activity_count = Column(Integer, default=0)
+
+class AchievementCounter(Base):
+    """Per-user counts of the activities achievement rules count, kept with every activity insert."""
+    __tablename__ = "achievement_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    green_trips = Column(Integer, default=0)
+    plant_based_meals = Column(Integer, default=0)
+    low_energy_logs = Column(Integer, default=0)
+
 class UserAchievement(Base):
     __tablename__ = "user_achievements"
 
@@ -47,6 +251,12 @@ class UserAchievement(Base):
 
     user = relationship("User", back_populates="achievements")
 
+    __table_args__ = (
+        # One row per achievement, so concurrent unlocks cannot both insert it;
+        # also serves the per-user lookups and the backfill's NOT EXISTS probes
+        Index('ix_user_achievements_user_id_name', 'user_id', 'achievement_name', unique=True),
+    )
+
 class BusRide(Base):
     __tablename__ = "bus_rides"
 
@@ -56,9 +266,47 @@ class BusRide(Base):
     distance = Column(Float)  # in miles
     points_earned = Column(Integer)
     date = Column(DateTime, default=datetime.now)
+    trace_hash = Column(String(64), nullable=True)  # sha256 of the GPS trace a detected ride came from
 
     user = relationship("User", back_populates="bus_rides")
 
+    __table_args__ = (
+        # Re-upload checks: WHERE user_id = ? AND trace_hash = ?
+        Index('ix_bus_rides_user_id_trace_hash', 'user_id', 'trace_hash'),
+    )
+
+class PointsLedger(Base):
+    """Append-only record of every points change; users.points caches its running total."""
+    __tablename__ = "points_ledger"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    points = Column(Integer, nullable=False)  # signed change
+    source = Column(String, nullable=False)  # points_ledger.SOURCES
+    reference = Column(String, nullable=True)  # e.g. the activity or bus ride id
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # Tail reads after a snapshot: WHERE user_id = ? AND id > ?
+        Index('ix_points_ledger_user_id_id', 'user_id', 'id'),
+    )
+
+class PointsSnapshot(Base):
+    """A user's balance as of a ledger entry, so balances only sum the entries after it."""
+    __tablename__ = "points_snapshots"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    ledger_id = Column(Integer, nullable=False)  # last ledger entry included
+    balance = Column(Integer, nullable=False)
+    taken_at = Column(DateTime, default=datetime.now)
+
+class ImportCheckpoint(Base):
+    __tablename__ = "import_checkpoints"
+
+    source = Column(String, primary_key=True)  # import file identifier
+    rows_done = Column(Integer, default=0)  # source records already committed
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -66,5 +314,100 @@ def get_db():
     finally:
         db.close()
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+@contextmanager
+def session_scope():
+    """Unit of work: commit on success, roll back on error, always release the connection."""
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+class SchemaVersion(Base):
+    """One row per schema bootstrap that changed the database."""
+    __tablename__ = "schema_versions"
+
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.now)
+
+# Bump whenever a table, column or index is added, so existing databases
+# pick the change up on their next bootstrap
+SCHEMA_VERSION = 3
+
+def add_missing_columns(connection):
+    """Add nullable columns that were added after their table already existed."""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def create_missing_indexes(connection):
+    """Create indexes that were added after their table already existed."""
+    # create_all skips existing tables entirely, so their new indexes need an explicit pass
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+def make_achievements_unique(connection):
+    """Drop duplicate achievement rows and any old non-unique index, so the unique index can be built."""
+    inspector = inspect(connection)
+    if not inspector.has_table(UserAchievement.__tablename__):
+        return
+    name = 'ix_user_achievements_user_id_name'
+    index = next((i for i in inspector.get_indexes(UserAchievement.__tablename__) if i['name'] == name), None)
+    if index is not None and index['unique']:
+        return
+    # Databases from before the index existed can hold duplicates too
+    connection.execute(delete(UserAchievement).where(UserAchievement.id.notin_(
+        select(func.min(UserAchievement.id))
+        .group_by(UserAchievement.user_id, UserAchievement.achievement_name)
+    )))
+    if index is not None:
+        connection.execute(text(f"DROP INDEX {name}"))
+
+def current_schema_version(connection):
+    """The schema version the database was last bootstrapped to, or None if never."""
+    if not inspect(connection).has_table(SchemaVersion.__tablename__):
+        return None
+    return connection.execute(select(func.max(SchemaVersion.version))).scalar()
+
+def bootstrap_schema(connection=None) -> bool:
+    """Create missing tables, columns and indexes unless the database is already at SCHEMA_VERSION.
+
+    Run once per process by the app and the API at startup, and by
+    `python migrations.py schema`; importing models never touches the
+    database. An up-to-date database costs one version check. Returns
+    whether the schema was changed.
+    """
+    if connection is None:
+        with engine.begin() as connection:
+            return bootstrap_schema(connection)
+
+    version = current_schema_version(connection)
+    if version is not None and version >= SCHEMA_VERSION:
+        return False
+    created = set(Base.metadata.tables) - set(inspect(connection).get_table_names())
+    Base.metadata.create_all(bind=connection)
+    add_missing_columns(connection)
+    make_achievements_unique(connection)
+    create_missing_indexes(connection)
+    if DailyEmission.__tablename__ in created:
+        # Dashboards read only the rollup, so it starts from the activities already logged
+        from rollups import recompute_daily_emissions
+        recompute_daily_emissions(connection)
+    if AchievementCounter.__tablename__ in created:
+        # New counters start from the activities already logged
+        from gamification import rebuild_achievement_counters
+        rebuild_achievement_counters(connection)
+    connection.execute(insert(SchemaVersion).values(version=SCHEMA_VERSION, applied_at=datetime.now()))
+    return True
@@ -0,0 +1,275 @@
+"""Append-only points ledger, balance snapshots and reconciliation.
+
+Every points change is a ledger entry written in the same transaction as
+the users.points increment, so users.points is a cache of the ledger's
+running total that leaderboards and rank queries can keep indexing. An
+authoritative balance is a user's latest snapshot plus the short tail of
+entries after it; reading a balance whose tail has grown long moves the
+snapshot forward.
+
+Reconciliation recomputes every balance from the ledger, one chunk of
+users per short read-only transaction, and reports (or repairs) users
+whose cached points or snapshot disagree with it:
+
+    python points_ledger.py open-balances
+    python points_ledger.py reconcile [--batch-size 1000] [--repair]
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, delete, exists, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import leaderboard
+from models import PointsLedger, PointsSnapshot, User, bootstrap_schema, session_scope
+
+SOURCES = ('activity', 'bus_ride', 'local_activity', 'opening_balance', 'correction')
+SNAPSHOT_TAIL = 50  # ledger entries after a snapshot before a balance read refreshes it
+# Entries younger than this may belong to transactions still in flight, so
+# snapshots stop short of them rather than risk skipping one for good
+SNAPSHOT_SETTLE = timedelta(minutes=1)
+DEFAULT_BATCH_SIZE = 1000
+
+def record_points(db: Session, user_id: int, points: int, source: str, reference=None) -> int:
+    """Append a ledger entry and apply it to users.points in the caller's transaction.
+
+    Returns the user's new cached balance.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown points source {source!r}")
+    if points:
+        db.execute(insert(PointsLedger).values(
+            user_id=user_id,
+            points=points,
+            source=source,
+            reference=None if reference is None else str(reference),
+            created_at=datetime.now()
+        ))
+    # A single UPDATE ... SET points = points + :n RETURNING points, so
+    # concurrent writers from other tabs or devices never lose increments
+    return db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(points=User.points + points)
+        .returning(User.points)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+def fetch_balance(db: Session, user_id: int) -> int:
+    """A user's balance from the ledger: the latest snapshot plus the entries after it."""
+    snapshot = db.execute(
+        select(PointsSnapshot.ledger_id, PointsSnapshot.balance).where(PointsSnapshot.user_id == user_id)
+    ).first()
+    ledger_id, balance = snapshot or (0, 0)
+    tail_points, tail_entries = db.execute(
+        select(func.coalesce(func.sum(PointsLedger.points), 0), func.count(PointsLedger.id)).where(
+            PointsLedger.user_id == user_id,
+            PointsLedger.id > ledger_id
+        )
+    ).one()
+    if tail_entries >= SNAPSHOT_TAIL:
+        take_snapshots(db, [user_id])
+    return balance + tail_points
+
+def take_snapshots(db: Session, user_ids):
+    """Move the users' snapshots forward over their settled ledger entries.
+
+    Only the entries after each current snapshot are read, in one grouped
+    query, and the new snapshots are written with one upsert.
+    """
+    settled = datetime.now() - SNAPSHOT_SETTLE
+    rows = db.execute(
+        select(
+            PointsLedger.user_id,
+            func.max(PointsLedger.id),
+            func.coalesce(PointsSnapshot.balance, 0) + func.sum(PointsLedger.points)
+        ).outerjoin(PointsSnapshot, PointsSnapshot.user_id == PointsLedger.user_id).where(
+            PointsLedger.user_id.in_(list(user_ids)),
+            PointsLedger.id > func.coalesce(PointsSnapshot.ledger_id, 0),
+            PointsLedger.created_at <= settled
+        ).group_by(PointsLedger.user_id, PointsSnapshot.balance)
+    ).all()
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert_(PointsSnapshot)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={
+                'ledger_id': statement.excluded.ledger_id,
+                'balance': statement.excluded.balance,
+                'taken_at': statement.excluded.taken_at
+            }
+        ),
+        [
+            {'user_id': user_id, 'ledger_id': ledger_id, 'balance': balance, 'taken_at': datetime.now()}
+            for user_id, ledger_id, balance in rows
+        ]
+    )
+
+def open_balances() -> int:
+    """Give every user with points or ledger entries, but no opening balance, an opening-balance entry.
+
+    Points awarded before the ledger existed have no history, including
+    those of users who have earned more since it went live; the opening
+    entry is whatever users.points holds beyond the ledger's total, so the
+    two agree afterwards. One INSERT ... SELECT records them all and
+    running it again opens only users who are new since. Returns the
+    number of users opened.
+    """
+    ledger_points = select(func.coalesce(func.sum(PointsLedger.points), 0)).where(
+        PointsLedger.user_id == User.id
+    ).scalar_subquery()
+    cached_points = func.coalesce(User.points, 0)
+    with session_scope() as db:
+        # RETURNING, since drivers may report no rowcount for INSERT ... SELECT
+        opened = db.execute(
+            insert(PointsLedger).from_select(
+                ['user_id', 'points', 'source', 'created_at'],
+                select(
+                    User.id, cached_points - ledger_points, literal('opening_balance'), literal(datetime.now())
+                ).where(
+                    (cached_points != 0) | exists().where(PointsLedger.user_id == User.id),
+                    ~exists().where(PointsLedger.user_id == User.id, PointsLedger.source == 'opening_balance')
+                )
+            ).returning(PointsLedger.id)
+        ).all()
+    return len(opened)
+
+def fetch_drift(db: Session, first_id: int, last_id: int) -> list:
+    """Users with ids in [first_id, last_id] whose cache or snapshot disagrees with the ledger.
+
+    One statement reads users.points and the ledger together, so a write
+    committing mid-check cannot show up as drift.
+    """
+    totals = select(
+        PointsLedger.user_id,
+        func.sum(PointsLedger.points).label('ledger_points'),
+        # Ledger total up to the snapshot, to check the snapshot itself
+        func.sum(case((PointsLedger.id <= PointsSnapshot.ledger_id, PointsLedger.points), else_=0)).label('snapshot_points'),
+        func.max(case((PointsLedger.source == 'opening_balance', 1), else_=0)).label('opened')
+    ).outerjoin(PointsSnapshot, PointsSnapshot.user_id == PointsLedger.user_id).where(
+        PointsLedger.user_id.between(first_id, last_id)
+    ).group_by(PointsLedger.user_id).subquery()
+
+    ledger_points = func.coalesce(totals.c.ledger_points, 0)
+    cached_points = func.coalesce(User.points, 0)
+    snapshot_points = func.coalesce(totals.c.snapshot_points, 0)
+    rows = db.execute(
+        select(User.id, cached_points, ledger_points, PointsSnapshot.balance, snapshot_points,
+               func.coalesce(totals.c.opened, 0))
+        .outerjoin(totals, totals.c.user_id == User.id)
+        .outerjoin(PointsSnapshot, PointsSnapshot.user_id == User.id)
+        .where(
+            User.id.between(first_id, last_id),
+            (cached_points != ledger_points) | and_(
+                PointsSnapshot.balance.isnot(None), PointsSnapshot.balance != snapshot_points
+            )
+        )
+    ).all()
+    return [
+        {
+            'user_id': user_id,
+            'cached_points': cached,
+            'ledger_points': ledger,
+            'snapshot_ok': snapshot_balance is None or snapshot_balance == snapshot_total,
+            'opened': bool(opened)
+        }
+        for user_id, cached, ledger, snapshot_balance, snapshot_total, opened in rows
+    ]
+
+def repair_drift(db: Session, drift: list) -> list:
+    """Bring drifted caches back to the ledger and drop bad snapshots.
+
+    A cache above the ledger for a user without an opening balance is most
+    likely points from before the ledger, not drift, so it is left alone
+    until open-balances records them. Returns the ids of users left alone.
+    """
+    unopened = []
+    for entry in drift:
+        correction = entry['ledger_points'] - entry['cached_points']
+        if correction < 0 and not entry['opened']:
+            unopened.append(entry['user_id'])
+        elif correction:
+            # Apply the difference rather than the total, so increments
+            # committed since the check are kept
+            db.execute(
+                update(User)
+                .where(User.id == entry['user_id'])
+                .values(points=func.coalesce(User.points, 0) + correction)
+                .execution_options(synchronize_session=False)
+            )
+    bad_snapshots = [entry['user_id'] for entry in drift if not entry['snapshot_ok']]
+    if bad_snapshots:
+        # The next balance read sums the full ledger and snapshots it again
+        db.execute(delete(PointsSnapshot).where(PointsSnapshot.user_id.in_(bad_snapshots)))
+    leaderboard.invalidate()
+    return unopened
+
+def reconcile_points(batch_size: int = DEFAULT_BATCH_SIZE, repair: bool = False, progress=None) -> list:
+    """Recompute every balance from the ledger in chunks of users and return the drift found.
+
+    Each chunk is checked in its own short transaction with plain reads,
+    so the users table is never locked and writers carry on throughout.
+    With repair, drifted users are fixed chunk by chunk as they are found;
+    those repair_drift leaves alone are marked 'unrepaired'.
+    """
+    last_id = 0
+    checked = 0
+    drifted = []
+    while True:
+        with session_scope() as db:
+            user_ids = db.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            ).scalars().all()
+            if not user_ids:
+                break
+            drift = fetch_drift(db, user_ids[0], user_ids[-1])
+            if repair and drift:
+                unopened = set(repair_drift(db, drift))
+                for entry in drift:
+                    entry['unrepaired'] = entry['user_id'] in unopened
+
+        drifted.extend(drift)
+        last_id = user_ids[-1]
+        checked += len(user_ids)
+        if progress:
+            progress(checked, last_id, len(drifted))
+    return drifted
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the points ledger.")
+    parser.add_argument('command', choices=['open-balances', 'reconcile'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--repair', action='store_true', help="fix drifted caches and snapshots")
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    if args.command == 'open-balances':
+        print(f"Done: opened ledger balances for {open_balances():,} users")
+        return
+
+    drifted = reconcile_points(
+        args.batch_size, args.repair,
+        progress=lambda count, last_id, drift: print(
+            f"{count:,} users checked (through id {last_id}), {drift:,} drifted", flush=True)
+    )
+    for entry in drifted:
+        problems = []
+        if entry['cached_points'] != entry['ledger_points']:
+            problems.append(f"cached {entry['cached_points']:,} vs ledger {entry['ledger_points']:,}")
+        if not entry['snapshot_ok']:
+            problems.append("snapshot disagrees with the ledger")
+        if entry.get('unrepaired'):
+            problems.append("points not in the ledger left alone, run open-balances first")
+        print(f"user {entry['user_id']}: " + "; ".join(problems))
+    unrepaired = sum(1 for entry in drifted if entry.get('unrepaired'))
+    print(f"Done: {len(drifted):,} users drifted"
+          + (f", repaired ({unrepaired:,} left alone)" if args.repair and drifted else ""))
+
+if __name__ == '__main__':
+    main()
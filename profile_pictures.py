@@ -0,0 +1,117 @@
+"""Profile picture storage: fixed-size thumbnails kept out of the users table.
+
+Uploads are resized to each of THUMBNAIL_SIZES and stored in profile_images
+keyed by the sha256 of the original file. Users only hold that hash, so user
+queries stay small and identical uploads are stored once. Images never
+change once written, which makes them safe to cache by reference.
+"""
+import base64
+import binascii
+import hashlib
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from models import ProfileImage, User, session_scope
+
+# Square edge length in pixels for each stored size
+THUMBNAIL_SIZES = {
+    'small': 64,
+    'large': 256
+}
+THUMBNAIL_FORMAT = 'JPEG'
+THUMBNAIL_CONTENT_TYPE = 'image/jpeg'
+
+# Legacy pictures can be megabytes each, so migrate a few users at a time
+PICTURE_BATCH_SIZE = 100
+
+def make_thumbnails(image_bytes: bytes) -> dict:
+    """Center-crop and resize an image to every thumbnail size, as JPEG bytes.
+
+    Raises ValueError when the bytes are not a readable image.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError("Uploaded file is not a supported image") from e
+
+    thumbnails = {}
+    for size, edge in THUMBNAIL_SIZES.items():
+        thumbnail = ImageOps.fit(image, (edge, edge), Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, THUMBNAIL_FORMAT, quality=85, optimize=True)
+        thumbnails[size] = buffer.getvalue()
+    return thumbnails
+
+def picture_ref(image_bytes: bytes) -> str:
+    """The reference an uploaded file is stored under."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def store_profile_picture(db: Session, user_id: int, image_bytes: bytes) -> str:
+    """Store an upload's thumbnails and point the user at them; returns the reference."""
+    source_hash = picture_ref(image_bytes)
+    exists = db.execute(
+        select(ProfileImage.size).where(ProfileImage.source_hash == source_hash).limit(1)
+    ).first()
+    if not exists:
+        db.add_all(
+            ProfileImage(source_hash=source_hash, size=size, content_type=THUMBNAIL_CONTENT_TYPE, data=data)
+            for size, data in make_thumbnails(image_bytes).items()
+        )
+    db.execute(update(User).where(User.id == user_id).values(profile_picture_ref=source_hash))
+    return source_hash
+
+def load_profile_image(db: Session, ref: str, size: str = 'large'):
+    """Thumbnail bytes for a picture reference, or None."""
+    if not ref:
+        return None
+    return db.execute(
+        select(ProfileImage.data).where(ProfileImage.source_hash == ref, ProfileImage.size == size)
+    ).scalar()
+
+def decode_data_uri(data_uri: str):
+    """Image bytes from a 'data:image/...;base64,...' string, or None."""
+    _, _, encoded = data_uri.partition('base64,')
+    try:
+        return base64.b64decode(encoded, validate=True) if encoded else None
+    except (binascii.Error, ValueError):
+        return None
+
+def migrate_legacy_pictures(batch_size: int = PICTURE_BATCH_SIZE, progress=None) -> int:
+    """Move base64 pictures out of users.profile_picture into profile_images.
+
+    Each batch commits on its own; the legacy column is cleared for each user
+    migrated. Returns the number of users migrated.
+    """
+    last_id = 0
+    migrated = 0
+    while True:
+        with session_scope() as db:
+            rows = db.execute(
+                select(User.id, User.profile_picture).where(
+                    User.id > last_id,
+                    User.profile_picture.isnot(None)
+                ).order_by(User.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            for user_id, data_uri in rows:
+                image_bytes = decode_data_uri(data_uri)
+                if not image_bytes:
+                    continue
+                try:
+                    store_profile_picture(db, user_id, image_bytes)
+                except ValueError:
+                    # Unreadable pictures stay in the legacy column for inspection
+                    continue
+                db.execute(update(User).where(User.id == user_id).values(profile_picture=None))
+                migrated += 1
+
+        last_id = rows[-1][0]
+        if progress:
+            progress(migrated, last_id)
+    return migrated
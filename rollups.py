@@ -0,0 +1,113 @@
+"""Maintenance of the daily_emissions rollup.
+
+Every activity insert adds to its (user, day, activity type) row in the same
+transaction, so dashboards read O(days) rows instead of scanning activities.
+Backfills and repairs rebuild the rollup from activities:
+
+    python rollups.py rebuild [--user-id 42] [--batch-size 500]
+"""
+import argparse
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import Activity, DailyEmission, User, bootstrap_schema, session_scope
+
+DEFAULT_BATCH_SIZE = 500
+
+def aggregate_daily_emissions(rows) -> list:
+    """Collapse activity rows (user_id, date, activity_type, emissions) into rollup increments."""
+    totals = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        total = totals[(row['user_id'], row['date'].date(), row['activity_type'])]
+        total[0] += row['emissions']
+        total[1] += 1
+    return [
+        {'user_id': user_id, 'day': day, 'activity_type': activity_type,
+         'emissions': emissions, 'activity_count': count}
+        for (user_id, day, activity_type), (emissions, count) in totals.items()
+    ]
+
+def upsert_daily_emissions(db: Session, increments: list):
+    """Add rollup increments, creating missing (user, day, activity type) rows."""
+    if not increments:
+        return
+    dialect = db.get_bind().dialect.name
+    insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert_(DailyEmission)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=['user_id', 'day', 'activity_type'],
+            set_={
+                'emissions': DailyEmission.emissions + statement.excluded.emissions,
+                'activity_count': DailyEmission.activity_count + statement.excluded.activity_count
+            }
+        ),
+        increments
+    )
+
+def recompute_daily_emissions(db, user_ids=None):
+    """Replace the rollup rows of the given users (default: everyone) with sums over their activities.
+
+    Takes a session or a connection; runs in its transaction.
+    """
+    clear = delete(DailyEmission)
+    day = func.date(Activity.date)
+    summed = select(
+        Activity.user_id,
+        day,
+        Activity.activity_type,
+        func.coalesce(func.sum(Activity.emissions), 0),
+        func.count(Activity.id)
+    )
+    if user_ids is not None:
+        clear = clear.where(DailyEmission.user_id.in_(list(user_ids)))
+        summed = summed.where(Activity.user_id.in_(list(user_ids)))
+    db.execute(clear)
+    db.execute(insert(DailyEmission).from_select(
+        ['user_id', 'day', 'activity_type', 'emissions', 'activity_count'],
+        summed.group_by(Activity.user_id, day, Activity.activity_type)
+    ))
+
+def rebuild_daily_emissions(user_id: int = None, batch_size: int = DEFAULT_BATCH_SIZE, progress=None) -> int:
+    """Recompute the rollup from activities, one batch of users per transaction.
+
+    Returns the number of users rebuilt.
+    """
+    last_id = 0
+    rebuilt = 0
+    while True:
+        with session_scope() as db:
+            query = select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            if user_id is not None:
+                query = query.where(User.id == user_id)
+            user_ids = db.execute(query).scalars().all()
+            if not user_ids:
+                break
+
+            recompute_daily_emissions(db, user_ids)
+
+        last_id = user_ids[-1]
+        rebuilt += len(user_ids)
+        if progress:
+            progress(rebuilt, last_id)
+    return rebuilt
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily emissions rollup.")
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--user-id', type=int, help="only rebuild this user")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    bootstrap_schema()
+
+    rebuilt = rebuild_daily_emissions(
+        args.user_id, args.batch_size,
+        progress=lambda count, last_id: print(f"{count:,} users rebuilt (through id {last_id})", flush=True)
+    )
+    print(f"Done: rebuilt the rollup for {rebuilt:,} users")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""Headless data access: every operation takes an explicit session and user id.
+
+Nothing here touches Streamlit, so background workers, batch jobs, load
+generators and the HTTP API call the same code as the pages. Functions
+work in the caller's transaction; data_manager wraps them for the pages,
+reading the user from st.session_state.
+"""
+import json
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import leaderboard
+from carbon_calculator import (
+    CarbonIntensitySeries,
+    FOOD_EMISSIONS_FACTORS,
+    TRANSPORT_EMISSIONS_FACTORS,
+    calculate_energy_emissions,
+    calculate_food_emissions,
+    calculate_transport_emissions
+)
+from gamification import (
+    LOW_ENERGY_KWH,
+    PLANT_BASED_FOODS,
+    aggregate_achievement_counters,
+    award_points,
+    fetch_achievement_names,
+    insert_achievements,
+    unlock_achievements,
+    upsert_achievement_counters
+)
+from models import User, Activity, DailyEmission, BusRide, activity_detail_columns
+from points_ledger import record_points
+from profile_pictures import store_profile_picture
+from rollups import upsert_daily_emissions
+
+def get_or_create_user(db: Session, username: str):
+    """Get existing user or create new one; the caller's transaction commits it."""
+    user = db.query(User).filter(User.username == username).first()
+    if not user:
+        user = User(username=username)
+        try:
+            # A savepoint, so losing the race rolls back only this insert
+            with db.begin_nested():
+                db.add(user)
+                db.flush()
+        except IntegrityError:
+            # Another request created the same username first
+            return db.query(User).filter(User.username == username).one()
+    return user
+
+USER_DATA_COLUMNS = ['date', 'activity_type', 'details', 'emissions']
+ACTIVITY_LOAD_CHUNK_SIZE = 5000
+
+def fetch_new_activities(db: Session, user_id: int, after_id: int = 0, chunk_size: int = ACTIVITY_LOAD_CHUNK_SIZE):
+    """Yield (max_id, DataFrame) chunks of a user's activities with id > after_id."""
+    # Imported here so the API and pages that never build a history do not load pandas
+    import pandas as pd
+
+    query = select(
+        Activity.id,
+        Activity.date,
+        Activity.activity_type,
+        Activity.details,
+        Activity.emissions
+    ).where(
+        Activity.user_id == user_id,
+        Activity.id > after_id
+    ).order_by(Activity.id).execution_options(yield_per=chunk_size)
+
+    # yield_per streams the result so the first load never holds every row at once
+    for rows in db.execute(query).partitions():
+        chunk = pd.DataFrame(rows, columns=['id'] + USER_DATA_COLUMNS)
+        yield int(chunk['id'].iloc[-1]), chunk[USER_DATA_COLUMNS]
+
+def increment_user_points(db: Session, user_id: int, points: int, source: str, reference=None) -> int:
+    """Record a points change in the ledger, apply it atomically and return the new balance."""
+    new_points = record_points(db, user_id, points, source, reference)
+    leaderboard.note_points_change(db, user_id, new_points)
+    return new_points
+
+def _quantity(details: dict, field: str) -> float:
+    # Negative or non-finite quantities would score negative emissions or unearned points
+    value = float(details[field])
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"{field} must be a finite number, 0 or more")
+    return value
+
+def score_activity(activity_type: str, details: dict, timestamp: datetime = None,
+                   series: CarbonIntensitySeries = None):
+    """Emissions and points for an activity, with the same awards as the Track Activities page.
+
+    Energy is scored at the grid's carbon intensity at timestamp, from
+    series where it has a value; without a timestamp, at the average factor.
+    Raises ValueError for an unknown activity type or missing or invalid details.
+    """
+    try:
+        if activity_type == 'transport':
+            if details['type'] not in TRANSPORT_EMISSIONS_FACTORS:
+                raise ValueError(f"Unknown transport type {details['type']!r}")
+            distance = _quantity(details, 'distance')
+            emissions, bonus_points = calculate_transport_emissions(details['type'], distance)
+            return emissions, award_points('transport', 0, bonus_points)
+        if activity_type == 'food':
+            if details['type'] not in FOOD_EMISSIONS_FACTORS:
+                raise ValueError(f"Unknown food type {details['type']!r}")
+            portions = int(_quantity(details, 'portions'))
+            emissions = calculate_food_emissions(details['type'], portions)
+            if details['type'] in PLANT_BASED_FOODS:
+                return emissions, award_points('food', calculate_food_emissions('meat', portions) - emissions)
+            return emissions, 0
+        if activity_type == 'energy':
+            kwh = _quantity(details, 'kwh')
+            emissions = calculate_energy_emissions(kwh, timestamp, series)
+            return emissions, award_points('energy', emissions) if kwh < LOW_ENERGY_KWH else 0
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid {activity_type} details: {e!r}") from None
+    raise ValueError(f"Unknown activity type {activity_type!r}")
+
+def record_activity(db: Session, user_id: int, activity_type: str, details: dict, emissions: float,
+                    points: int = 0, date: datetime = None):
+    """Insert an activity, award its points and unlock any achievements in the caller's transaction.
+
+    The daily emissions rollup and the achievement counters are updated in
+    the same transaction. Returns the user's new point balance and the
+    achievements newly unlocked. date defaults to now.
+    """
+    now = date or datetime.now()
+    columns = activity_detail_columns(activity_type, details)
+    activity = Activity(
+        user_id=user_id,
+        activity_type=activity_type,
+        details=json.dumps(details),
+        emissions=emissions,
+        date=now,
+        **columns
+    )
+    db.add(activity)
+    db.flush()
+    upsert_daily_emissions(db, [{
+        'user_id': user_id,
+        'day': now.date(),
+        'activity_type': activity_type,
+        'emissions': emissions,
+        'activity_count': 1
+    }])
+    upsert_achievement_counters(db, aggregate_achievement_counters([
+        dict(columns, user_id=user_id, activity_type=activity_type)
+    ]))
+    new_points = increment_user_points(db, user_id, points, 'activity', activity.id)
+    new_achievements = unlock_achievements(db, user_id)
+    return new_points, new_achievements
+
+def fetch_emissions_summary(db: Session, user_id: int, now: datetime = None):
+    """Sum a user's emissions for today, the last 7 and the last 30 calendar days.
+
+    Reads the daily_emissions rollup with one conditional-aggregate query, so
+    the cost depends on the number of days, not the number of activities.
+    """
+    today = (now or datetime.now()).date()
+    week_start = today - timedelta(days=6)
+    month_start = today - timedelta(days=29)
+
+    daily, weekly, monthly = db.query(
+        func.coalesce(func.sum(case((DailyEmission.day >= today, DailyEmission.emissions), else_=0)), 0),
+        func.coalesce(func.sum(case((DailyEmission.day >= week_start, DailyEmission.emissions), else_=0)), 0),
+        func.coalesce(func.sum(DailyEmission.emissions), 0)
+    ).filter(
+        DailyEmission.user_id == user_id,
+        DailyEmission.day >= month_start
+    ).one()
+
+    return {
+        'daily': float(daily),
+        'weekly': float(weekly),
+        'monthly': float(monthly)
+    }
+
+def fetch_daily_emissions(db: Session, user_id: int, since: datetime = None):
+    """A user's emissions per day and activity type from the rollup, oldest first."""
+    query = db.query(
+        DailyEmission.day,
+        DailyEmission.activity_type,
+        DailyEmission.emissions,
+        DailyEmission.activity_count
+    ).filter(DailyEmission.user_id == user_id)
+    if since is not None:
+        query = query.filter(DailyEmission.day >= since.date())
+
+    return [
+        {'day': day, 'activity_type': activity_type, 'emissions': emissions, 'count': count}
+        for day, activity_type, emissions, count in query.order_by(DailyEmission.day)
+    ]
+
+# Grouping column and summed quantity column for each activity type's breakdown
+BREAKDOWN_COLUMNS = {
+    'transport': (Activity.transport_type, Activity.distance),
+    'food': (Activity.food_type, Activity.portions),
+    'energy': (Activity.activity_type, Activity.kwh)
+}
+
+def fetch_category_breakdown(db: Session, user_id: int, activity_type: str, since: datetime = None):
+    """Count, quantity and emissions per transport/food type (or total kWh) as a SQL GROUP BY."""
+    category, quantity = BREAKDOWN_COLUMNS[activity_type]
+    query = db.query(
+        category,
+        func.count(Activity.id),
+        func.coalesce(func.sum(quantity), 0),
+        func.coalesce(func.sum(Activity.emissions), 0)
+    ).filter(
+        Activity.user_id == user_id,
+        Activity.activity_type == activity_type
+    )
+    if since is not None:
+        query = query.filter(Activity.date >= since)
+
+    return [
+        {'category': name, 'count': count, 'quantity': float(total), 'emissions': float(emissions)}
+        for name, count, total, emissions in query.group_by(category).order_by(category)
+    ]
+
+def fetch_leaderboard(db: Session, limit: int = leaderboard.LEADERBOARD_SIZE):
+    """Top users by points."""
+    return [{'name': entry['name'], 'points': entry['points']} for entry in leaderboard.get_top(db, limit)]
+
+def record_bus_ride(db: Session, user_id: int, route_name: str, distance: float, points_earned: int,
+                    date: datetime = None, trace_hash: str = None) -> int:
+    """Store a bus ride, award its points and unlock any achievements; returns the user's new points total."""
+    ride = BusRide(
+        user_id=user_id,
+        route_name=route_name,
+        distance=distance,
+        points_earned=points_earned,
+        date=date or datetime.now(),
+        trace_hash=trace_hash
+    )
+    db.add(ride)
+    db.flush()
+    new_points = increment_user_points(db, user_id, points_earned, 'bus_ride', ride.id)
+    unlock_achievements(db, user_id)
+    return new_points
+
+def fetch_rank(db: Session, user_id: int) -> int:
+    """A user's 1-based leaderboard rank."""
+    return leaderboard.get_rank(db, user_id)
+
+def award_user_points(db: Session, user_id: int, points: int, source: str, reference=None):
+    """Credit points outside an activity or ride and unlock any achievements they earn.
+
+    Returns the user's new point balance and the achievements newly unlocked.
+    """
+    new_points = increment_user_points(db, user_id, points, source, reference)
+    return new_points, unlock_achievements(db, user_id)
+
+def fetch_user_achievements(db: Session, user_id: int) -> set:
+    """Names of the achievements a user has unlocked."""
+    return fetch_achievement_names(db, user_id)
+
+def add_user_achievement(db: Session, user_id: int, achievement_name: str) -> bool:
+    """Grant an achievement outside the rules; returns whether it was new."""
+    return bool(insert_achievements(db, user_id, [achievement_name]))
+
+def fetch_user_profile(db: Session, user_id: int) -> dict:
+    """A user's display name, description, picture reference and points."""
+    user = db.get(User, user_id)
+    return {
+        'display_name': user.display_name or user.username,
+        'description': user.description or "No description provided",
+        'profile_picture': user.profile_picture_ref,
+        'points': user.points
+    }
+
+def update_user_profile(db: Session, user_id: int, display_name: str = None, description: str = None,
+                        profile_picture: bytes = None) -> dict:
+    """Update profile fields that are given; profile_picture is the uploaded image file's bytes.
+
+    Returns the updated profile.
+    """
+    user = db.get(User, user_id)
+    if display_name:
+        user.display_name = display_name
+    if description:
+        user.description = description
+    if profile_picture:
+        store_profile_picture(db, user.id, profile_picture)
+    db.flush()
+    return fetch_user_profile(db, user_id)
+
+def record_detected_rides(db: Session, user_id: int, rides):
+    """Store bus rides detected in a GPS trace and award their points.
+
+    Rides come from trace_matching.match_trace; a trace whose hash the user
+    has already stored rides from is an earlier upload, and nothing of it
+    is stored again. Returns the rides stored, each with its points_earned,
+    and the user's points balance afterwards (None when nothing was stored).
+    """
+    from trace_matching import ride_points  # loads pandas; only trace uploads need it
+
+    stored = []
+    new_points = None
+    recorded = {
+        trace_hash for trace_hash in {ride['trace_hash'] for ride in rides}
+        if db.execute(
+            select(BusRide.id).where(BusRide.user_id == user_id, BusRide.trace_hash == trace_hash).limit(1)
+        ).first()
+    }
+    for ride in rides:
+        if ride['trace_hash'] in recorded:
+            continue
+        points_earned = ride_points(ride)
+        new_points = record_bus_ride(db, user_id, ride['route_name'], ride['distance'], points_earned,
+                                     datetime.fromtimestamp(ride['started_at']), ride['trace_hash'])
+        stored.append(dict(ride, points_earned=points_earned))
+    return stored, new_points
+
+def fetch_bus_rides(db: Session, user_id: int) -> list:
+    """A user's bus rides, newest first."""
+    rides = db.execute(
+        select(BusRide.date, BusRide.route_name, BusRide.distance, BusRide.points_earned)
+        .where(BusRide.user_id == user_id)
+        .order_by(BusRide.date.desc())
+    ).mappings().all()
+    return [dict(ride) for ride in rides]
@@ -0,0 +1,161 @@
+"""Grid spatial index for "what is near me" queries over lat/lon points.
+
+Points are bucketed into square cells of a fixed size in degrees and stored
+sorted by cell, so the cells under a query circle are a handful of
+contiguous slices found with searchsorted. Candidate distances are computed
+with a vectorized haversine. Longitudes are not wrapped at the antimeridian,
+which is fine for Hawaii.
+"""
+import math
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+from gtfs import get_default_feed
+from map_data import get_activity_locations, get_bus_routes, get_store_locations
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = np.pi * EARTH_RADIUS_KM / 180
+DEFAULT_CELL_SIZE = 0.01  # degrees, about 1.1 km
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works elementwise on arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+class SpatialIndex:
+    """Static k-nearest and radius index over (lat, lon) points."""
+
+    def __init__(self, lats, lons, cell_size: float = DEFAULT_CELL_SIZE):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.cell_size = cell_size
+        self.size = len(lats)
+        self.lat0 = lats.min() if self.size else 0.0
+        self.lon0 = lons.min() if self.size else 0.0
+        rows = self._rows(lats)
+        cols = self._cols(lons)
+        self.n_rows = int(rows.max()) + 1 if self.size else 1
+        self.n_cols = int(cols.max()) + 1 if self.size else 1
+
+        keys = rows * self.n_cols + cols
+        order = np.argsort(keys, kind='stable')
+        # Points are kept in cell order so each grid row of a query is one slice
+        self.keys = keys[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.ids = order
+
+        # Average area per point, used to size the first nearest() search circle
+        cos_lat = math.cos(math.radians(float(lats.mean()))) if self.size else 1.0
+        extent_km2 = (self.n_rows * cell_size * KM_PER_DEGREE_LAT) * (self.n_cols * cell_size * KM_PER_DEGREE_LAT * cos_lat)
+        self.km2_per_point = extent_km2 / max(self.size, 1)
+
+    def _rows(self, lats):
+        return np.floor((lats - self.lat0) / self.cell_size).astype(np.int64)
+
+    def _cols(self, lons):
+        return np.floor((lons - self.lon0) / self.cell_size).astype(np.int64)
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Positions (in cell order) of points in the cells overlapping the query circle.
+
+        Circles off the edge of the grid are clamped to its border cells; the
+        callers' distance check drops anything that does not really qualify.
+        """
+        # Scalar math here: numpy call overhead would dominate for four numbers
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        dlon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        last_row, last_col = self.n_rows - 1, self.n_cols - 1
+        row_lo = min(max(math.floor((lat - dlat - self.lat0) / self.cell_size), 0), last_row)
+        row_hi = min(max(math.floor((lat + dlat - self.lat0) / self.cell_size), 0), last_row)
+        col_lo = min(max(math.floor((lon - dlon - self.lon0) / self.cell_size), 0), last_col)
+        col_hi = min(max(math.floor((lon + dlon - self.lon0) / self.cell_size), 0), last_col)
+
+        row_keys = np.arange(row_lo, row_hi + 1) * self.n_cols
+        starts = np.searchsorted(self.keys, row_keys + col_lo, side='left')
+        ends = np.searchsorted(self.keys, row_keys + col_hi, side='right')
+        if len(starts) == 1:
+            return np.arange(starts[0], ends[0])
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def within(self, lat: float, lon: float, radius_km: float):
+        """Ids and distances of points within radius_km, nearest first."""
+        positions = self._candidates(lat, lon, radius_km)
+        distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+        inside = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        nearest_first = np.argsort(distances, kind='stable')
+        return self.ids[positions[nearest_first]], distances[nearest_first]
+
+    def nearest(self, lat: float, lon: float, k: int = 1):
+        """Ids and distances of the k nearest points, nearest first."""
+        k = min(k, self.size)
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Grow the search circle until it holds k points; anything outside the
+        # circle is farther than everything inside it, so those k are exact.
+        # The first circle is sized to hold about 2k points at average density.
+        radius_km = math.sqrt(2 * k * self.km2_per_point / math.pi)
+        max_radius_km = np.pi * EARTH_RADIUS_KM
+        while True:
+            positions = self._candidates(lat, lon, radius_km)
+            distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+            inside = distances <= radius_km
+            if inside.sum() >= k or radius_km >= max_radius_km:
+                break
+            radius_km *= 2
+
+        positions, distances = positions[inside], distances[inside]
+        if len(distances) > k:
+            closest = np.argpartition(distances, k - 1)[:k]
+            positions, distances = positions[closest], distances[closest]
+        nearest_first = np.argsort(distances, kind='stable')
+        return self.ids[positions[nearest_first]], distances[nearest_first]
+
+def bus_stop_locations():
+    """Bus stops from the GTFS feed, or points along each bus route without one."""
+    feed = get_default_feed()
+    if feed is not None:
+        return [
+            {'name': stop['name'], 'location': stop['location'], 'route': ', '.join(stop['routes'])}
+            for stop in feed.stops()
+        ]
+
+    stops = {}
+    for route in get_bus_routes():
+        for point in route['path']:
+            # Loop routes repeat their first point at the end
+            stops.setdefault((route['name'], tuple(point)), {'name': route['name'], 'location': point, 'route': route['name']})
+    return list(stops.values())
+
+LOCATION_SOURCES = {
+    'store': get_store_locations,
+    'activity': get_activity_locations,
+    'bus_stop': bus_stop_locations
+}
+
+@lru_cache(maxsize=1)
+def _location_indexes(day: date) -> dict:
+    # Activity dates are relative to today, so the indexes are rebuilt daily
+    indexes = {}
+    for kind, source in LOCATION_SOURCES.items():
+        items = source()
+        locations = np.array([item['location'] for item in items], dtype=np.float64).reshape(-1, 2)
+        indexes[kind] = (SpatialIndex(locations[:, 0], locations[:, 1]), items)
+    return indexes
+
+def find_nearest(lat: float, lon: float, kind: str, k: int = 3) -> list:
+    """The k nearest stores, activities or bus stops, each with a 'distance_km'."""
+    index, items = _location_indexes(date.today())[kind]
+    ids, distances = index.nearest(lat, lon, k)
+    return [dict(items[i], distance_km=float(d)) for i, d in zip(ids, distances)]
+
+def find_within(lat: float, lon: float, kind: str, radius_km: float) -> list:
+    """Stores, activities or bus stops within radius_km, nearest first."""
+    index, items = _location_indexes(date.today())[kind]
+    ids, distances = index.within(lat, lon, radius_km)
+    return [dict(items[i], distance_km=float(d)) for i, d in zip(ids, distances)]
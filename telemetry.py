@@ -0,0 +1,241 @@
+"""Grid telemetry history: array ring buffers filled by a background sampler.
+
+Readings are kept at three resolutions, each in its own fixed-size ring
+buffer: one per second for the last hour, one-minute means for the last
+week and hourly means for the last quarter. Coarser levels are folded in
+as samples arrive, using a running sum for the bucket in progress, so
+charting a day or a week reads precomputed points instead of aggregating
+raw samples on every rerun.
+
+The sampler runs on a daemon thread, independent of Streamlit script
+runs. Its source is any callable returning a reading dict like
+energy_data.get_real_time_energy_data; TELEMETRY_SOURCE picks one, either
+'simulator' (the default) or a 'module:function' path to a real feed.
+"""
+import importlib
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from carbon_calculator import CarbonIntensitySeries
+from energy_data import GridSimulator
+
+FIELDS = ('total_demand', 'solar_contribution', 'wind_contribution', 'renewable_percentage')
+
+# name: (seconds per point, points kept)
+RESOLUTIONS = {
+    '1s': (1, 3600),
+    '1min': (60, 7 * 24 * 60),
+    '1h': (3600, 90 * 24)
+}
+
+SAMPLE_INTERVAL = float(os.environ.get('TELEMETRY_INTERVAL', 1))  # seconds
+BACKFILL_SECONDS = 7 * 24 * 3600
+
+class RingBuffer:
+    """Fixed-capacity (time, values) series; the oldest points are overwritten."""
+
+    def __init__(self, capacity: int, n_fields: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, n_fields))
+        self.head = 0  # next slot to write
+        self.size = 0
+
+    def extend(self, times, values):
+        n = len(times)
+        if n >= self.capacity:
+            times, values, n = times[-self.capacity:], values[-self.capacity:], self.capacity
+        slots = (self.head + np.arange(n)) % self.capacity
+        self.times[slots] = times
+        self.values[slots] = values
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def ordered(self):
+        """(times, values) oldest first, as copies."""
+        start = (self.head - self.size) % self.capacity
+        slots = (start + np.arange(self.size)) % self.capacity
+        return self.times[slots], self.values[slots]
+
+class TimeSeriesStore:
+    """Thread-safe multi-resolution history of grid readings."""
+
+    def __init__(self, fields=FIELDS, resolutions=RESOLUTIONS):
+        self.fields = tuple(fields)
+        self.resolutions = dict(resolutions)
+        self.buffers = {name: RingBuffer(capacity, len(self.fields)) for name, (_, capacity) in self.resolutions.items()}
+        # Per resolution: [bucket start, summed values, sample count] of the bucket in progress
+        self.pending = {name: None for name in self.resolutions}
+        self.latest = None
+        self.last_time = -np.inf
+        self._lock = threading.Lock()
+
+    def append(self, timestamp: float, reading: dict):
+        """Add one reading taken at timestamp (epoch seconds)."""
+        self.extend(np.array([timestamp]), np.array([[reading[field] for field in self.fields]]))
+
+    def extend(self, times, values):
+        """Add readings in time order; anything not newer than the last reading is dropped."""
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), len(self.fields))
+        with self._lock:
+            newer = times > self.last_time
+            times, values = times[newer], values[newer]
+            if not len(times):
+                return
+            for name, (step, _) in self.resolutions.items():
+                self._fold(name, step, times, values)
+            self.last_time = times[-1]
+            # Same shape as energy_data.get_real_time_energy_data()
+            self.latest = dict(zip(self.fields, values[-1].tolist()),
+                               timestamp=datetime.fromtimestamp(times[-1]).strftime('%Y-%m-%d %H:%M:%S'))
+
+    def _fold(self, name: str, step: int, times, values):
+        """Close every bucket these samples complete and carry the last one forward."""
+        buckets = np.floor(times / step) * step
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        sums = np.add.reduceat(values, starts, axis=0)
+        counts = np.diff(np.r_[starts, len(times)])
+
+        pending = self.pending[name]
+        if pending is not None:
+            if pending[0] == buckets[0]:
+                sums[0] += pending[1]
+                counts[0] += pending[2]
+            else:
+                self.buffers[name].extend(np.array([pending[0]]), (pending[1] / pending[2])[None])
+
+        if len(starts) > 1:
+            self.buffers[name].extend(buckets[starts[:-1]], sums[:-1] / counts[:-1, None])
+        self.pending[name] = [buckets[starts[-1]], sums[-1], counts[-1]]
+
+    def resolution_for(self, span_seconds: float) -> str:
+        """The finest resolution whose buffer covers span_seconds."""
+        for name, (step, capacity) in self.resolutions.items():
+            if step * capacity >= span_seconds:
+                return name
+        return name
+
+    def arrays(self, span_seconds: float, resolution: str = None):
+        """(epoch seconds, values) from the last span_seconds, oldest first.
+
+        The bucket still in progress is included as its running mean, so
+        the newest point is never more than one sample old.
+        """
+        resolution = resolution or self.resolution_for(span_seconds)
+        with self._lock:
+            times, values = self.buffers[resolution].ordered()
+            pending = self.pending[resolution]
+            if pending is not None:
+                times = np.r_[times, pending[0]]
+                values = np.vstack((values, pending[1] / pending[2]))
+            since = self.last_time - span_seconds
+        recent = times > since
+        return times[recent], values[recent]
+
+    def frame(self, span_seconds: float, resolution: str = None) -> pd.DataFrame:
+        """Readings from the last span_seconds as a DataFrame with a timestamp column."""
+        times, values = self.arrays(span_seconds, resolution)
+        frame = pd.DataFrame(values, columns=self.fields)
+        # Local wall-clock times, like the datetime.now() stamps used elsewhere
+        utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+        frame.insert(0, 'timestamp', pd.to_datetime(times + utc_offset, unit='s'))
+        return frame
+
+    def intensity_series(self) -> CarbonIntensitySeries:
+        """Hourly grid carbon intensity over the whole history, from the measured renewable share."""
+        step, capacity = self.resolutions['1h']
+        frame = self.frame(step * capacity, '1h')
+        return CarbonIntensitySeries.from_renewable_share(
+            frame['timestamp'], frame['renewable_percentage'], step_seconds=step
+        )
+
+class Sampler:
+    """Polls a reading source into a store on a daemon thread.
+
+    Source errors are counted and the last one kept, without stopping the
+    loop; a feed that is briefly down just leaves a gap in the history.
+    Listeners added with add_listener are called with (timestamp, reading)
+    after each sample is stored, on the sampler thread.
+    """
+
+    def __init__(self, store: TimeSeriesStore, source, interval: float = SAMPLE_INTERVAL):
+        self.store = store
+        self.source = source
+        self.interval = interval
+        self.samples = 0
+        self.errors = 0
+        self.last_error = None
+        self.listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='grid-telemetry-sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                timestamp, reading = time.time(), self.source()
+                self.store.append(timestamp, reading)
+                self.samples += 1
+                for listener in self.listeners:
+                    listener(timestamp, reading)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = repr(e)
+            # Fixed-rate schedule; a slow source skips ticks rather than drifting
+            next_tick += self.interval
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now + self.interval - (now - next_tick) % self.interval
+            self._stop.wait(next_tick - now)
+
+def load_source(spec: str):
+    """A reading source from 'simulator' or a 'module:function' path."""
+    if spec == 'simulator':
+        return GridSimulator()
+    module_name, _, attribute = spec.partition(':')
+    if not attribute:
+        raise ValueError(f"TELEMETRY_SOURCE must be 'simulator' or 'module:function', got {spec!r}")
+    return getattr(importlib.import_module(module_name), attribute)
+
+def backfill_simulated(store: TimeSeriesStore, simulator: GridSimulator, seconds: int = BACKFILL_SECONDS, step: int = 60):
+    """Seed a store with simulated history so trends show before the sampler has run for long."""
+    now = time.time()
+    times = np.arange(now - seconds, now, step)
+    readings = [simulator(datetime.fromtimestamp(t)) for t in times.tolist()]
+    store.extend(times, [[reading[field] for field in store.fields] for reading in readings])
+
+def start_grid_telemetry():
+    """A new telemetry store over TELEMETRY_SOURCE, with its sampler running; stop the sampler when done."""
+    store = TimeSeriesStore()
+    source = load_source(os.environ.get('TELEMETRY_SOURCE', 'simulator'))
+    if isinstance(source, GridSimulator):
+        backfill_simulated(store, source)
+    sampler = Sampler(store, source).start()
+    return store, sampler
+
+@st.cache_resource
+def get_grid_telemetry():
+    """The process-wide telemetry store, with its sampler started on first use."""
+    return start_grid_telemetry()
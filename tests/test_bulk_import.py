@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+from bulk_import import _parse_record
+
+IMPORTED_AT = datetime(2024, 5, 1, 12, 0)
+
+
+@pytest.mark.parametrize('record', [
+    {'username': 'kai', 'activity_type': 'transport', 'type': 'car', 'distance': 'nan'},
+    {'username': 'kai', 'activity_type': 'transport', 'type': 'car', 'distance': 'inf'},
+    {'username': 'kai', 'activity_type': 'transport', 'type': 'car', 'distance': '-12'},
+    {'username': 'kai', 'activity_type': 'food', 'type': 'vegan', 'portions': -1},
+    {'username': 'kai', 'activity_type': 'energy', 'kwh': '-inf'},
+    {'username': 'kai', 'activity_type': 'transport', 'type': 'rocket', 'distance': 10},
+    {'username': 'kai', 'activity_type': 'transport', 'distance': 10},
+    {'username': 'kai', 'activity_type': 'food', 'type': 'pizza', 'portions': 2},
+])
+def test_rejects_unscorable_records(record):
+    assert _parse_record(record, IMPORTED_AT) is None
+
+
+def test_normalizes_subtype_case():
+    record = _parse_record({'username': 'kai', 'activity_type': 'Transport', 'type': ' Bus ', 'distance': '3.5'},
+                           IMPORTED_AT)
+    assert record['subtype'] == 'bus'
+    assert record['details'] == {'type': 'bus', 'distance': 3.5}
+    assert record['date'] == IMPORTED_AT
+
+
+def test_energy_has_no_subtype():
+    record = _parse_record({'username': 'kai', 'activity_type': 'energy', 'type': 'solar', 'kwh': 0}, IMPORTED_AT)
+    assert record['subtype'] is None
+    assert record['details'] == {'kwh': 0.0}
@@ -0,0 +1,34 @@
+import pytest
+
+from services import score_activity
+
+
+@pytest.mark.parametrize('activity_type, details', [
+    ('transport', {'type': 'car', 'distance': -100}),
+    ('transport', {'type': 'bike', 'distance': 'nan'}),
+    ('transport', {'type': 'bus', 'distance': 'inf'}),
+    ('food', {'type': 'vegan', 'portions': -3}),
+    ('food', {'type': 'meat', 'portions': 'nan'}),
+    ('food', {'type': 'vegetarian', 'portions': float('inf')}),
+    ('energy', {'kwh': -5}),
+    ('energy', {'kwh': 'nan'}),
+    ('energy', {'kwh': '-inf'}),
+])
+def test_rejects_negative_and_non_finite_quantities(activity_type, details):
+    with pytest.raises(ValueError):
+        score_activity(activity_type, details)
+
+
+@pytest.mark.parametrize('activity_type, details', [
+    ('transport', {'type': 'car', 'distance': 0}),
+    ('food', {'type': 'vegan', 'portions': 0}),
+    ('energy', {'kwh': 0}),
+])
+def test_accepts_zero_quantities(activity_type, details):
+    assert score_activity(activity_type, details) == (0, 0)
+
+
+def test_scores_valid_activities():
+    assert score_activity('transport', {'type': 'car', 'distance': 10}) == (2.5, -250)
+    emissions, points = score_activity('food', {'type': 'vegan', 'portions': 2})
+    assert emissions == 0.5 and points > 0
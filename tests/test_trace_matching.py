@@ -0,0 +1,38 @@
+import io
+import time
+
+import numpy as np
+import pytest
+
+from trace_matching import iter_trace_chunks
+
+TIMES = ['2024-03-10T08:15:00', '2024-07-01T17:45:30', '2024-11-03T23:59:59Z', '2024-11-04T06:00:00+10:00']
+
+
+def _gpx(times):
+    points = ''.join(f'<trkpt lat="21.3" lon="-157.8"><time>{time}</time></trkpt>' for time in times)
+    return f'<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>{points}</trkseg></trk></gpx>'.encode()
+
+
+def _csv(times):
+    return ('lat,lon,time\n' + ''.join(f'21.3,-157.8,{time}\n' for time in times)).encode()
+
+
+def _times(data, trace_format):
+    return np.concatenate([times for _, _, times in iter_trace_chunks(io.BytesIO(data), trace_format)])
+
+
+@pytest.mark.parametrize('times', [TIMES[:2], TIMES[2:], TIMES], ids=['naive', 'offsets', 'mixed'])
+def test_csv_and_gpx_read_times_alike(times):
+    np.testing.assert_array_equal(_times(_csv(times), 'csv'), _times(_gpx(times), 'gpx'))
+
+
+@pytest.mark.parametrize('tz', ['UTC', 'Pacific/Honolulu', 'Europe/Berlin'])
+def test_naive_times_are_server_local(monkeypatch, tz):
+    monkeypatch.setenv('TZ', tz)
+    time.tzset()
+    try:
+        np.testing.assert_array_equal(_times(_csv(TIMES[:2]), 'csv'), _times(_gpx(TIMES[:2]), 'gpx'))
+    finally:
+        monkeypatch.undo()
+        time.tzset()
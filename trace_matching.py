@@ -0,0 +1,359 @@
+"""Bus ride detection from uploaded GPS traces.
+
+Traces (GPX or CSV) are read in chunks and every point is matched against
+the bus route geometries from map_data. Route segments are bucketed into a
+grid of CELL_KM cells ahead of time, so each point is only compared with
+the few segments in its own cell, and the point-to-segment distances for a
+whole chunk are computed as one vectorized pass in a local flat projection.
+
+A ride is a run of matched points on one route, without a gap longer than
+MAX_GAP_SECONDS, that moves at least MIN_RIDE_KM along the route at bus-like
+speed. Its distance is the distance travelled along the route geometry,
+summed between samples SAMPLE_SECONDS apart so that rides out and back count
+in full, which is far less noisy than summing the raw GPS steps. Points need
+timestamps: without them neither gaps nor speeds can be told, so untimed
+points are skipped and a trace with none is refused.
+"""
+import hashlib
+import io
+import math
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+from map_data import KM_PER_MILE, get_bus_routes
+
+KM_PER_DEGREE_LAT = 111.195  # mean Earth radius
+MATCH_TOLERANCE_KM = 0.05    # GPS error plus road width
+CELL_KM = 0.1                # smaller cells mean fewer candidate segments per point
+MAX_GAP_SECONDS = 120
+SAMPLE_SECONDS = 30          # progress between samples outweighs GPS jitter
+MIN_RIDE_KM = 0.5
+MIN_BUS_SPEED_KMH = 8        # slower than this is walking along the route
+MAX_BUS_SPEED_KMH = 100
+TRACE_CHUNK_SIZE = 100_000
+
+CSV_LAT_COLUMNS = ('lat', 'latitude')
+CSV_LON_COLUMNS = ('lon', 'lng', 'long', 'longitude')
+CSV_TIME_COLUMNS = ('time', 'timestamp', 'datetime')
+
+class TraceFormatError(ValueError):
+    """An uploaded trace could not be read."""
+
+class _HashingReader:
+    """File-like wrapper that hashes everything read through it."""
+
+    def __init__(self, source):
+        self.source = source
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.sha256.update(data.encode() if isinstance(data, str) else data)
+        return data
+
+def _epoch_seconds(text) -> float:
+    """Epoch seconds of an ISO 8601 time; times without an offset are server-local."""
+    return datetime.fromisoformat(text.strip()).timestamp()
+
+def _gpx_points(source, chunk_size: int):
+    lats, lons, times = [], [], []
+    try:
+        for _, elem in ET.iterparse(source, events=('end',)):
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if tag not in ('trkpt', 'rtept'):
+                continue
+            time_text = next((child.text for child in elem if child.tag.endswith('time')), None)
+            lats.append(float(elem.get('lat')))
+            lons.append(float(elem.get('lon')))
+            times.append(_epoch_seconds(time_text) if time_text else math.nan)
+            # Drop parsed points so a multi-hour trace never sits in memory as a tree
+            elem.clear()
+            if len(lats) >= chunk_size:
+                yield lats, lons, times
+                lats, lons, times = [], [], []
+    except (ET.ParseError, TypeError, ValueError) as e:
+        raise TraceFormatError(f"Not a readable GPX file: {e}") from e
+    if lats:
+        yield lats, lons, times
+
+def _pick_column(columns, names):
+    lowered = {column.strip().lower(): column for column in columns}
+    return next((lowered[name] for name in names if name in lowered), None)
+
+def _csv_times(column) -> np.ndarray:
+    """Epoch seconds of a CSV time column, NaN where unreadable; read like GPX times."""
+    def seconds(value):
+        try:
+            return _epoch_seconds(value)
+        except (AttributeError, TypeError, ValueError):
+            return math.nan
+
+    try:
+        stamps = pd.to_datetime(column, errors='coerce')
+    except ValueError:
+        # Offsets differ between rows
+        return column.map(seconds).to_numpy(dtype=np.float64)
+    if stamps.dt.tz is None:
+        stamps = stamps.dt.tz_localize(tzlocal(), ambiguous=True, nonexistent='shift_forward')
+    times = (stamps - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy(dtype=np.float64, copy=True)
+    # Rows in another format than the first one, e.g. with an offset where it had none
+    missed = np.isnan(times) & column.notna().to_numpy()
+    if missed.any():
+        times[missed] = column[missed].map(seconds).to_numpy(dtype=np.float64)
+    return times
+
+def _csv_points(source, chunk_size: int):
+    try:
+        for frame in pd.read_csv(source, chunksize=chunk_size):
+            lat = _pick_column(frame.columns, CSV_LAT_COLUMNS)
+            lon = _pick_column(frame.columns, CSV_LON_COLUMNS)
+            if lat is None or lon is None:
+                raise TraceFormatError("CSV traces need latitude and longitude columns")
+            time = _pick_column(frame.columns, CSV_TIME_COLUMNS)
+            times = np.full(len(frame), np.nan) if time is None else _csv_times(frame[time])
+            yield frame[lat].to_numpy(dtype=np.float64), frame[lon].to_numpy(dtype=np.float64), times
+    except (pd.errors.ParserError, UnicodeDecodeError, ValueError) as e:
+        if isinstance(e, TraceFormatError):
+            raise
+        raise TraceFormatError(f"Not a readable CSV file: {e}") from e
+
+def iter_trace_chunks(source, trace_format: str, chunk_size: int = TRACE_CHUNK_SIZE):
+    """Stream a 'gpx' or 'csv' trace as (lats, lons, epoch_seconds) arrays.
+
+    Points without a timestamp get NaN.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    readers = {'gpx': _gpx_points, 'csv': _csv_points}
+    if trace_format not in readers:
+        raise TraceFormatError(f"Unsupported trace format: {trace_format}")
+    for lats, lons, times in readers[trace_format](source, chunk_size):
+        yield (np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64),
+               np.asarray(times, dtype=np.float64))
+
+class BusRideMatcher:
+    """Streaming matcher of trace points against bus route geometries.
+
+    Feed chunks in order with feed(); finish() closes any ride still in
+    progress and returns the detected rides, earliest first, as dicts with
+    route_name, distance (miles), distance_km, route_km (the whole route's
+    length), points_per_ride, started_at and ended_at (epoch seconds).
+    Points without a timestamp are skipped; finish() raises
+    TraceFormatError if no point had one.
+    """
+
+    def __init__(self, routes=None, tolerance_km: float = MATCH_TOLERANCE_KM, cell_km: float = CELL_KM):
+        self.routes = [route for route in (routes if routes is not None else get_bus_routes())
+                       if len(route['path']) >= 2]
+        self.tolerance_km = tolerance_km
+        self.cell_km = max(cell_km, tolerance_km)
+        self._build_segments()
+        self._build_grid()
+        # Per route: [start_time, sampled km, last_time, last_along, points, last sampled along] of the run in progress
+        self._open = {}
+        self._rides = []
+        self._points_seen = 0
+        self._timed_points = 0
+
+    def _build_segments(self):
+        paths = [np.asarray(route['path'], dtype=np.float64) for route in self.routes]
+        everything = np.concatenate(paths) if paths else np.zeros((1, 2))
+        self.lat0 = float(everything[:, 0].mean())
+        self.lon0 = float(everything[:, 1].mean())
+        self.km_per_degree_lon = KM_PER_DEGREE_LAT * math.cos(math.radians(self.lat0))
+
+        starts, ends, route_ids, along = [], [], [], []
+        self.route_km = []
+        for route_id, path in enumerate(paths):
+            xy = self._project(path[:, 0], path[:, 1])
+            lengths = np.hypot(*(xy[1:] - xy[:-1]).T)
+            starts.append(xy[:-1])
+            ends.append(xy[1:])
+            route_ids.append(np.full(len(lengths), route_id))
+            along.append(np.concatenate(([0.0], np.cumsum(lengths)[:-1])))
+            self.route_km.append(float(lengths.sum()))
+
+        self.seg_start = np.concatenate(starts) if starts else np.zeros((0, 2))
+        self.seg_vector = (np.concatenate(ends) if ends else np.zeros((0, 2))) - self.seg_start
+        self.seg_length2 = np.maximum((self.seg_vector ** 2).sum(axis=1), 1e-18)
+        # Contiguous 1-D copies: gathering from them is much faster than from (n, 2) rows
+        self.seg_x, self.seg_y = np.ascontiguousarray(self.seg_start.T)
+        self.seg_dx, self.seg_dy = np.ascontiguousarray(self.seg_vector.T)
+        self.seg_route = np.concatenate(route_ids) if route_ids else np.zeros(0, dtype=np.int64)
+        self.seg_along = np.concatenate(along) if along else np.zeros(0)
+
+    def _project(self, lats, lons) -> np.ndarray:
+        """Local equirectangular (x, y) km; accurate to well under 1% across an island."""
+        return np.column_stack(((lons - self.lon0) * self.km_per_degree_lon, (lats - self.lat0) * KM_PER_DEGREE_LAT))
+
+    def _build_grid(self):
+        """CSR lists of the segments within tolerance of each grid cell."""
+        ends = self.seg_start + self.seg_vector
+        low = np.minimum(self.seg_start, ends) - self.tolerance_km
+        high = np.maximum(self.seg_start, ends) + self.tolerance_km
+        self.origin = low.min(axis=0) if len(low) else np.zeros(2)
+        cells_low = np.floor((low - self.origin) / self.cell_km).astype(np.int64)
+        cells_high = np.floor((high - self.origin) / self.cell_km).astype(np.int64)
+        self.n_cols = int(cells_high[:, 0].max()) + 1 if len(low) else 1
+        self.n_rows = int(cells_high[:, 1].max()) + 1 if len(low) else 1
+
+        # Every segment is listed in each cell its padded bounding box covers
+        widths = cells_high[:, 0] - cells_low[:, 0] + 1
+        counts = widths * (cells_high[:, 1] - cells_low[:, 1] + 1)
+        segment = np.repeat(np.arange(len(counts)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cols = cells_low[segment, 0] + offset % widths[segment]
+        rows = cells_low[segment, 1] + offset // widths[segment]
+        keys = rows * self.n_cols + cols
+        order = np.argsort(keys, kind='stable')
+        self.cell_segments = segment[order]
+        self.cell_offsets = np.searchsorted(keys[order], np.arange(self.n_rows * self.n_cols + 1))
+
+    def match_points(self, lats, lons):
+        """(point index, route index, km along route) of each point within tolerance of a route.
+
+        A point near several routes is reported once per route, at its
+        closest segment of that route.
+        """
+        xy = self._project(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        cells = np.floor((xy - self.origin) / self.cell_km).astype(np.int64)
+        inside = ((cells >= 0) & (cells < (self.n_cols, self.n_rows))).all(axis=1)
+        points = np.flatnonzero(inside)
+        keys = cells[points, 1] * self.n_cols + cells[points, 0]
+        first = self.cell_offsets[keys]
+        counts = self.cell_offsets[keys + 1] - first
+
+        # One (point, segment) pair per segment listed in the point's cell
+        pair_point = np.repeat(points, counts)
+        pair_segment = self.cell_segments[
+            np.arange(counts.sum()) + np.repeat(first - (np.cumsum(counts) - counts), counts)
+        ]
+        rx = xy[:, 0][pair_point] - self.seg_x[pair_segment]
+        ry = xy[:, 1][pair_point] - self.seg_y[pair_segment]
+        dx = self.seg_dx[pair_segment]
+        dy = self.seg_dy[pair_segment]
+        t = np.clip((rx * dx + ry * dy) / self.seg_length2[pair_segment], 0.0, 1.0)
+        distance2 = (rx - t * dx) ** 2 + (ry - t * dy) ** 2
+
+        close = distance2 <= self.tolerance_km ** 2
+        pair_point, pair_segment, t, distance2 = pair_point[close], pair_segment[close], t[close], distance2[close]
+        pair_route = self.seg_route[pair_segment]
+
+        # Keep each (point, route)'s nearest segment. Pairs already run in
+        # point order, so a stable sort on the combined key is close to linear.
+        pair_key = pair_point * len(self.routes) + pair_route
+        order = np.argsort(pair_key, kind='stable')
+        pair_key, distance2 = pair_key[order], distance2[order]
+        group_start = np.ones(len(order), dtype=bool)
+        group_start[1:] = pair_key[1:] != pair_key[:-1]
+        group = np.cumsum(group_start) - 1
+        nearest = np.minimum.reduceat(distance2, np.flatnonzero(group_start)) if len(order) else distance2
+        is_nearest = np.flatnonzero(distance2 == nearest[group])
+        # Ties keep the first of their group
+        first_nearest = np.ones(len(is_nearest), dtype=bool)
+        first_nearest[1:] = group[is_nearest[1:]] != group[is_nearest[:-1]]
+        chosen = order[is_nearest[first_nearest]]
+
+        segment = pair_segment[chosen]
+        along = self.seg_along[segment] + t[chosen] * np.sqrt(self.seg_length2[segment])
+        return pair_point[chosen], pair_route[chosen], along
+
+    def feed(self, lats, lons, times):
+        """Match one chunk of consecutive trace points; times are epoch seconds, NaN where unknown."""
+        times = np.asarray(times, dtype=np.float64)
+        self._points_seen += len(times)
+        timed = ~np.isnan(times)
+        if not timed.all():
+            lats, lons, times = np.asarray(lats)[timed], np.asarray(lons)[timed], times[timed]
+        self._timed_points += len(times)
+        if len(times) == 0:
+            return
+
+        points, route_ids, along = self.match_points(lats, lons)
+        order = np.lexsort((points, route_ids))
+        points, route_ids, along = points[order], route_ids[order], along[order]
+        boundaries = np.flatnonzero(np.diff(route_ids)) + 1
+        for start, end in zip(np.r_[0, boundaries].tolist(), np.r_[boundaries, len(route_ids)].tolist()):
+            if end > start:
+                self._extend_runs(int(route_ids[start]), times[points[start:end]], along[start:end])
+
+    def _extend_runs(self, route_id: int, times, along):
+        """Continue or start runs on a route with this chunk's matched points, in trace order."""
+        breaks = np.flatnonzero(np.diff(times) > MAX_GAP_SECONDS) + 1
+        run = self._open.pop(route_id, None)
+        for start, end in zip(np.r_[0, breaks].tolist(), np.r_[breaks, len(times)].tolist()):
+            if run is None or times[start] - run[2] > MAX_GAP_SECONDS:
+                if run is not None:
+                    self._close_run(route_id, run)
+                run = [times[start], 0.0, times[start], along[start], 0, along[start]]
+            # Progress is summed between the first points of each SAMPLE_SECONDS
+            # of the run, in either direction, so a ride out and back counts
+            # both ways while per-point GPS jitter mostly cancels out
+            sample = (times[start:end] - run[0]) // SAMPLE_SECONDS
+            marks = along[start:end][np.diff(np.r_[(run[2] - run[0]) // SAMPLE_SECONDS, sample]) > 0]
+            if len(marks):
+                run[1] += float(np.abs(np.diff(np.r_[run[5], marks])).sum())
+                run[5] = marks[-1]
+            run[2], run[3], run[4] = times[end - 1], along[end - 1], run[4] + end - start
+        self._open[route_id] = run
+
+    def _close_run(self, route_id: int, run):
+        start_time, sampled_km, end_time, end_along, _, mark_along = run
+        distance_km = sampled_km + abs(end_along - mark_along)
+        hours = (end_time - start_time) / 3600
+        if distance_km < MIN_RIDE_KM or hours <= 0:
+            return
+        if not MIN_BUS_SPEED_KMH <= distance_km / hours <= MAX_BUS_SPEED_KMH:
+            return
+        route = self.routes[route_id]
+        self._rides.append({
+            'route_name': route['name'],
+            'distance': round(float(distance_km) / KM_PER_MILE, 2),
+            'distance_km': float(distance_km),
+            'route_km': self.route_km[route_id],
+            'points_per_ride': route['points_per_ride'],
+            'started_at': float(start_time),
+            'ended_at': float(end_time)
+        })
+
+    def finish(self) -> list:
+        """Close open runs and return the detected rides, earliest first."""
+        if self._points_seen and not self._timed_points:
+            raise TraceFormatError("Trace points need timestamps to detect rides")
+        for route_id in list(self._open):
+            self._close_run(route_id, self._open.pop(route_id))
+
+        # Where routes share a corridor one ride matches each of them; the
+        # route followed for longest is the one ridden
+        kept = []
+        for ride in sorted(self._rides, key=lambda ride: -ride['distance_km']):
+            if all(ride['ended_at'] <= other['started_at'] or ride['started_at'] >= other['ended_at'] for other in kept):
+                kept.append(ride)
+        self._rides = []
+        return sorted(kept, key=lambda ride: ride['started_at'])
+
+def ride_points(ride: dict) -> int:
+    """Points for a detected ride: the route's points per ride, pro rata to the share of the route ridden."""
+    share = min(ride['distance_km'] / ride['route_km'], 1.0) if ride['route_km'] else 1.0
+    return max(1, round(ride['points_per_ride'] * share))
+
+def match_trace(source, trace_format: str, routes=None) -> list:
+    """Detect bus rides in a GPX or CSV trace (file object or bytes).
+
+    Each ride also carries trace_hash, the sha256 of the whole trace, so a
+    re-upload of the same file can be recognised.
+    """
+    reader = _HashingReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    matcher = BusRideMatcher(routes)
+    for lats, lons, times in iter_trace_chunks(reader, trace_format):
+        matcher.feed(lats, lons, times)
+    rides = matcher.finish()
+    # The readers stop at the last point; hash any trailing bytes too
+    while reader.read(1 << 16):
+        pass
+    trace_hash = reader.sha256.hexdigest()
+    return [dict(ride, trace_hash=trace_hash) for ride in rides]